@@ -20,6 +20,8 @@ from twitter.common import app, options
 from twitter.common.exceptions import ExceptionalThread
 from twitter.common.http.diagnostics import DiagnosticsEndpoints
 from twitter.common.http.server import HttpServer
+from twitter.common.http.threaded import ThreadPoolServer
+from twitter.common.metrics import RootMetrics
 
 
 class LifecycleEndpoints(object):
@@ -74,7 +76,16 @@ class RootServer(HttpServer, app.Module):
           type='string',
           metavar='FRAMEWORK',
           dest='twitter_common_http_root_server_framework',
-          help='The framework that will be running the integrated http server.')
+          help='The framework that will be running the integrated http server, e.g. '
+               '"threadpool" for the built-in concurrent server.'),
+
+    'workers':
+      options.Option('--http_threadpool_workers',
+          default=ThreadPoolServer.DEFAULT_WORKERS,
+          type='int',
+          metavar='THREADS',
+          dest='twitter_common_http_root_server_threadpool_workers',
+          help='The number of requests served concurrently by the threadpool framework.')
   }
 
   def __init__(self):
@@ -82,6 +93,12 @@ class RootServer(HttpServer, app.Module):
     HttpServer.__init__(self)
     app.Module.__init__(self, __name__, description="Http subsystem.")
 
+  def mount_routes(self, class_instance):
+    HttpServer.mount_routes(self, class_instance)
+    # Export the response caches of cached routes (e.g. /vars) as http_cache.<method name>.
+    for name, cache in self.caches.items():
+      RootMetrics().scope('http_cache').register_observable(name, cache)
+
   def setup_function(self):
     assert self._thread is None, "Attempting to call start() after server has been started!"
     options = app.get_options()
@@ -100,7 +117,12 @@ class RootServer(HttpServer, app.Module):
         rs = parent
         rs.run(options.twitter_common_http_root_server_host,
                options.twitter_common_http_root_server_port,
-               server=options.twitter_common_http_root_server_framework)
+               server=server)
+
+    server = options.twitter_common_http_root_server_framework
+    if server == 'threadpool':
+      server = ThreadPoolServer(workers=options.twitter_common_http_root_server_threadpool_workers)
+      RootMetrics().register_observable('http_server', server)
 
     if options.twitter_common_http_root_server_enabled:
       self._thread = RootServerThread()
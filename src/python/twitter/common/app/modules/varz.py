@@ -18,22 +18,28 @@
 # word in Python.  All characters appearing in this work are fictitious.
 # Any resemblance to real persons, living or dead, is purely coincidental.
 
+import bisect
 from functools import wraps
+import json
 import os
 import re
 import sys
+import threading
 import time
 
 from twitter.common import app, options
 from twitter.common.http import HttpServer, Plugin
 from twitter.common.http.server import request
+from twitter.common.lang import Compatibility
 from twitter.common.metrics import (
   AtomicGauge,
+  Histogram,
   Label,
   LambdaGauge,
   MetricSampler,
   MutatorGauge,
   Observable,
+  PrometheusFormat,
   RootMetrics,
 )
 from twitter.common.quantity import Amount, Time
@@ -86,7 +92,16 @@ class VarsSubsystem(app.Module):
           action='append',
           dest='twitter_common_app_modules_varz_stats_filter',
           help='Full-match regexes to filter metrics on-demand when requested '
-               'with `filtered=1`.')
+               'with `filtered=1`.'),
+
+    'prometheus_rules':
+      options.Option('--vars-prometheus-rule',
+          default=[],
+          action='append',
+          dest='twitter_common_app_modules_varz_prometheus_rules',
+          help='Full-match regexes whose named groups turn parts of dotted metric names into '
+               'labels on the /metrics Prometheus endpoint, e.g. '
+               r'"http\.(?P<status>\dxx)\..*".')
   }
 
   def __init__(self):
@@ -102,6 +117,9 @@ class VarsSubsystem(app.Module):
         stats_filter = self.compile_stats_filters(options.twitter_common_app_modules_varz_stats_filter)
       )
       rs.mount_routes(varz)
+      RootMetrics().scope('vars').register_observable('sampler', varz.sampler)
+      rs.mount_routes(PrometheusEndpoint(varz.sampler,
+          rules=options.twitter_common_app_modules_varz_prometheus_rules))
       register_diagnostics()
       register_build_properties()
       if options.twitter_common_app_modules_varz_trace_endpoints:
@@ -123,9 +141,12 @@ class VarsSubsystem(app.Module):
 class VarsEndpoint(object):
   """
     Wrap a MetricSampler to export the /vars endpoint for applications that register
-    exported variables.
+    exported variables.  Rendered responses are cached for CACHE_TTL_SECS, a fraction of the
+    default sampling period, so concurrent pollers share one rendering of each sample.
   """
 
+  CACHE_TTL_SECS = 0.5
+
   def __init__(self, period=None, stats_filter=None):
     self._metrics = RootMetrics()
     self._stats_filter = stats_filter
@@ -135,32 +156,91 @@ class VarsEndpoint(object):
       self._monitor = MetricSampler(self._metrics)
     self._monitor.start()
 
+  @property
+  def sampler(self):
+    return self._monitor
+
   @HttpServer.route("/vars")
   @HttpServer.route("/vars/:var")
+  @HttpServer.cached(ttl=CACHE_TTL_SECS)
   def handle_vars(self, var=None):
+    """
+      Stream the most recent sample as sorted "name value" lines, gzip-encoded if the client
+      accepts it.  With ?prefix=<prefix>, only the metrics whose names start with prefix.
+    """
     HttpServer.set_content_type('text/plain; charset=iso-8859-1')
-    filtered = self._parse_filtered_arg()
+    if var is None:
+      names, sample = self._names(self._parse_prefix_arg(), self._parse_filtered_arg())
+      return HttpServer.stream(self._render_text(names, sample))
     samples = self._monitor.sample()
-
-    if var is None and filtered and self._stats_filter:
-      return '\n'.join(
-        '%s %s' % (key, val) for key, val in sorted(samples.items())
-                  if not self._stats_filter.match(key))
-    elif var is None:
-      return '\n'.join(
-        '%s %s' % (key, val) for key, val in sorted(samples.items()))
+    if var in samples:
+      return samples[var]
     else:
-      if var in samples:
-        return samples[var]
-      else:
-        HttpServer.abort(404, 'Unknown exported variable')
+      HttpServer.abort(404, 'Unknown exported variable')
 
   @HttpServer.route("/vars.json")
+  @HttpServer.cached(ttl=CACHE_TTL_SECS)
   def handle_vars_json(self, var=None, value=None):
+    """
+      Stream the most recent sample as a JSON object, gzip-encoded if the client accepts it.
+      With ?prefix=<prefix>, only the metrics whose names start with prefix.
+
+      With ?since=<token>, return instead an object of the form
+        {"token": <token>, "delta": <bool>, "vars": {...}, "removed": [...]}
+      where vars holds only the metrics that changed since the snapshot identified by the
+      token (and removed those that disappeared.)  If that snapshot is no longer available,
+      delta is false and vars holds every metric.  Pass the returned token on the next request.
+      An empty since returns every metric along with a token.
+    """
     filtered = self._parse_filtered_arg()
-    sample = self._monitor.sample()
+    prefix = self._parse_prefix_arg()
+    since = request.GET.get('since')
+    if since is None:
+      HttpServer.set_content_type('application/json')
+      return HttpServer.stream(self._render_json(*self._names(prefix, filtered)))
+    delta = self._monitor.delta(since) if since else None
+    if delta is None:
+      token, sample = self._monitor.snapshot()
+      changed, removed = sample, []
+    else:
+      token, changed, removed = delta
+    return {
+      'token': token,
+      'delta': delta is not None,
+      'vars': self._filter(changed, filtered, prefix),
+      'removed': sorted(self._filter(dict.fromkeys(removed), filtered, prefix)),
+    }
+
+  @classmethod
+  def _render_text(cls, names, sample):
+    for index, name in enumerate(names):
+      yield '%s%s %s' % ('\n' if index else '', name, sample[name])
+
+  @classmethod
+  def _render_json(cls, names, sample):
+    yield '{'
+    for index, name in enumerate(names):
+      yield '%s%s: %s' % (', ' if index else '', json.dumps(name), json.dumps(sample[name]))
+    yield '}'
+
+  def _names(self, prefix, filtered):
+    """
+      Return the sorted names in the most recent sample that start with prefix and pass the
+      stats filter if filtered, along with the sample.  The prefix is looked up by bisecting
+      the sorted names, so only the matching names are visited.
+    """
+    names, sample = self._monitor.sorted_sample()
+    if prefix:
+      upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+      names = names[bisect.bisect_left(names, prefix):bisect.bisect_left(names, upper)]
     if filtered and self._stats_filter:
-      return dict((key, val) for key, val in sample.items() if not self._stats_filter.match(key))
+      names = [name for name in names if not self._stats_filter.match(name)]
+    return names, sample
+
+  def _filter(self, sample, filtered, prefix):
+    if (filtered and self._stats_filter) or prefix:
+      return dict((key, val) for key, val in sample.items() if key.startswith(prefix) and
+                  not (filtered and self._stats_filter and self._stats_filter.match(key)))
     else:
       return sample
 
@@ -171,6 +251,27 @@ class VarsEndpoint(object):
   def _parse_filtered_arg(self):
     return request.GET.get('filtered', '') in ('true', '1')
 
+  def _parse_prefix_arg(self):
+    return request.GET.get('prefix', '')
+
+
+class PrometheusEndpoint(object):
+  """
+    Export the samples of a MetricSampler in the Prometheus text exposition format on /metrics,
+    along with the buckets of any Histograms registered with its Metrics.
+  """
+
+  def __init__(self, sampler, metrics=None, rules=()):
+    self._sampler = sampler
+    self._metrics = metrics if metrics is not None else RootMetrics()
+    self._format = PrometheusFormat(rules=rules)
+
+  @HttpServer.route("/metrics")
+  def handle_metrics(self):
+    HttpServer.set_content_type(PrometheusFormat.CONTENT_TYPE)
+    return HttpServer.stream(self._format.render(
+        self._sampler.sample(), PrometheusFormat.histograms(self._metrics)))
+
 
 class StatusStats(Observable):
   def __init__(self):
@@ -184,22 +285,134 @@ class StatusStats(Observable):
     self._ns.add(ns)
 
 
+class RouteStats(Observable):
+  """
+    Latency distributions of one route and method: latency_ms to the end of the response and
+    ttfb_ms to its first byte, which differ for streaming responses.
+  """
+  def __init__(self):
+    self.latency = self.metrics.register(Histogram('latency_ms'))
+    self.ttfb = self.metrics.register(Histogram('ttfb_ms'))
+
+
+class _TimedBody(object):
+  """
+    Wraps a streaming response body to time its first chunk and its completion.
+  """
+  def __init__(self, body, on_first, on_done):
+    self._body = body
+    self._iterator = iter(body)
+    self._on_first = on_first
+    self._on_done = on_done
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    try:
+      chunk = next(self._iterator)
+    except StopIteration:
+      self._done()
+      raise
+    if self._on_first is not None:
+      self._on_first()
+      self._on_first = None
+    return chunk
+  next = __next__
+
+  def _done(self):
+    if self._on_done is not None:
+      self._on_done()
+      self._on_done = None
+
+  def close(self):
+    try:
+      if hasattr(self._body, 'close'):
+        self._body.close()
+    finally:
+      self._done()
+
+
 class EndpointTracePlugin(Observable, Plugin):
+  """
+    Trace every route: request counts and total time by status class (1xx-5xx), and latency
+    and time-to-first-byte histograms per route template and method, e.g.
+
+      routes.vars_var.GET.latency_ms.p99
+
+    Routes beyond max_routes share the 'other' route, so the number of metrics is bounded.
+  """
+
+  DEFAULT_MAX_ROUTES = 256
+  # Response bodies that are complete when the callback returns; others are streamed.
+  COMPLETE_BODIES = (bytes, dict, list, tuple, HttpServer.HTTPResponse) + Compatibility.string
+  ROUTE_NAME_RE = re.compile(r'[^A-Za-z0-9_]+')
+
+  def __init__(self, max_routes=DEFAULT_MAX_ROUTES, clock=Compatibility.monotonic):
+    self._max_routes = max_routes
+    self._clock = clock
+    self._routes = {}
+    self._routes_lock = threading.Lock()
+
   def setup(self, app):
     self._stats = dict((k, StatusStats()) for k in (1, 2, 3, 4, 5))
     for code_prefix, observable in self._stats.items():
       self.metrics.register_observable('%dxx' % code_prefix, observable)
 
+  @classmethod
+  def route_name(cls, rule):
+    return cls.ROUTE_NAME_RE.sub('_', rule).strip('_') or 'root'
+
+  def _route_stats(self, route):
+    name, method = self.route_name(route.rule), route.method
+    with self._routes_lock:
+      if (name, method) not in self._routes and len(self._routes) >= self._max_routes:
+        name, method = 'other', 'ALL'
+      if (name, method) not in self._routes:
+        stats = self._routes[(name, method)] = RouteStats()
+        self.metrics.scope('routes').scope(name).register_observable(method, stats)
+      return self._routes[(name, method)]
+
+  def _record(self, route_stats, status_code, start, first_byte, end):
+    route_stats.ttfb.record(1000.0 * (first_byte - start))
+    route_stats.latency.record(1000.0 * (end - start))
+    observable = self._stats.get(status_code // 100)
+    if observable:
+      observable.increment(int((end - start) * 1e9))
+
   def apply(self, callback, route):
+    route_stats = self._route_stats(route)
+    clock = self._clock
+
     @wraps(callback)
     def wrapped_callback(*args, **kw):
-      start = time.time()
-      body = callback(*args, **kw)
-      ns = int((time.time() - start) * 1e9)
-      observable = self._stats.get(HttpServer.response.status_code / 100)
-      if observable:
-        observable.increment(ns)
-      return body
+      start = clock()
+      try:
+        body = callback(*args, **kw)
+      except HttpServer.HTTPResponse as e:
+        now = clock()
+        self._record(route_stats, e.status_code, start, now, now)
+        raise
+      except Exception:
+        now = clock()
+        self._record(route_stats, 500, start, now, now)
+        raise
+      if isinstance(body, HttpServer.HTTPResponse):
+        status_code = body.status_code
+      else:
+        status_code = HttpServer.response.status_code
+      if isinstance(body, self.COMPLETE_BODIES) or not hasattr(body, '__iter__'):
+        now = clock()
+        self._record(route_stats, status_code, start, now, now)
+        return body
+
+      first_byte = []
+      def on_first():
+        first_byte.append(clock())
+      def on_done():
+        now = clock()
+        self._record(route_stats, status_code, start, first_byte[0] if first_byte else now, now)
+      return _TimedBody(body, on_first, on_done)
     return wrapped_callback
 
 
@@ -0,0 +1,199 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+import bottle
+
+from twitter.common.lang import Compatibility
+from twitter.common.metrics import AtomicGauge, LambdaGauge, Observable
+
+from .plugin import Plugin
+from .server import HttpServer
+
+
+class ResponseCache(Observable, Plugin):
+  """
+    Memoize the rendered responses of a route for ttl seconds, keyed on the request path and
+    query string, the request headers named in vary, and whether the client accepts gzip.
+    Apply it with the HttpServer.cached annotation:
+
+      class ReportEndpoint(object):
+        @HttpServer.route('/report')
+        @HttpServer.cached(ttl=5, vary=('Accept-Language',))
+        def report(self):
+          ...
+
+    At most max_entries responses of max_bytes in total are kept, least recently used first
+    out.  Responses carry an ETag and requests with a matching If-None-Match get an empty 304.
+    Only 200 responses with a string, iterable or dict (rendered as JSON) body are cached.
+
+    Iterable bodies, e.g. from HttpServer.stream, are passed through chunk by chunk on a miss
+    and cached once sent in full, so they still stream; that first response has no ETag.
+  """
+
+  DEFAULT_MAX_ENTRIES = 64
+  DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+  UNCACHED_HEADERS = frozenset(['Content-Length', 'Date', 'Etag', 'Set-Cookie'])
+
+  Entry = namedtuple('Entry', 'expires etag headers body')
+
+  def __init__(self, ttl, vary=(), max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+               clock=Compatibility.monotonic):
+    self._ttl = ttl
+    self._vary = tuple(vary)
+    self._max_entries = max_entries
+    self._max_bytes = max_bytes
+    self._clock = clock
+    self._entries = OrderedDict()
+    self._bytes = 0
+    self._lock = threading.Lock()
+    self._hits = self.metrics.register(AtomicGauge('hits'))
+    self._misses = self.metrics.register(AtomicGauge('misses'))
+    self._not_modified = self.metrics.register(AtomicGauge('not_modified'))
+    self._evictions = self.metrics.register(AtomicGauge('evictions'))
+    self.metrics.register(LambdaGauge('entries', lambda: len(self._entries)))
+    self.metrics.register(LambdaGauge('bytes', lambda: self._bytes))
+
+  def key(self):
+    """The cache key of the current request."""
+    request = HttpServer.request
+    return (request.path, request.query_string, HttpServer.accepts_gzip()) + tuple(
+        request.headers.get(header, '') for header in self._vary)
+
+  @classmethod
+  def etag(cls, body):
+    return '"%s"' % hashlib.sha1(body).hexdigest()
+
+  @classmethod
+  def not_modified(cls, etag):
+    """Whether the If-None-Match header of the current request matches etag."""
+    if_none_match = HttpServer.request.headers.get('If-None-Match')
+    if not if_none_match:
+      return False
+    for tag in if_none_match.split(','):
+      tag = tag.strip()
+      if tag == '*' or (tag[2:] if tag.startswith('W/') else tag) == etag:
+        return True
+    return False
+
+  @classmethod
+  def render(cls, body):
+    """Render a dict or string callback return value to bytes, or return None otherwise."""
+    response = HttpServer.response
+    if isinstance(body, dict):
+      response.content_type = 'application/json'
+      body = bottle.json_dumps(body)
+    if isinstance(body, Compatibility.bytes):
+      return body
+    if isinstance(body, Compatibility.string):
+      return body.encode(response.charset)
+    return None
+
+  @classmethod
+  def streamable(cls, body):
+    return hasattr(body, '__iter__') and not isinstance(body, bottle.HTTPResponse)
+
+  def _entry(self, headers, body):
+    return self.Entry(self._clock() + self._ttl, self.etag(body), headers, body)
+
+  def _stream(self, key, headers, chunks):
+    # Pass the chunks through as they are produced, keeping a copy to cache only if the body
+    # is sent in full and fits in the cache.
+    charset = HttpServer.response.charset
+    body, size = [], 0
+    try:
+      for chunk in chunks:
+        if not isinstance(chunk, Compatibility.bytes):
+          chunk = chunk.encode(charset)
+        if body is not None:
+          size += len(chunk)
+          if size <= self._max_bytes:
+            body.append(chunk)
+          else:
+            body = None
+        yield chunk
+    finally:
+      if hasattr(chunks, 'close'):
+        chunks.close()
+    if body is not None:
+      self._put(key, self._entry(headers, b''.join(body)))
+
+  def _get(self, key):
+    now = self._clock()
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is None:
+        return None
+      if entry.expires <= now:
+        self._bytes -= len(entry.body)
+        return None
+      self._entries[key] = entry
+      return entry
+
+  def _put(self, key, entry):
+    if len(entry.body) > self._max_bytes:
+      return
+    with self._lock:
+      previous = self._entries.pop(key, None)
+      if previous is not None:
+        self._bytes -= len(previous.body)
+      self._entries[key] = entry
+      self._bytes += len(entry.body)
+      while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+        _, evicted = self._entries.popitem(last=False)
+        self._bytes -= len(evicted.body)
+        self._evictions.increment()
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+  def apply(self, callback, route):
+    response = HttpServer.response
+
+    def wrapped_callback(*args, **kw):
+      key = self.key()
+      entry = self._get(key)
+      if entry is None:
+        self._misses.increment()
+        output = callback(*args, **kw)
+        if response.status_code != 200:
+          return output
+        body = self.render(output)
+        headers = [(name, value) for name, value in response.headerlist
+                   if name not in self.UNCACHED_HEADERS]
+        if body is None:
+          return self._stream(key, headers, output) if self.streamable(output) else output
+        entry = self._entry(headers, body)
+        self._put(key, entry)
+      else:
+        self._hits.increment()
+        for name in set(name for name, _ in entry.headers if name in response):
+          del response[name]
+        for name, value in entry.headers:
+          response.add_header(name, value)
+      response.set_header('ETag', entry.etag)
+      if self.not_modified(entry.etag):
+        self._not_modified.increment()
+        response.status = 304
+        return b''
+      return entry.body
+
+    return wrapped_callback
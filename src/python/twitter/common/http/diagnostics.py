@@ -30,6 +30,7 @@ try:
 except ImportError:
   HAS_APP = False
 
+from .profiler import SamplingProfiler
 from .server import HttpServer, route
 
 
@@ -38,6 +39,9 @@ class DiagnosticsEndpoints(object):
     Export the thread stacks of the running process.
   """
   UNHEALTHY = threading.Event()
+  MAX_SAMPLE_SECS = 300
+  MAX_SAMPLE_HZ = 1000
+  SAMPLING = threading.Lock()
 
   @classmethod
   def generate_stacks(cls):
@@ -70,6 +74,30 @@ class DiagnosticsEndpoints(object):
     else:
       return 'Profiling is disabled'
 
+  @route("/profile/sample")
+  def handle_profile_sample(self):
+    """
+      Sample the stacks of all threads hz times a second (default 100) for the given number of
+      seconds (default 10), and return them in the collapsed format of flamegraph.pl.  Unlike
+      /profile, this needs no profiler enabled at startup and costs nothing until requested.
+    """
+    try:
+      seconds = float(HttpServer.request.GET.get('seconds', 10))
+      hz = float(HttpServer.request.GET.get('hz', SamplingProfiler.DEFAULT_HZ))
+    except ValueError:
+      HttpServer.abort(400, 'seconds and hz must be numbers')
+    if not 0 < seconds <= self.MAX_SAMPLE_SECS or not 0 < hz <= self.MAX_SAMPLE_HZ:
+      HttpServer.abort(400, 'seconds must be within (0, %d] and hz within (0, %d]' % (
+          self.MAX_SAMPLE_SECS, self.MAX_SAMPLE_HZ))
+    if not self.SAMPLING.acquire(False):
+      HttpServer.abort(409, 'Another profile is being sampled')
+    try:
+      profiler = SamplingProfiler(hz=hz).profile(seconds)
+    finally:
+      self.SAMPLING.release()
+    HttpServer.set_content_type('text/plain; charset=iso-8859-1')
+    return HttpServer.stream(profiler.collapsed())
+
   @route("/health")
   def handle_health(self):
     return 'UNHEALTHY' if self.UNHEALTHY.is_set() else 'OK'
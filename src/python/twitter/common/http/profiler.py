@@ -0,0 +1,131 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+from collections import defaultdict
+import sys
+import threading
+import time
+
+from twitter.common.exceptions import ExceptionalThread
+
+
+class SamplingProfiler(object):
+  """
+    A statistical profiler that walks the stacks of every thread in sys._current_frames() hz
+    times a second on its own thread, for as long as it is running:
+
+      profiler = SamplingProfiler(hz=100)
+      profiler.start()
+      ...
+      profiler.stop()
+      for line in profiler.collapsed():
+        ...
+
+    Nothing is instrumented, so the profiled code runs at full speed and there is no cost at
+    all while the profiler is not running.  The stacks are reported in the collapsed format
+    read by flamegraph.pl and speedscope, one "thread;outermost;...;innermost count" line per
+    distinct stack.
+  """
+
+  DEFAULT_HZ = 100
+
+  def __init__(self, hz=DEFAULT_HZ, ignore=(), clock=time):
+    """
+      Sample hz times a second, skipping the threads whose idents are in ignore (along with the
+      sampling thread itself.)
+    """
+    if hz <= 0:
+      raise ValueError('hz must be positive, got %s' % hz)
+    self._interval = 1.0 / hz
+    self._ignore = set(ignore)
+    self._clock = clock
+    self._counts = defaultdict(int)
+    self._labels = {}
+    self._samples = 0
+    self._lock = threading.Lock()
+    self._stopped = threading.Event()
+    self._thread = None
+
+  @property
+  def samples(self):
+    """The number of times the stacks have been sampled so far."""
+    return self._samples
+
+  def _label(self, code):
+    label = self._labels.get(code)
+    if label is None:
+      label = self._labels[code] = '%s (%s:%d)' % (
+          code.co_name, code.co_filename, code.co_firstlineno)
+    return label
+
+  def sample(self):
+    """Record the current stack of every thread not ignored."""
+    names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+    stacks = []
+    for thread_id, frame in sys._current_frames().items():
+      if thread_id in self._ignore:
+        continue
+      stack = []
+      while frame is not None:
+        stack.append(self._label(frame.f_code))
+        frame = frame.f_back
+      stack.append(names.get(thread_id, 'Thread-%d' % thread_id))
+      stacks.append(tuple(reversed(stack)))
+    with self._lock:
+      for stack in stacks:
+        self._counts[stack] += 1
+      self._samples += 1
+
+  def _run(self):
+    self._ignore.add(threading.current_thread().ident)
+    deadline = self._clock.time()
+    while not self._stopped.is_set():
+      self.sample()
+      deadline += self._interval
+      self._stopped.wait(max(0, deadline - self._clock.time()))
+
+  def start(self):
+    if self._thread is not None:
+      raise RuntimeError('SamplingProfiler can only be started once.')
+    self._thread = ExceptionalThread(target=self._run, name='SamplingProfiler')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    self._stopped.set()
+    if self._thread is not None:
+      self._thread.join()
+
+  def profile(self, seconds):
+    """Sample for the given number of seconds, blocking the calling thread (which is ignored.)"""
+    self._ignore.add(threading.current_thread().ident)
+    self.start()
+    try:
+      self._clock.sleep(seconds)
+    finally:
+      self.stop()
+    return self
+
+  def counts(self):
+    """Return a dict of each stack, a tuple of frames from the thread name inwards, to the
+       number of samples it appeared in."""
+    with self._lock:
+      return dict(self._counts)
+
+  def collapsed(self):
+    """Yield a "frame;frame;... count" line for each distinct stack, most frequent first."""
+    for stack, count in sorted(self.counts().items(), key=lambda item: (-item[1], item[0])):
+      yield '%s %d\n' % (';'.join(stack), count)
@@ -18,11 +18,13 @@ import copy
 import os
 import threading
 import types
+import zlib
 
 import bottle
 
 __all__ = (
     'abort',
+    'cached',
     'HttpServer',
     'mako_view',
     'redirect',
@@ -116,13 +118,27 @@ class HttpServer(object):
         @route('/list/:name')
         def list_by_name(self, name):
           ...
+
+    Response caching:
+      Routes that are expensive to render and polled often can memoize their responses for a
+      number of seconds, per path and query string, with the 'cached' annotation:
+
+      class DiagnosticsEndpoints(object):
+        @route('/vars')
+        @cached(ttl=1)
+        def vars(self):
+          return self.metrics.sample()
+
+      Cached responses carry an ETag, so pollers sending If-None-Match get an empty 304.
   """
 
   ROUTES_ATTRIBUTE = '__routes__'
   VIEW_ATTRIBUTE = '__view__'
   ERROR_ATTRIBUTE = '__errors__'
+  CACHE_ATTRIBUTE = '__cached__'
 
   abort = staticmethod(bottle.abort)
+  HTTPResponse = bottle.HTTPResponse
   request = Request = bottle.request
   response = Response = bottle.response
   redirect = staticmethod(bottle.redirect)
@@ -161,6 +177,17 @@ class HttpServer(object):
       return function
     return annotated
 
+  @classmethod
+  def cached(cls, ttl, vary=(), **kwargs):
+    """Memoize the rendered responses of this method for ttl seconds per path, query string and
+       the request headers named in vary, with ETag support.  For more information see
+       twitter.common.http.cache.ResponseCache."""
+    def annotated(function):
+      kwargs.update(ttl=ttl, vary=vary)
+      setattr(function, cls.CACHE_ATTRIBUTE, kwargs)
+      return function
+    return annotated
+
   @classmethod
   def mako_view(cls, *args, **kwargs):
     """Helper function for annotating mako-specific views."""
@@ -171,11 +198,34 @@ class HttpServer(object):
   def set_content_type(cls, header_value):
     cls.response.content_type = header_value
 
+  @classmethod
+  def accepts_gzip(cls):
+    """Whether the client of the current request accepts gzip-encoded responses."""
+    for encoding in cls.request.headers.get('Accept-Encoding', '').split(','):
+      coding, _, params = encoding.partition(';')
+      if coding.strip() in ('gzip', '*'):
+        return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+  STREAM_BUFFER_SIZE = 64 * 1024
+
+  @classmethod
+  def stream(cls, chunks, buffer_size=STREAM_BUFFER_SIZE, compress=True):
+    """Return a response body that streams the iterable of strings chunks in buffers of about
+       buffer_size bytes, gzip-encoded if compress is set and the client accepts it."""
+    body = _buffered(chunks, buffer_size)
+    cls.response.add_header('Vary', 'Accept-Encoding')
+    if compress and cls.accepts_gzip():
+      cls.response.set_header('Content-Encoding', 'gzip')
+      body = _gzipped(body)
+    return body
+
   def __init__(self):
     self._app = bottle.Bottle()
     self._hostname = None
     self._port = None
     self._mounts = set()
+    self._caches = {}
     self.mount_routes(self)
 
   # Delegate to the underlying Bottle application
@@ -230,9 +280,17 @@ class HttpServer(object):
           args, kw = getattr(callback, self.VIEW_ATTRIBUTE)
           callback = bottle.view(*args, **kw)(callback)
           setattr(self, callback_name, callback)
+        # Apply cache annotations, within any other plugins (e.g. authentication) of the route
+        cache = None
+        if hasattr(callback, self.CACHE_ATTRIBUTE):
+          from .cache import ResponseCache
+          cache = self._caches[callback_name] = ResponseCache(
+              **getattr(callback, self.CACHE_ATTRIBUTE))
         # Apply route annotations
         for args, kw in getattr(callback, self.ROUTES_ATTRIBUTE, ()):
           kw = self._apply_plugins(class_instance, copy.deepcopy(kw))
+          if cache is not None:
+            kw.update(apply=kw['apply'] + [cache])
           kw.update(callback=callback)
           self._app.route(*args, **kw)
         for error_code in getattr(callback, self.ERROR_ATTRIBUTE, ()):
@@ -245,6 +303,14 @@ class HttpServer(object):
     """
     return self._app
 
+  @property
+  def caches(self):
+    """
+      Return a dict of the name of each mounted cached method to its ResponseCache, which is
+      Observable, e.g. for exporting its hit and miss counts.
+    """
+    return dict(self._caches)
+
   @property
   def hostname(self):
     return self._hostname
@@ -256,9 +322,17 @@ class HttpServer(object):
   def run(self, hostname, port, server='wsgiref'):
     """
       Start a webserver on hostname & port.
+
+      server may be the name of a bottle server adapter, 'threadpool' for the built-in
+      ThreadPoolServer, or a bottle.ServerAdapter instance (whose host and port are replaced.)
     """
     self._hostname = hostname
     self._port = port
+    if server == 'threadpool':
+      from .threaded import ThreadPoolServer
+      server = ThreadPoolServer()
+    if isinstance(server, bottle.ServerAdapter):
+      server.host, server.port = hostname, int(port)
     self._app.run(host=hostname, port=port, server=server)
 
   def __str__(self):
@@ -267,7 +341,31 @@ class HttpServer(object):
         ', '.join(self.source_name(instance) for instance in self._mounts))
 
 
+def _buffered(chunks, buffer_size):
+  buffered, size = [], 0
+  for chunk in chunks:
+    if not isinstance(chunk, bytes):
+      chunk = chunk.encode('utf-8')
+    buffered.append(chunk)
+    size += len(chunk)
+    if size >= buffer_size:
+      yield b''.join(buffered)
+      buffered, size = [], 0
+  if buffered:
+    yield b''.join(buffered)
+
+
+def _gzipped(chunks, level=6):
+  compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+  for chunk in chunks:
+    compressed = compressor.compress(chunk)
+    if compressed:
+      yield compressed
+  yield compressor.flush()
+
+
 abort = HttpServer.abort
+cached = HttpServer.cached
 mako_view = HttpServer.mako_view
 redirect = HttpServer.redirect
 request = HttpServer.request
@@ -0,0 +1,241 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""A thread-pool WSGI server that needs nothing beyond the standard library.
+
+The wsgiref server that bottle uses by default serves one request at a time, so a single slow
+endpoint stalls health checks and metrics scrapes.  ThreadPoolServer accepts connections on the
+main thread and hands them to a fixed pool of worker threads through a bounded queue: when the
+queue is full, new connections are answered with 503 instead of piling up.  Connections are kept
+alive between requests that have no body and whose responses have a Content-Length, as long as
+no other connections are waiting for a worker.
+
+  server = HttpServer()
+  server.run('localhost', 8888, server=ThreadPoolServer(workers=16))
+
+or by name, with default settings:
+
+  server.run('localhost', 8888, server='threadpool')
+
+The server is Observable and exports its queue depth, active and rejected connections, request
+count and request latency.
+
+"""
+
+import socket
+import threading
+import time
+import traceback
+from wsgiref.simple_server import ServerHandler, WSGIRequestHandler, WSGIServer
+
+try:
+  from Queue import Full, Queue
+except ImportError:
+  from queue import Full, Queue
+
+import bottle
+
+from twitter.common import log
+from twitter.common.exceptions import ExceptionalThread
+from twitter.common.metrics import AtomicGauge, Histogram, LambdaGauge, Observable
+
+
+class _KeepAliveServerHandler(ServerHandler):
+  http_version = '1.1'
+
+  def cleanup_headers(self):
+    ServerHandler.cleanup_headers(self)
+    request_handler = self.request_handler
+    if ('Content-Length' not in self.headers or not request_handler.keep_alive or
+        request_handler.server.busy()):
+      self.headers['Connection'] = 'close'
+      request_handler.keep_alive = False
+
+
+class _KeepAliveRequestHandler(WSGIRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def _wants_keep_alive(self):
+    if self.headers.get('Content-Length', '0') != '0' or self.headers.get('Transfer-Encoding'):
+      # The application may not consume the body, so the connection cannot be reused.
+      return False
+    connection = self.headers.get('Connection', '').lower()
+    if self.request_version == 'HTTP/1.1':
+      return connection != 'close'
+    return connection == 'keep-alive'
+
+  def handle(self):
+    server = self.server
+    self.connection.settimeout(server.request_timeout)
+    while True:
+      try:
+        self.raw_requestline = self.rfile.readline(65537)
+      except socket.timeout:
+        return
+      if not self.raw_requestline:
+        return
+      start = time.time()
+      self.connection.settimeout(server.request_timeout)
+      if len(self.raw_requestline) > 65536:
+        self.requestline = self.request_version = self.command = ''
+        self.send_error(414)
+        return
+      if not self.parse_request():
+        return
+      self.keep_alive = self._wants_keep_alive()
+      handler = _KeepAliveServerHandler(
+          self.rfile, self.wfile, self.get_stderr(), self.get_environ())
+      handler.request_handler = self
+      handler.run(server.get_app())
+      server.request_finished(time.time() - start)
+      if not self.keep_alive:
+        return
+      self.connection.settimeout(server.keepalive_timeout)
+
+  def log_request(self, *args, **kw):
+    if not self.server.quiet:
+      WSGIRequestHandler.log_request(self, *args, **kw)
+
+
+class ThreadPoolWSGIServer(WSGIServer):
+  """
+    A WSGIServer that serves connections on a fixed pool of worker threads.
+  """
+
+  REJECTION = b'HTTP/1.0 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+
+  def __init__(self, address, workers, max_queue, backlog, request_timeout,
+               keepalive_timeout, observable, quiet=False):
+    self.request_queue_size = backlog
+    self.request_timeout = request_timeout
+    self.keepalive_timeout = keepalive_timeout
+    self.quiet = quiet
+    self._queue = Queue(max_queue)
+    self._active = 0
+    self._active_lock = threading.Lock()
+    self._init_metrics(observable)
+    WSGIServer.__init__(self, address, _KeepAliveRequestHandler)
+    self._workers = []
+    for k in range(workers):
+      worker = ExceptionalThread(target=self._work, name='ThreadPoolWSGIServer-%d' % k)
+      worker.daemon = True
+      worker.start()
+      self._workers.append(worker)
+
+  def _init_metrics(self, observable):
+    metrics = observable.metrics
+    self._requests = metrics.register(AtomicGauge('requests'))
+    self._rejected = metrics.register(AtomicGauge('rejected'))
+    self._latency = metrics.register(Histogram('latency_ms'))
+    metrics.register(LambdaGauge('queue_depth', self._queue.qsize))
+    metrics.register(LambdaGauge('active', lambda: self._active))
+
+  def busy(self):
+    """
+      Whether connections are waiting for a worker, in which case a worker should not hold on
+      to an idle keep-alive connection.
+    """
+    return not self._queue.empty()
+
+  def request_finished(self, seconds):
+    self._requests.increment()
+    self._latency.record(1000.0 * seconds)
+
+  def process_request(self, request, client_address):
+    try:
+      self._queue.put_nowait((request, client_address))
+    except Full:
+      self._rejected.increment()
+      try:
+        request.sendall(self.REJECTION)
+      except socket.error:
+        pass
+      self.shutdown_request(request)
+
+  def _work(self):
+    while True:
+      item = self._queue.get()
+      if item is None:
+        break
+      request, client_address = item
+      with self._active_lock:
+        self._active += 1
+      try:
+        self.finish_request(request, client_address)
+      except Exception:
+        self.handle_error(request, client_address)
+      finally:
+        with self._active_lock:
+          self._active -= 1
+        self.shutdown_request(request)
+
+  def handle_error(self, request, client_address):
+    log.error('Error handling request from %s:%s: %s' % (
+        client_address[0], client_address[1], traceback.format_exc()))
+
+  def server_close(self):
+    WSGIServer.server_close(self)
+    for _ in self._workers:
+      self._queue.put(None)
+
+
+class ThreadPoolServer(bottle.ServerAdapter, Observable):
+  """
+    A bottle server adapter for ThreadPoolWSGIServer.
+
+      workers: the number of worker threads, i.e. requests served concurrently.
+      max_queue: the number of accepted connections that may wait for a worker.
+      backlog: the listen() backlog of connections not yet accepted.
+      request_timeout: seconds allowed for each socket read or write within a request.
+      keepalive_timeout: seconds an idle keep-alive connection is held open.
+  """
+
+  DEFAULT_WORKERS = 8
+  DEFAULT_MAX_QUEUE = 64
+  DEFAULT_BACKLOG = 128
+  DEFAULT_REQUEST_TIMEOUT = 30.0
+  DEFAULT_KEEPALIVE_TIMEOUT = 5.0
+
+  def __init__(self, host='127.0.0.1', port=8080, workers=DEFAULT_WORKERS,
+               max_queue=DEFAULT_MAX_QUEUE, backlog=DEFAULT_BACKLOG,
+               request_timeout=DEFAULT_REQUEST_TIMEOUT,
+               keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT, quiet=False, **config):
+    if workers < 1 or max_queue < 1:
+      raise ValueError('workers and max_queue must be positive.')
+    bottle.ServerAdapter.__init__(self, host=host, port=port, **config)
+    self.quiet = quiet
+    self.workers = workers
+    self.max_queue = max_queue
+    self.backlog = backlog
+    self.request_timeout = request_timeout
+    self.keepalive_timeout = keepalive_timeout
+    self.server = None
+
+  def make_server(self, handler):
+    """
+      Create (and bind) the ThreadPoolWSGIServer for the WSGI application handler.
+    """
+    self.server = ThreadPoolWSGIServer((self.host, self.port), self.workers, self.max_queue,
+        self.backlog, self.request_timeout, self.keepalive_timeout, self, quiet=self.quiet)
+    self.server.set_app(handler)
+    return self.server
+
+  def run(self, handler):
+    server = self.make_server(handler)
+    try:
+      server.serve_forever()
+    finally:
+      server.server_close()
@@ -16,8 +16,9 @@
 
 __author__ = 'Brian Wickman'
 
-from sys import version_info as sys_version_info
+from sys import platform as sys_platform, version_info as sys_version_info
 from numbers import Integral, Real
+import time
 from .lockable import Lockable
 
 
@@ -97,6 +98,44 @@ def coroutine(func):
   return start
 
 
+def _clock_gettime_monotonic():
+  # Python 2 has no monotonic clock, so call clock_gettime(2) directly where it exists.
+  clock_id = {'linux': 1, 'darwin': 6}.get(sys_platform.rstrip('0123456789'))
+  if clock_id is None:
+    return None
+  try:
+    import ctypes
+    import ctypes.util
+    libc = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'))
+    clock_gettime = libc.clock_gettime
+  except (AttributeError, ImportError, OSError):
+    return None
+
+  class timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+  clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+  if clock_gettime(clock_id, ctypes.byref(timespec())) != 0:
+    return None
+
+  def monotonic():
+    ts = timespec()
+    clock_gettime(clock_id, ctypes.byref(ts))
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+  return monotonic
+
+
+_MONOTONIC = []
+
+
+def _monotonic():
+  # Resolved on first use rather than at import, so that importing this module does not load
+  # ctypes and libc.
+  if not _MONOTONIC:
+    _MONOTONIC.append(_clock_gettime_monotonic() or time.time)
+  return _MONOTONIC[0]()
+
+
 class Compatibility(object):
   """2.x + 3.x compatibility"""
   PY2 = sys_version_info[0] == 2
@@ -110,6 +149,10 @@ class Compatibility(object):
   string = (str,) if PY3 else (str, unicode)
   bytes = (bytes,)
 
+  # Seconds from an arbitrary point, unaffected by changes to the system clock.  Falls back to
+  # time.time on Python 2 platforms without clock_gettime.
+  monotonic = staticmethod(getattr(time, 'monotonic', None) or _monotonic)
+
   if PY2:
     @staticmethod
     def to_bytes(st):
@@ -15,9 +15,17 @@
 # ==================================================================================================
 
 from .gauge import *
-from .rate import Rate
+from .histogram import Histogram
+from .rate import Rate, Rates
 from .metrics import (
     CompoundMetrics,
     Observable,
     RootMetrics)
+from .prometheus import PrometheusFormat
 from .sampler import MetricSampler
+from .shared import (
+    SharedAtomicGauge,
+    SharedMetricsReader,
+    SharedMetricsSegment,
+    SharedMutatorGauge)
+from .window import WindowedStats
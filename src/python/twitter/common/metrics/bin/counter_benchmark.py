@@ -0,0 +1,75 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""Compare increment throughput of AtomicGauge and StripedCounter as threads are added."""
+
+from __future__ import print_function
+
+import threading
+import time
+
+from twitter.common import app
+from twitter.common.metrics import AtomicGauge, StripedCounter
+
+
+app.add_option(
+    '--increments',
+    dest='increments',
+    default=200000,
+    type=int,
+    help='Number of increments performed by each thread.')
+
+
+app.add_option(
+    '--max_threads',
+    dest='max_threads',
+    default=16,
+    type=int,
+    help='Benchmark with 1, 2, 4, ... up to this many threads.')
+
+
+def run(counter, threads, increments):
+  start_gate = threading.Event()
+
+  def worker():
+    start_gate.wait()
+    increment = counter.increment
+    for _ in range(increments):
+      increment()
+
+  workers = [threading.Thread(target=worker) for _ in range(threads)]
+  for thread in workers:
+    thread.start()
+  start = time.time()
+  start_gate.set()
+  for thread in workers:
+    thread.join()
+  elapsed = time.time() - start
+  assert counter.read() == threads * increments
+  return threads * increments / elapsed
+
+
+def main(args, options):
+  print('%8s %18s %18s' % ('threads', 'atomic incr/sec', 'striped incr/sec'))
+  threads = 1
+  while threads <= options.max_threads:
+    atomic = run(AtomicGauge('atomic'), threads, options.increments)
+    striped = run(StripedCounter('striped'), threads, options.increments)
+    print('%8d %18.0f %18.0f' % (threads, atomic, striped))
+    threads *= 2
+
+
+app.main()
@@ -0,0 +1,166 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""A compact binary encoding of metric samples.
+
+  header:  magic 'TCMB', version (uint16), count (uint32), name table size (uint32)
+  names:   count names, each a uint16 length followed by UTF-8 bytes, sorted
+  values:  count 9-byte slots: a type byte followed by an int64, a float64, or the (uint32)
+           offset and (uint32) length of a string in the string table
+  strings: the UTF-8 bytes of string values, and the JSON encoding of any other values (e.g.
+           lists, dicts and integers beyond 64 bits), so that a sample decodes to the same
+           values as the JSON format of DiskMetricWriter
+
+All integers are little-endian.  The name table of a registry rarely changes, so encoders and
+decoders cache it and only encode or decode the value array on each pass.
+
+"""
+
+import json
+import struct
+
+from twitter.common.lang import Compatibility
+
+
+def _utf8(value):
+  return value if isinstance(value, bytes) else value.encode('utf-8')
+
+
+class BinaryMetricFormat(object):
+  class InvalidFormat(ValueError): pass
+
+  MAGIC = b'TCMB'
+  VERSION = 2
+  VERSIONS = (1, 2)
+
+  HEADER = struct.Struct('<4sHII')
+  NAME_LENGTH = struct.Struct('<H')
+  INTEGER = struct.Struct('<Bq')
+  FLOAT = struct.Struct('<Bd')
+  STRING = struct.Struct('<BII')
+  SLOT_SIZE = 9
+
+  NONE, INTEGER_TYPE, FLOAT_TYPE, BOOL_TYPE, STRING_TYPE, JSON_TYPE = range(6)
+  INT64_RANGE = (-2 ** 63, 2 ** 63 - 1)
+
+  @classmethod
+  def is_binary(cls, data):
+    return bytes(data[:len(cls.MAGIC)]) == cls.MAGIC
+
+  def __init__(self):
+    self._names = None
+    self._name_table = None
+
+  def _encode_names(self, names):
+    if names != self._names:
+      table = []
+      for name in names:
+        encoded = _utf8(name)
+        table.append(self.NAME_LENGTH.pack(len(encoded)))
+        table.append(encoded)
+      self._names, self._name_table = names, b''.join(table)
+    return self._name_table
+
+  def encode(self, sample):
+    """
+      Encode a sample (a dict of name to number, string, bool or None, or any other
+      JSON-serializable value.)
+
+      May raise:
+        TypeError if a value is not JSON-serializable.
+    """
+    names = sorted(sample)
+    name_table = self._encode_names(names)
+    values, strings, strings_size = [], [], 0
+    for name in names:
+      value = sample[name]
+      if isinstance(value, bool):
+        values.append(self.INTEGER.pack(self.BOOL_TYPE, int(value)))
+      elif isinstance(value, Compatibility.integer) and (
+          self.INT64_RANGE[0] <= value <= self.INT64_RANGE[1]):
+        values.append(self.INTEGER.pack(self.INTEGER_TYPE, value))
+      elif isinstance(value, Compatibility.real) and not isinstance(
+          value, Compatibility.integer):
+        values.append(self.FLOAT.pack(self.FLOAT_TYPE, value))
+      elif value is None:
+        values.append(self.INTEGER.pack(self.NONE, 0))
+      else:
+        if isinstance(value, Compatibility.string):
+          value_type, encoded = self.STRING_TYPE, _utf8(value)
+        else:
+          value_type, encoded = self.JSON_TYPE, _utf8(json.dumps(value))
+        values.append(self.STRING.pack(value_type, strings_size, len(encoded)))
+        strings.append(encoded)
+        strings_size += len(encoded)
+    header = self.HEADER.pack(self.MAGIC, self.VERSION, len(names), len(name_table))
+    return b''.join([header, name_table] + values + strings)
+
+  def _decode_names(self, data, count, start, end):
+    table = bytes(data[start:end])
+    if table == self._name_table:
+      return self._names
+    names, offset = [], 0
+    for _ in range(count):
+      length, = self.NAME_LENGTH.unpack_from(table, offset)
+      offset += self.NAME_LENGTH.size
+      names.append(table[offset:offset + length].decode('utf-8'))
+      offset += length
+    if offset != len(table):
+      raise self.InvalidFormat('Name table has %d trailing bytes.' % (len(table) - offset))
+    self._names, self._name_table = names, table
+    return names
+
+  def decode(self, data):
+    """
+      Decode an encoded sample from a string, buffer or mmap.
+    """
+    try:
+      magic, version, count, names_size = self.HEADER.unpack_from(data, 0)
+      if magic != self.MAGIC or version not in self.VERSIONS:
+        raise self.InvalidFormat('Not a version %s binary metrics file.' % (
+            ' or '.join(map(str, self.VERSIONS))))
+      names_start = self.HEADER.size
+      values_start = names_start + names_size
+      strings_start = values_start + count * self.SLOT_SIZE
+      if strings_start > len(data):
+        raise self.InvalidFormat('Truncated binary metrics file.')
+      names = self._decode_names(data, count, names_start, values_start)
+      sample = {}
+      for k, name in enumerate(names):
+        offset = values_start + k * self.SLOT_SIZE
+        value_type = ord(data[offset:offset + 1])
+        if value_type == self.FLOAT_TYPE:
+          sample[name] = self.FLOAT.unpack_from(data, offset)[1]
+        elif value_type in (self.STRING_TYPE, self.JSON_TYPE):
+          _, start, length = self.STRING.unpack_from(data, offset)
+          start += strings_start
+          if start + length > len(data):
+            raise self.InvalidFormat('Truncated string table.')
+          value = bytes(data[start:start + length]).decode('utf-8')
+          sample[name] = json.loads(value) if value_type == self.JSON_TYPE else value
+        elif value_type == self.INTEGER_TYPE:
+          sample[name] = self.INTEGER.unpack_from(data, offset)[1]
+        elif value_type == self.BOOL_TYPE:
+          sample[name] = bool(self.INTEGER.unpack_from(data, offset)[1])
+        elif value_type == self.NONE:
+          sample[name] = None
+        else:
+          raise self.InvalidFormat('Unknown value type %d for %s' % (value_type, name))
+      return sample
+    except self.InvalidFormat:
+      raise
+    except (struct.error, ValueError) as e:
+      raise self.InvalidFormat('Corrupt binary metrics file: %s' % e)
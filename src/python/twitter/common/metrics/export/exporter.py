@@ -0,0 +1,307 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""Push metric samples off-host over line protocols.
+
+A MetricExporter periodically samples a MetricProvider, diffs the sample against the last one
+it handed off, and sends only the changed numeric values, formatted by a LineProtocol (statsd
+or graphite) and batched into payloads, through a Transport (UDP or TCP.)  Payloads that cannot
+be sent are appended to an optional RecordIO Spool, which is drained in order before anything
+new is sent once the receiver is reachable again.
+
+"""
+
+import os
+import socket
+import threading
+import time
+
+from twitter.common import log
+from twitter.common.lang import Compatibility
+from twitter.common.metrics import AtomicGauge, LambdaGauge, Observable
+from twitter.common.metrics.sampler import SamplerBase
+from twitter.common.quantity import Amount, Data, Time
+from twitter.common.recordio import RecordIO, RecordReader, RecordWriter
+
+
+class LineProtocol(object):
+  """
+    Formats one metric value as a line of a text protocol.
+  """
+  def format(self, name, value, timestamp):
+    raise NotImplementedError
+
+
+class StatsdProtocol(LineProtocol):
+  """
+    statsd gauges: <name>:<value>|g
+  """
+  def format(self, name, value, timestamp):
+    return '%s:%s|g\n' % (name, value)
+
+
+class GraphiteProtocol(LineProtocol):
+  """
+    The graphite plaintext protocol: <name> <value> <timestamp>
+  """
+  def format(self, name, value, timestamp):
+    return '%s %s %d\n' % (name, value, timestamp)
+
+
+class Transport(object):
+  class Error(Exception): pass
+
+  def send(self, payload):
+    """
+      Send the string payload.  Raises Transport.Error on failure.
+    """
+    raise NotImplementedError
+
+  def close(self):
+    pass
+
+
+class UDPTransport(Transport):
+  """
+    Send each payload as one datagram.  Delivery is not acknowledged, so only local failures
+    (e.g. an unresolvable host or an ICMP port unreachable) are detected.
+  """
+  def __init__(self, host, port):
+    self._address = (host, port)
+    self._socket = None
+
+  def send(self, payload):
+    try:
+      if self._socket is None:
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.connect(self._address)
+      self._socket.send(payload)
+    except (socket.error, socket.gaierror) as e:
+      self.close()
+      raise self.Error('Failed to send to %s:%s: %s' % (self._address + (e,)))
+
+  def close(self):
+    if self._socket is not None:
+      self._socket.close()
+      self._socket = None
+
+
+class TCPTransport(Transport):
+  """
+    Send payloads over a persistent TCP connection, reconnecting on the next send after a
+    failure.
+  """
+  def __init__(self, host, port, timeout=Amount(5, Time.SECONDS)):
+    self._address = (host, port)
+    self._timeout = timeout.as_(Time.SECONDS)
+    self._socket = None
+
+  def send(self, payload):
+    try:
+      if self._socket is None:
+        self._socket = socket.create_connection(self._address, self._timeout)
+      self._socket.sendall(payload)
+    except (socket.error, socket.gaierror, socket.timeout) as e:
+      self.close()
+      raise self.Error('Failed to send to %s:%s: %s' % (self._address + (e,)))
+
+  def close(self):
+    if self._socket is not None:
+      self._socket.close()
+      self._socket = None
+
+
+class Spool(object):
+  """
+    A RecordIO file of payloads waiting to be sent, bounded by max_size.  Delivery from the
+    spool is at least once: the read position is not persisted, so payloads spooled before a
+    restart are all resent.
+  """
+
+  DEFAULT_MAX_SIZE = Amount(64, Data.MB)
+
+  def __init__(self, filename, max_size=DEFAULT_MAX_SIZE):
+    self._filename = filename
+    self._max_size = max_size.as_(Data.BYTES)
+    self._offset = 0
+    self._lock = threading.Lock()
+    self._fp = open(filename, 'ab')
+    self._fp.seek(0, os.SEEK_END)
+    self._writer = RecordWriter(self._fp)
+    self._pending = 0
+    if self._fp.tell() > 0:
+      with open(filename, 'rb') as fp:
+        self._pending = sum(1 for _ in RecordReader(fp))
+
+  @property
+  def pending(self):
+    """
+      The number of payloads waiting to be sent.
+    """
+    return self._pending
+
+  def append(self, payload):
+    """
+      Spool payload.  Returns False if the spool is full or could not be written.
+    """
+    with self._lock:
+      if self._fp.tell() + len(payload) + RecordIO.RECORD_HEADER_SIZE > self._max_size:
+        return False
+      if not self._writer.write(payload):
+        return False
+      self._fp.flush()
+      self._pending += 1
+      return True
+
+  def drain(self, send):
+    """
+      Pass spooled payloads to send in order until it raises Transport.Error or the spool is
+      empty, which truncates it.  Returns the number of payloads sent.
+    """
+    sent = 0
+    with self._lock:
+      if self._pending == 0:
+        return 0
+      with open(self._filename, 'rb') as fp:
+        fp.seek(self._offset)
+        reader = RecordReader(fp)
+        for payload in iter(reader.try_read, None):
+          try:
+            send(payload)
+          except Transport.Error as e:
+            log.debug('Stopped draining spool %s: %s' % (self._filename, e))
+            return sent
+          self._offset = fp.tell()
+          self._pending -= 1
+          sent += 1
+      self._fp.truncate(0)
+      self._fp.seek(0)
+      self._offset = self._pending = 0
+    return sent
+
+  def close(self):
+    with self._lock:
+      self._writer.close()
+
+
+class MetricExporter(SamplerBase, Observable):
+  """
+    Periodically push the numeric values of a MetricProvider that changed since the last push.
+
+    The exporter exports the sent, spooled, dropped and failed payload counts and the spool
+    depth through twitter.common.metrics.
+  """
+
+  # Keeps statsd datagrams under a typical path MTU.
+  DEFAULT_MAX_PAYLOAD = Amount(1400, Data.BYTES)
+
+  def __init__(self, provider, protocol, transport, period=Amount(15, Time.SECONDS),
+               prefix=None, spool=None, max_payload=DEFAULT_MAX_PAYLOAD, clock=time):
+    """
+      Construct a MetricExporter.
+
+        provider: the MetricProvider to sample, e.g. RootMetrics() or a MetricSampler.
+        protocol: the LineProtocol used to format values.
+        transport: the Transport that payloads are sent through.
+        period: how often to sample and send.
+        prefix: an optional prefix for every metric name, e.g. the host or service name.
+        spool: an optional Spool for payloads that could not be sent.
+        max_payload: the size in Data of the largest payload built.
+    """
+    if not isinstance(protocol, LineProtocol):
+      raise TypeError('protocol must be a LineProtocol, got %s' % type(protocol))
+    if not isinstance(transport, Transport):
+      raise TypeError('transport must be a Transport, got %s' % type(transport))
+    self._provider = provider
+    self._protocol = protocol
+    self._transport = transport
+    self._prefix = prefix + '.' if prefix else ''
+    self._spool = spool
+    self._max_payload = max_payload.as_(Data.BYTES)
+    self._last_sample = {}
+    self._sent = self.metrics.register(AtomicGauge('sent'))
+    self._spooled = self.metrics.register(AtomicGauge('spooled'))
+    self._dropped = self.metrics.register(AtomicGauge('dropped'))
+    self._failed = self.metrics.register(AtomicGauge('failed'))
+    self.metrics.register(LambdaGauge('spool_depth', lambda: spool.pending if spool else 0))
+    SamplerBase.__init__(self, period, clock)
+
+  def changed(self, sample):
+    """
+      Return the sorted (name, value) pairs of numeric values in sample that differ from the
+      last sample handed off.
+    """
+    points = []
+    for name, value in sample.items():
+      if isinstance(value, bool):
+        value = int(value)
+      elif not isinstance(value, Compatibility.numeric):
+        continue
+      if self._last_sample.get(name) != value:
+        points.append((name, value))
+    return sorted(points)
+
+  def payloads(self, points, timestamp):
+    """
+      Format points into payloads of at most max_payload bytes (unless a single line is longer.)
+    """
+    payload, size = [], 0
+    for name, value in points:
+      line = self._protocol.format(self._prefix + name, value, timestamp)
+      if payload and size + len(line) > self._max_payload:
+        yield ''.join(payload)
+        payload, size = [], 0
+      payload.append(line)
+      size += len(line)
+    if payload:
+      yield ''.join(payload)
+
+  def _send(self, payload):
+    self._transport.send(payload)
+    self._sent.increment()
+
+  def iterate(self):
+    sample = self._provider.sample()
+    points = self.changed(sample)
+    connected = True
+    if self._spool is not None and self._spool.pending:
+      self._spool.drain(self._send)
+      connected = not self._spool.pending
+    for payload in self.payloads(points, int(self._clock.time())):
+      if connected:
+        try:
+          self._send(payload)
+          continue
+        except Transport.Error as e:
+          log.warning('Failed to export metrics: %s' % e)
+          connected = False
+      self._failed.increment()
+      if self._spool is None:
+        continue
+      if self._spool.append(payload):
+        self._spooled.increment()
+      else:
+        self._dropped.increment()
+    # Values are handed off even if dropped; otherwise an unreachable receiver would make every
+    # later push a full one.
+    self._last_sample = dict(
+        (name, value) for name, value in sample.items() if isinstance(value, Compatibility.numeric))
+
+  def close(self):
+    self.stop()
+    self._transport.close()
+    if self._spool is not None:
+      self._spool.close()
@@ -137,3 +137,57 @@ class AtomicGauge(NamedGauge, MutableGauge):
       Decrement metric and return updated metric.
     """
     return self.add(-1)
+
+
+class StripedCounter(NamedGauge):
+  """
+    A counter for heavily contended increments.  Each thread adds into its own slot without
+    taking a shared lock, and read() sums the slots.  Slots of threads that have exited are
+    folded into a base value on read.
+
+    Unlike AtomicGauge, add() does not return the updated value, since that would require
+    summing every slot.
+  """
+  def __init__(self, name, initial_value=0):
+    import threading
+    if not isinstance(initial_value, Compatibility.integer):
+      raise TypeError('StripedCounter must be initialized with an integer.')
+    NamedGauge.__init__(self, name, initial_value)
+    self._local = threading.local()
+    self._slots = []
+    self._slots_lock = threading.Lock()
+
+  def _slot(self):
+    import threading
+    slot = [0]
+    self._local.slot = slot
+    with self._slots_lock:
+      self._slots.append((threading.current_thread(), slot))
+    return slot
+
+  def add(self, delta):
+    """
+      Add delta to the counter.
+    """
+    try:
+      slot = self._local.slot
+    except AttributeError:
+      slot = self._slot()
+    slot[0] += delta
+
+  def increment(self):
+    self.add(1)
+
+  def decrement(self):
+    self.add(-1)
+
+  def read(self):
+    with self._slots_lock:
+      live = []
+      for thread, slot in self._slots:
+        if thread.is_alive():
+          live.append((thread, slot))
+        else:
+          self._value += slot[0]
+      self._slots = live
+      return self._value + sum(slot[0] for _, slot in live)
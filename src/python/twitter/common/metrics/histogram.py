@@ -0,0 +1,177 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import math
+import threading
+
+from twitter.common.lang import Compatibility
+
+from .gauge import NamedGauge
+from .metrics import MetricProvider
+
+
+class Histogram(NamedGauge, MetricProvider):
+  """
+    A streaming histogram of non-negative values in bounded memory.
+
+    Values are counted in log-linear buckets: each power of two is split into 2**precision
+    equal sub-buckets, so percentiles are accurate to within 2**-precision of the true value
+    (about 3% with the default precision of 5) regardless of the range of values recorded.
+    record() is constant time.
+
+    When registered with Metrics, a Histogram samples as <name>.count, <name>.max and
+    <name>.p50, .p90, .p99 and .p999.  Histograms recorded in different threads may be combined
+    with merge().
+  """
+
+  PERCENTILES = (
+    ('p50', 0.5),
+    ('p90', 0.9),
+    ('p99', 0.99),
+    ('p999', 0.999),
+  )
+  DEFAULT_PRECISION = 5
+
+  def __init__(self, name, precision=DEFAULT_PRECISION):
+    if not isinstance(precision, Compatibility.integer) or not 1 <= precision <= 16:
+      raise ValueError('Histogram precision must be an integer in [1, 16], got %r' % precision)
+    NamedGauge.__init__(self, name)
+    self._precision = precision
+    self._sub_buckets = 1 << precision
+    self._lock = threading.Lock()
+    self._clear()
+
+  def _clear(self):
+    self._buckets = {}
+    self._count = 0
+    self._zeros = 0
+    self._max = 0
+    self._sum = 0
+
+  @property
+  def precision(self):
+    return self._precision
+
+  def _bucket(self, value):
+    # Buckets are closed above, i.e. (lower, upper], so that values on a boundary (such as whole
+    # numbers on powers of two) fall at or below it, as with Prometheus' le buckets.
+    mantissa, exponent = math.frexp(value)
+    scaled = (mantissa - 0.5) * 2 * self._sub_buckets
+    return exponent * self._sub_buckets + int(math.ceil(scaled)) - 1
+
+  def _bucket_value(self, bucket):
+    # The midpoint of the bucket.
+    exponent, sub_bucket = divmod(bucket, self._sub_buckets)
+    return math.ldexp(0.5 + (sub_bucket + 0.5) / (2.0 * self._sub_buckets), exponent)
+
+  def record(self, value, count=1):
+    """
+      Record count occurrences of the non-negative number value.
+    """
+    if value < 0:
+      raise ValueError('Histogram values must be non-negative, got %r' % value)
+    with self._lock:
+      self._count += count
+      self._sum += value * count
+      if value > self._max:
+        self._max = value
+      if value == 0:
+        self._zeros += count
+        return
+      bucket = self._bucket(value)
+      self._buckets[bucket] = self._buckets.get(bucket, 0) + count
+
+  def merge(self, other):
+    """
+      Add the values recorded in Histogram other, which must have the same precision.
+    """
+    if not isinstance(other, Histogram) or other.precision != self._precision:
+      raise ValueError('Can only merge Histograms of precision %d' % self._precision)
+    with other._lock:
+      buckets, count, zeros, max_value, total = (
+          dict(other._buckets), other._count, other._zeros, other._max, other._sum)
+    with self._lock:
+      for bucket, bucket_count in buckets.items():
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + bucket_count
+      self._count += count
+      self._zeros += zeros
+      self._max = max(self._max, max_value)
+      self._sum += total
+
+  def reset(self):
+    with self._lock:
+      self._clear()
+
+  def percentiles(self, quantiles):
+    """
+      Return the estimated values at each of the quantiles (numbers in [0, 1]), which must be
+      sorted in increasing order.
+    """
+    return self._percentiles(self._snapshot(), quantiles)
+
+  def _bucket_upper_bound(self, bucket):
+    exponent, sub_bucket = divmod(bucket, self._sub_buckets)
+    return math.ldexp(0.5 + (sub_bucket + 1.0) / (2.0 * self._sub_buckets), exponent)
+
+  def cumulative(self, bounds):
+    """
+      Return (counts, count, sum) where counts[k] is the number of values recorded at or below
+      bounds[k], for bounds sorted in increasing order.  Counts are exact for bounds that are
+      powers of two, and otherwise rounded down to the nearest bucket boundary.
+    """
+    with self._lock:
+      buckets = sorted(self._buckets.items())
+      count, zeros, total = self._count, self._zeros, self._sum
+    counts, seen, index = [], zeros, 0
+    for bound in bounds:
+      while index < len(buckets) and self._bucket_upper_bound(buckets[index][0]) <= bound:
+        seen += buckets[index][1]
+        index += 1
+      counts.append(seen)
+    return counts, count, total
+
+  def _snapshot(self):
+    with self._lock:
+      return sorted(self._buckets.items()), self._count, self._zeros, self._max
+
+  def _percentiles(self, snapshot, quantiles):
+    buckets, count, zeros, max_value = snapshot
+    results = []
+    seen, index = zeros, 0
+    for quantile in quantiles:
+      rank = quantile * count
+      if count == 0 or rank <= zeros:
+        results.append(0)
+        continue
+      while index < len(buckets) and seen + buckets[index][1] < rank:
+        seen += buckets[index][1]
+        index += 1
+      if index == len(buckets):
+        results.append(max_value)
+      else:
+        results.append(min(self._bucket_value(buckets[index][0]), max_value))
+    return results
+
+  def sample(self):
+    snapshot = self._snapshot()
+    _, count, _, max_value = snapshot
+    quantiles = self._percentiles(snapshot, [quantile for _, quantile in self.PERCENTILES])
+    sample = dict(zip([name for name, _ in self.PERCENTILES], quantiles))
+    sample.update(count=count, max=max_value)
+    return sample
+
+  def read(self):
+    return self.sample()
@@ -15,6 +15,8 @@
 # ==================================================================================================
 
 
+import threading
+
 from twitter.common.lang import Compatibility, Singleton
 from .gauge import (
   Gauge,
@@ -108,15 +110,35 @@ class Metrics(MetricRegistry, MetricProvider):
     except ValueError:
       return None
 
+  # Bumped whenever any Metrics tree changes shape, so that cached flattenings can be
+  # validated in O(1).
+  _GENERATION_LOCK = threading.Lock()
+  _generation = 0
+
+  @classmethod
+  def _next_generation(cls):
+    with Metrics._GENERATION_LOCK:
+      Metrics._generation += 1
+      return Metrics._generation
+
   def __init__(self):
     self._metrics = {}
     self._children = {}
+    self._mutated()
+    self._flat = None
+    self._flat_key = None
+    self._flat_version = None
+    self._flat_generation = None
+
+  def _mutated(self):
+    self._mutation = self._next_generation()
 
   def scope(self, name):
     if not isinstance(name, Compatibility.string):
       raise TypeError('Scope names must be strings, got: %s' % type(name))
     if name not in self._children:
       self._children[name] = Metrics()
+      self._mutated()
     return self._children[name]
 
   def register_observable(self, name, observable):
@@ -125,10 +147,12 @@ class Metrics(MetricRegistry, MetricProvider):
     if not isinstance(observable, Observable):
       raise TypeError('observable must be an Observable, got: %s' % type(observable))
     self._children[name] = observable.metrics
+    self._mutated()
 
   def unregister_observable(self, name):
     if not isinstance(name, Compatibility.string):
       raise TypeError('Unregister takes a string name!')
+    self._mutated()
     return self._children.pop(name, None)
 
   def register(self, gauge):
@@ -137,22 +161,69 @@ class Metrics(MetricRegistry, MetricProvider):
     if not isinstance(gauge, NamedGauge) and not namablegauge(gauge):
       raise TypeError('Must register either a string or a Gauge-like object! Got %s' % gauge)
     self._metrics[gauge.name()] = gauge
+    self._mutated()
     return gauge
 
   def unregister(self, name):
     if not isinstance(name, Compatibility.string):
       raise TypeError('Unregister takes a string name!')
+    self._mutated()
     return self._metrics.pop(name, None)
 
   @classmethod
   def sample_name(cls, scope_name, sample_name):
     return '.'.join([scope_name, sample_name])
 
+  def flatten(self):
+    """
+      Return a list of (fully qualified name, gauge, is_provider) for every gauge in this tree,
+      where is_provider indicates a gauge that is also a MetricProvider (e.g. a Histogram.)
+
+      The list is cached until the shape of some Metrics tree changes, and then only the
+      subtrees that changed are rebuilt.  The returned list must not be modified.
+    """
+    generation = Metrics._generation
+    if self._flat is not None and self._flat_generation == generation:
+      return self._flat
+    children = [(name, child, child.flatten()) for name, child in list(self._children.items())]
+    flat_key = (self._mutation, [(name, child._flat_version) for name, child, _ in children])
+    if self._flat is None or flat_key != self._flat_key:
+      flat = [(name, gauge, isinstance(gauge, MetricProvider))
+              for name, gauge in list(self._metrics.items())]
+      for scope_name, _, child_flat in children:
+        flat.extend((self.sample_name(scope_name, name), gauge, is_provider)
+                    for (name, gauge, is_provider) in child_flat)
+      self._flat, self._flat_key, self._flat_version = flat, flat_key, generation
+    self._flat_generation = generation
+    return self._flat
+
+  @classmethod
+  def sample_gauge(cls, name, gauge, is_provider):
+    """
+      Return the samples of one (fully qualified name, gauge, is_provider) entry of flatten(),
+      as sample() would.
+    """
+    if is_provider:
+      return dict((cls.sample_name(name, provider_name), cls.coerce_value(value))
+                  for provider_name, value in gauge.sample().items())
+    try:
+      return {name: cls.coerce_value(gauge.read())}
+    except ValueError:
+      return {}
+
   def sample(self):
-    samples = dict(filter(None, map(self.coerce_metric, self._metrics.items())))
-    for scope_name, scope in self._children.items():
-      samples.update((self.sample_name(scope_name, sample_name), sample_value)
-                     for (sample_name, sample_value) in scope.sample().items())
+    samples = {}
+    coerce_value, sample_name = self.coerce_value, self.sample_name
+    for name, gauge, is_provider in self.flatten():
+      if is_provider:
+        # Composite gauges, e.g. Histograms, export several samples under their name.
+        for provider_name, value in gauge.sample().items():
+          samples[sample_name(name, provider_name)] = coerce_value(value)
+        continue
+      try:
+        samples[name] = coerce_value(gauge.read())
+      except ValueError:
+        continue
     return samples
 
 
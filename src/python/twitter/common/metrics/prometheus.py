@@ -0,0 +1,155 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+r"""Render metric samples in the Prometheus text exposition format (version 0.0.4).
+
+Dotted metric names are flattened into Prometheus names, e.g. http.requests.count becomes
+http_requests_count.  Parts of a name can instead be turned into labels by rules: full-match
+regular expressions whose named groups become labels and are cut out of the name, so the rule
+
+  r'http\.(?P<status>\dxx)\..*'
+
+exports http.2xx.count as http_count{status="2xx"}.  Histograms are exported with cumulative
+buckets.  String values, e.g. Labels, are exported info-style as name{value="..."} 1.
+
+"""
+
+import math
+import re
+
+from twitter.common.lang import Compatibility
+
+from .histogram import Histogram
+
+
+class PrometheusFormat(object):
+  CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+  # Powers of two are exact Histogram bucket boundaries.
+  DEFAULT_BUCKETS = tuple(float(4 ** k) for k in range(16))
+
+  INVALID_NAME_CHARACTERS = re.compile(r'[^a-zA-Z0-9_:]')
+  INVALID_LABEL_CHARACTERS = re.compile(r'[^a-zA-Z0-9_]')
+
+  @classmethod
+  def histograms(cls, metrics):
+    """
+      Return the (name, Histogram) pairs registered in the Metrics tree metrics.
+    """
+    return [(name, gauge) for name, gauge, is_provider in metrics.flatten()
+            if is_provider and isinstance(gauge, Histogram)]
+
+  @classmethod
+  def escape(cls, value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+  @classmethod
+  def format_value(cls, value):
+    if isinstance(value, bool):
+      return '1' if value else '0'
+    elif isinstance(value, Compatibility.integer):
+      return str(value)
+    elif math.isnan(value):
+      return 'NaN'
+    elif math.isinf(value):
+      return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+  def __init__(self, rules=(), buckets=DEFAULT_BUCKETS):
+    """
+      Construct a formatter.
+
+        rules: regular expressions (strings or compiled) mapping dotted names to labels.  The
+          first rule that matches the whole of a name is applied.
+        buckets: the upper bounds of the cumulative buckets exported for Histograms.
+    """
+    self._rules = [re.compile(rule if hasattr(rule, 'match') else '(?:%s)$' % rule)
+                   for rule in rules]
+    self._buckets = sorted(float(bound) for bound in buckets)
+
+  def name(self, dotted_name):
+    """
+      Return (name, labels) for a dotted metric name, where labels is a tuple of sorted
+      (label, value) pairs.
+    """
+    labels, spans = [], []
+    for rule in self._rules:
+      match = rule.match(dotted_name)
+      if match and match.end() == len(dotted_name):
+        for label in match.groupdict():
+          if match.group(label) is not None:
+            labels.append((self.INVALID_LABEL_CHARACTERS.sub('_', label), match.group(label)))
+            spans.append(match.span(label))
+        break
+    parts, start = [], 0
+    for begin, end in sorted(spans):
+      parts.append(dotted_name[start:begin])
+      start = max(start, end)
+    parts.append(dotted_name[start:])
+    name = '_'.join(part for part in '.'.join(parts).split('.') if part)
+    name = self.INVALID_NAME_CHARACTERS.sub('_', name) or '_'
+    if name[0].isdigit():
+      name = '_' + name
+    return name, tuple(sorted(labels))
+
+  def _labels(self, labels):
+    if not labels:
+      return ''
+    return '{%s}' % ','.join('%s="%s"' % (label, self.escape(value)) for label, value in labels)
+
+  def render(self, sample, histograms=()):
+    """
+      Generate the lines of the exposition of the sample (a dict of dotted name to value, as
+      returned by Metrics.sample) and of the (name, Histogram) pairs histograms.  Sampled
+      values under the name of one of the histograms are superseded by its buckets.
+    """
+    histogram_prefixes = tuple(name + '.' for name, _ in histograms)
+    entries = []
+    for dotted_name, value in sample.items():
+      if value is None or dotted_name.startswith(histogram_prefixes):
+        continue
+      name, labels = self.name(dotted_name)
+      if isinstance(value, Compatibility.string):
+        entries.append((name, 'gauge', labels + (('value', value),), 1))
+      elif isinstance(value, Compatibility.numeric + (bool,)):
+        entries.append((name, 'gauge', labels, value))
+    for dotted_name, histogram in histograms:
+      name, labels = self.name(dotted_name)
+      entries.append((name, 'histogram', labels, histogram))
+    entries.sort(key=lambda entry: entry[:3])
+
+    current_name = current_type = None
+    for name, metric_type, labels, value in entries:
+      if name != current_name:
+        current_name, current_type = name, metric_type
+        yield '# TYPE %s %s\n' % (name, metric_type)
+      elif metric_type != current_type:
+        # Prometheus requires a single type per name.
+        continue
+      if metric_type == 'histogram':
+        for line in self._render_histogram(name, labels, value):
+          yield line
+      else:
+        yield '%s%s %s\n' % (name, self._labels(labels), self.format_value(value))
+
+  def _render_histogram(self, name, labels, histogram):
+    counts, count, total = histogram.cumulative(self._buckets)
+    for bound, bucket_count in zip(self._buckets, counts):
+      yield '%s_bucket%s %d\n' % (
+          name, self._labels(labels + (('le', self.format_value(bound)),)), bucket_count)
+    yield '%s_bucket%s %d\n' % (name, self._labels(labels + (('le', '+Inf'),)), count)
+    yield '%s_sum%s %s\n' % (name, self._labels(labels), self.format_value(total))
+    yield '%s_count%s %d\n' % (name, self._labels(labels), count)
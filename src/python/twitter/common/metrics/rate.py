@@ -14,15 +14,23 @@
 # limitations under the License.
 # ==================================================================================================
 
+from collections import deque
+import threading
 import time
 
 from twitter.common.quantity import Amount, Time
 from .gauge import NamedGauge, gaugelike, namablegauge
+from .metrics import MetricProvider
 
 class Rate(NamedGauge):
   """
     Gauge that computes a windowed rate.
+
+    At most resolution samples of the underlying gauge are retained per window, so reads are
+    amortized constant time and memory is bounded however often the rate is read.
   """
+  DEFAULT_RESOLUTION = 60
+
   @staticmethod
   def of(gauge, name = None, window = None, clock = None):
     kw = {}
@@ -37,18 +45,25 @@ class Rate(NamedGauge):
         raise TypeError('Rate.of must take a namable Gauge-like object if no name specified!')
       return Rate(gauge.name(), gauge, **kw)
 
-  def __init__(self, name, gauge, window = Amount(1, Time.SECONDS), clock = time):
+  def __init__(self, name, gauge, window = Amount(1, Time.SECONDS), clock = time,
+               resolution = DEFAULT_RESOLUTION):
     """
       Create a gauge using name as a base for a <name>_per_<window> sampling gauge.
 
         name: The base name of the gauge.
         gauge: The gauge to sample
         window: The window over which the samples should be measured (default 1 second.)
+        resolution: The maximum number of samples retained within the window.
     """
+    if resolution < 1:
+      raise ValueError('Rate resolution must be positive, got %r' % resolution)
     self._clock = clock
     self._gauge = gauge
-    self._samples = []
+    self._samples = deque()
     self._window = window
+    self._window_secs = window.as_(Time.SECONDS)
+    self._interval = float(self._window_secs) / resolution
+    self._lock = threading.Lock()
     NamedGauge.__init__(self, '%s_per_%s%s' % (name, window.amount(), window.unit()))
 
   def filter(self, newer_than=None):
@@ -56,17 +71,62 @@ class Rate(NamedGauge):
       Filter the samples to only contain elements in the window.
     """
     if newer_than is None:
-      newer_than = self._clock.time() - self._window.as_(Time.SECONDS)
-    self._samples = [sample for sample in self._samples if sample[0] >= newer_than]
+      newer_than = self._clock.time() - self._window_secs
+    with self._lock:
+      self._filter(newer_than)
 
-  def read(self):
-    now = self._clock.time()
-    self.filter(now - self._window.as_(Time.SECONDS))
-    new_sample = self._gauge.read()
-    self._samples.insert(0, (now, new_sample))
-    if len(self._samples) == 1:
-      return 0
-    last_sample = self._samples[-1]
-    dy = new_sample - last_sample[1]
-    dt = now - last_sample[0]
+  def _filter(self, newer_than):
+    while self._samples and self._samples[0][0] < newer_than:
+      self._samples.popleft()
+
+  def update(self, now, new_sample):
+    """
+      Add a sample of the underlying gauge taken at time now, and return the rate over the
+      window ending at now.
+    """
+    with self._lock:
+      self._filter(now - self._window_secs)
+      # Samples closer together than the resolution allows are used but not retained.
+      if not self._samples or now - self._samples[-1][0] >= self._interval:
+        self._samples.append((now, new_sample))
+      if len(self._samples) == 0 or self._samples[0][0] == now:
+        return 0
+      last_time, last_sample = self._samples[0]
+    dy = new_sample - last_sample
+    dt = now - last_time
     return 0 if dt == 0 else dy / dt
+
+  def read(self):
+    return self.update(self._clock.time(), self._gauge.read())
+
+
+class Rates(NamedGauge, MetricProvider):
+  """
+    Rates of a single gauge over several windows at once, like load averages.  The gauge is
+    read once per sample and exported as <name>.per_<window> for each window.
+  """
+  LOAD_AVERAGE_WINDOWS = (
+    Amount(1, Time.MINUTES),
+    Amount(5, Time.MINUTES),
+    Amount(15, Time.MINUTES),
+  )
+
+  def __init__(self, name, gauge, windows = LOAD_AVERAGE_WINDOWS, clock = time,
+               resolution = Rate.DEFAULT_RESOLUTION):
+    if not gaugelike(gauge):
+      raise TypeError('Rates must take a Gauge-like object!  Got %s' % type(gauge))
+    if not windows:
+      raise ValueError('Rates must have at least one window.')
+    self._clock = clock
+    self._gauge = gauge
+    self._rates = [('per_%s%s' % (window.amount(), window.unit()),
+                    Rate(name, gauge, window=window, clock=clock, resolution=resolution))
+                   for window in windows]
+    NamedGauge.__init__(self, name)
+
+  def sample(self):
+    now, new_sample = self._clock.time(), self._gauge.read()
+    return dict((key, rate.update(now, new_sample)) for key, rate in self._rates)
+
+  def read(self):
+    return self.sample()
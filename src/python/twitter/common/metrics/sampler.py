@@ -14,8 +14,12 @@
 # limitations under the License.
 # ==================================================================================================
 
+from collections import deque
 import json
+import mmap
 import os
+import random
+import tempfile
 import time
 import threading
 
@@ -27,7 +31,9 @@ except ImportError:
 from twitter.common.exceptions import ExceptionalThread
 from twitter.common.quantity import Amount, Time
 
-from .metrics import MetricProvider
+from .binary_format import BinaryMetricFormat
+from .gauge import AtomicGauge, LambdaGauge, MutatorGauge, NamedGauge
+from .metrics import MetricProvider, Metrics, Observable
 
 
 class SamplerBase(ExceptionalThread):
@@ -55,53 +61,386 @@ class SamplerBase(ExceptionalThread):
       self.iterate()
 
 
-class MetricSampler(SamplerBase, MetricProvider):
+class _GaugeReads(object):
+  """
+    Read a list of flatten() entries in order on a worker thread, giving up on any read that
+    takes longer than timeout seconds.  The worker of an abandoned read is left to finish (or
+    hang) on its own and hands its late result to on_late, while a new worker carries on with
+    the remaining entries, so that one hung gauge cannot stall the caller.
+  """
+
+  def __init__(self, entries, read, timeout, on_late):
+    self._entries = entries
+    self._read = read
+    self._timeout = timeout
+    self._on_late = on_late
+    self._condition = threading.Condition()
+    self._index = 0
+    self._started = None
+    self._worker = None
+    self.results = []
+    self.timed_out = []
+
+  def _start_worker(self):
+    self._started = None
+    self._worker = ExceptionalThread(target=self._work, name='MetricSampler-reader')
+    self._worker.daemon = True
+    self._worker.start()
+
+  def _work(self):
+    worker = threading.current_thread()
+    while True:
+      with self._condition:
+        if self._worker is not worker:
+          return
+        if self._index == len(self._entries):
+          self._worker = None
+          self._condition.notify_all()
+          return
+        entry = self._entries[self._index]
+        self._started = time.time()
+        self._condition.notify_all()
+      values, cost = self._read(entry)
+      with self._condition:
+        if self._worker is worker:
+          self.results.append((entry, values, cost))
+          self._index += 1
+          self._started = None
+          continue
+      self._on_late(entry, values, cost)
+      return
+
+  def run(self):
+    """
+      Read every entry, returning once each has either been read or timed out.  Afterwards
+      results holds (entry, values, cost) for the entries read and timed_out the others.
+    """
+    if not self._entries:
+      return self
+    with self._condition:
+      self._start_worker()
+      while self._worker is not None:
+        if self._started is None:
+          self._condition.wait()
+          continue
+        remaining = self._started + self._timeout - time.time()
+        if remaining > 0:
+          self._condition.wait(remaining)
+          continue
+        self.timed_out.append(self._entries[self._index])
+        self._index += 1
+        self._start_worker()
+    return self
+
+
+class _GaugeStats(NamedGauge, MetricProvider):
+  """
+    Exports <gauge>.cost_ms, the duration of the most recent read of each gauge of a
+    MetricSampler, and <gauge>.timeouts for the gauges whose reads have timed out.
+  """
+
+  def __init__(self, name, sampler):
+    self._sampler = sampler
+    NamedGauge.__init__(self, name)
+
+  def sample(self):
+    sample = dict(('%s.cost_ms' % name, 1000.0 * cost)
+                  for name, cost in self._sampler.costs().items())
+    sample.update(('%s.timeouts' % name, count)
+                  for name, count in self._sampler.timeouts().items())
+    return sample
+
+  def read(self):
+    return self.sample()
+
+
+class MetricSampler(SamplerBase, MetricProvider, Observable):
   """
     A thread that periodically samples from a MetricProvider and caches the
     samples.
+
+    The most recent samples are kept as versioned snapshots, identified by opaque tokens, so
+    that clients can ask for only the metrics that changed since a snapshot they have seen.
+
+    When the provider is a Metrics tree, the time taken to read each gauge is measured.  A
+    gauge that takes longer than gauge_budget is marked slow: from then on it is read on a
+    separate thread only every slow_cadence periods, and samples carry its last value, so one
+    slow gauge cannot hold up the others.  It is read inline again once a read fits the budget.
+
+    Gauges are read on a worker thread, and a read that has not returned within gauge_timeout
+    is abandoned: the gauge is counted as timed out, marked slow and skipped until that read
+    returns, so a hung gauge holds up neither the samples nor the other slow gauges.
+
+    The sampler exports its own sample_ms, overruns, timeouts and slow_gauges through
+    self.metrics, and the cost_ms and timeouts of each gauge under gauges.
   """
-  def __init__(self, provider, period=Amount(1, Time.SECONDS), clock=time):
+
+  DEFAULT_SNAPSHOTS = 16
+  DEFAULT_GAUGE_BUDGET = Amount(50, Time.MILLISECONDS)
+  DEFAULT_SLOW_CADENCE = 10
+  DEFAULT_GAUGE_TIMEOUT = Amount(5, Time.SECONDS)
+
+  def __init__(self, provider, period=Amount(1, Time.SECONDS), clock=time,
+               snapshots=DEFAULT_SNAPSHOTS, gauge_budget=DEFAULT_GAUGE_BUDGET,
+               slow_cadence=DEFAULT_SLOW_CADENCE, gauge_timeout=DEFAULT_GAUGE_TIMEOUT):
     self._provider = provider
-    self._last_sample = self._provider.sample()
-    self._lock = threading.Lock()
+    self._gauge_budget = gauge_budget.as_(Time.SECONDS) if gauge_budget is not None else None
+    self._gauge_timeout = gauge_timeout.as_(Time.SECONDS) if gauge_timeout is not None else None
+    self._slow_cadence = slow_cadence
+    self._costs = {}
+    self._timeouts = {}
+    self._hung = set()
+    self._slow = {}
+    self._slow_values = {}
+    self._slow_lock = threading.Lock()
+    self._slow_thread = None
+    self._sample_ms = self.metrics.register(MutatorGauge('sample_ms', 0))
+    self._overruns = self.metrics.register(AtomicGauge('overruns'))
+    self._timeout_count = self.metrics.register(AtomicGauge('timeouts'))
+    self.metrics.register(LambdaGauge('slow_gauges', lambda: len(self._slow)))
+    self.metrics.register(_GaugeStats('gauges', self))
     SamplerBase.__init__(self, period, clock)
     self.daemon = True
+    # Distinguishes tokens of this sampler from those of other (e.g. restarted) processes.
+    self._epoch = '%08x' % random.getrandbits(32)
+    self._snapshots = deque([(0, self._sample_provider())], maxlen=snapshots)
+    self._sorted = (None, [])
+    self._lock = threading.Lock()
 
   def sample(self):
     with self._lock:
-      return self._last_sample
+      return self._snapshots[-1][1]
+
+  def sorted_sample(self):
+    """
+      Return (names, sample) for the most recent sample, where names is the sorted list of its
+      metric names.  The names are sorted at most once per sample, on first use.
+    """
+    with self._lock:
+      version, sample = self._snapshots[-1]
+      if self._sorted[0] != version:
+        self._sorted = (version, sorted(sample))
+      return self._sorted[1], sample
+
+  def _token(self, version):
+    return '%s-%d' % (self._epoch, version)
+
+  def snapshot(self):
+    """
+      Return (token, sample) for the most recent sample.
+    """
+    with self._lock:
+      version, sample = self._snapshots[-1]
+    return self._token(version), sample
+
+  def delta(self, token):
+    """
+      Return (token, changed, removed) describing the most recent sample relative to the
+      snapshot identified by token: changed maps the metrics that are new or have a different
+      value to their values, and removed lists the metrics that no longer exist.
+
+      Returns None if token does not identify a snapshot that is still retained.
+    """
+    with self._lock:
+      snapshots = list(self._snapshots)
+    epoch, _, version = (token or '').partition('-')
+    if epoch != self._epoch:
+      return None
+    base = None
+    for snapshot_version, snapshot in snapshots:
+      if str(snapshot_version) == version:
+        base = snapshot
+        break
+    if base is None:
+      return None
+    current_version, current = snapshots[-1]
+    changed = dict((name, value) for name, value in current.items()
+                   if name not in base or base[name] != value)
+    removed = [name for name in base if name not in current]
+    return self._token(current_version), changed, removed
+
+  def costs(self):
+    """
+      Return a dict of the fully qualified name of each gauge to the time in seconds its most
+      recent read took.
+    """
+    with self._slow_lock:
+      return dict(self._costs)
+
+  def timeouts(self):
+    """
+      Return a dict of the fully qualified name of each gauge whose reads have timed out to the
+      number of times they did.
+    """
+    with self._slow_lock:
+      return dict(self._timeouts)
+
+  def slow_gauges(self):
+    """
+      Return the names of the gauges currently sampled off the sampling thread.
+    """
+    with self._slow_lock:
+      return sorted(self._slow)
+
+  def _read_gauge(self, name, gauge, is_provider):
+    start = self._clock.time()
+    try:
+      values = Metrics.sample_gauge(name, gauge, is_provider)
+    except Exception as e:
+      values = {}
+      if log:
+        log.error('Failed to sample %s: %s' % (name, e))
+    return values, self._clock.time() - start
+
+  def _read_gauges(self, entries):
+    """
+      Return (entry, values, cost) for each of entries that was read within gauge_timeout.
+    """
+    if self._gauge_timeout is None:
+      return [(entry,) + self._read_gauge(*entry) for entry in entries]
+    reads = _GaugeReads(entries, lambda entry: self._read_gauge(*entry), self._gauge_timeout,
+                        self._late_read).run()
+    for entry in reads.timed_out:
+      self._timed_out(entry)
+    return reads.results
+
+  def _timed_out(self, entry):
+    self._timeout_count.increment()
+    if log:
+      log.warning('Sampling %s timed out after %.1fms, skipping it until it returns.' % (
+          entry[0], 1000.0 * self._gauge_timeout))
+    with self._slow_lock:
+      self._timeouts[entry[0]] = self._timeouts.get(entry[0], 0) + 1
+      self._costs[entry[0]] = self._gauge_timeout
+      self._hung.add(entry[0])
+    self._mark_slow(entry)
+
+  def _late_read(self, entry, values, cost):
+    with self._slow_lock:
+      self._hung.discard(entry[0])
+      self._costs[entry[0]] = cost
+      if entry[0] in self._slow:
+        self._slow_values[entry[0]] = values
+
+  def _sample_provider(self):
+    flatten = getattr(self._provider, 'flatten', None)
+    if flatten is None or self._gauge_budget is None:
+      return self._provider.sample()
+    start = self._clock.time()
+    samples, entries, names = {}, [], set()
+    with self._slow_lock:
+      slow, slow_values = set(self._slow), dict(self._slow_values)
+    for entry in flatten():
+      names.add(entry[0])
+      if entry[0] in slow:
+        samples.update(slow_values.get(entry[0], {}))
+      else:
+        entries.append(entry)
+    for entry, values, cost in self._read_gauges(entries):
+      samples.update(values)
+      with self._slow_lock:
+        self._costs[entry[0]] = cost
+      if cost > self._gauge_budget:
+        self._overruns.increment()
+        if log:
+          log.warning('Sampling %s took %.1fms, reading it every %d periods from now on.' % (
+              entry[0], 1000.0 * cost, self._slow_cadence))
+        self._mark_slow(entry, values)
+    with self._slow_lock:
+      for name in [name for name in self._costs if name not in names]:
+        del self._costs[name]
+    self._sample_ms.write(1000.0 * (self._clock.time() - start))
+    return samples
+
+  def _mark_slow(self, entry, values=None):
+    with self._slow_lock:
+      self._slow[entry[0]] = entry
+      if values is not None:
+        self._slow_values[entry[0]] = values
+      if self._slow_thread is None:
+        self._slow_thread = ExceptionalThread(target=self._run_slow, name='MetricSampler-slow')
+        self._slow_thread.daemon = True
+        self._slow_thread.start()
+
+  def refresh_slow_gauges(self):
+    """
+      Read every slow gauge once, returning to inline sampling those that fit the budget.
+      Gauges whose last read has yet to return are skipped.
+    """
+    with self._slow_lock:
+      entries = [entry for name, entry in self._slow.items() if name not in self._hung]
+    for entry, values, cost in self._read_gauges(entries):
+      with self._slow_lock:
+        self._costs[entry[0]] = cost
+        self._slow_values[entry[0]] = values
+        if cost <= self._gauge_budget:
+          self._slow.pop(entry[0], None)
+          self._slow_values.pop(entry[0], None)
+      if cost > self._gauge_budget:
+        self._overruns.increment()
+
+  def _run_slow(self):
+    while True:
+      self._clock.sleep(self._slow_cadence * self._period.as_(Time.SECONDS))
+      if self.is_stopped():
+        break
+      self.refresh_slow_gauges()
 
   def iterate(self):
-    new_sample = self._provider.sample()
+    new_sample = self._sample_provider()
     with self._lock:
-      self._last_sample = new_sample
+      self._snapshots.append((self._snapshots[-1][0] + 1, new_sample))
 
 
 class DiskMetricWriter(SamplerBase):
   """
-    Takes a MetricProvider and periodically samples its values to disk in JSON format.
+    Takes a MetricProvider and periodically samples its values to disk in JSON format, or in
+    the more compact BinaryMetricFormat if binary is set.
+
+    Each sample is written to a temporary file that is then renamed over filename, so readers
+    never see a partially written file.
   """
 
-  def __init__(self, provider, filename, period=Amount(15, Time.SECONDS), clock=time):
+  def __init__(self, provider, filename, period=Amount(15, Time.SECONDS), clock=time,
+               binary=False):
     self._provider = provider
     self._filename = filename
+    self._format = BinaryMetricFormat() if binary else None
     SamplerBase.__init__(self, period, clock)
     self.daemon = True
 
   def iterate(self):
-    with open(self._filename, 'w') as fp:
-      json.dump(self._provider.sample(), fp)
+    sample = self._provider.sample()
+    dirname, basename = os.path.split(os.path.abspath(self._filename))
+    fd, tmp = tempfile.mkstemp(prefix='.%s.' % basename, dir=dirname)
+    try:
+      with os.fdopen(fd, 'wb' if self._format else 'w') as fp:
+        if self._format:
+          fp.write(self._format.encode(sample))
+        else:
+          json.dump(sample, fp)
+      os.chmod(tmp, 0o644)
+      os.rename(tmp, self._filename)
+    except BaseException:
+      try:
+        os.unlink(tmp)
+      except OSError:
+        pass
+      raise
 
 
 class DiskMetricReader(SamplerBase, MetricProvider):
   """
-    Given an input JSON file, periodically reads the contents from disk and exports it
-    using the MetricProvider interface.
+    Given an input file written by a DiskMetricWriter in either format, periodically reads the
+    contents from disk and exports it using the MetricProvider interface.  The file is only
+    re-read when its inode, size or modification time change.
   """
 
   def __init__(self, filename, period=Amount(15, Time.SECONDS), clock=time):
     self._filename = filename
     self._sample = {}
+    self._stat = None
+    self._format = BinaryMetricFormat()
     self._lock = threading.Lock()
     SamplerBase.__init__(self, period, clock)
     self.daemon = True
@@ -117,11 +456,27 @@ class DiskMetricReader(SamplerBase, MetricProvider):
     except (IOError, OSError):
       return 0
 
+  def _read(self, fp, size):
+    if size == 0:
+      raise ValueError('%s is empty' % self._filename)
+    data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      if BinaryMetricFormat.is_binary(data):
+        return self._format.decode(data)
+      return json.loads(data[:].decode('utf-8'))
+    finally:
+      data.close()
+
   def iterate(self):
     with self._lock:
       try:
-        with open(self._filename, 'r') as fp:
-          self._sample = json.load(fp)
+        with open(self._filename, 'rb') as fp:
+          st = os.fstat(fp.fileno())
+          stat = (st.st_ino, st.st_size, st.st_mtime)
+          if stat == self._stat:
+            return
+          self._sample = self._read(fp, st.st_size)
+          self._stat = stat
       except (IOError, OSError, ValueError) as e:
         if log:
           log.warn('Failed to collect sample: %s' % e)
@@ -0,0 +1,301 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""Metrics in a shared memory segment that other processes can read without cooperation.
+
+This is the counterpart of the JVM's hsperfdata (see twitter.common.java.perfdata): gauges
+created through a SharedMetricsSegment keep their values in an mmap'd file with a fixed layout,
+so an agent can sample them with a SharedMetricsReader at any rate without going through the
+serving process.
+
+Layout (little-endian):
+
+  header (64 bytes): magic 'TCSM', version (uint16), entry size (uint16), capacity (uint32),
+                     count (uint32), writer pid (uint32), creation time (float64)
+  entries:           capacity entries of entry size bytes: type (uint8), name length (uint8),
+                     6 bytes of padding, value (int64 or float64, 8-byte aligned), name
+
+Entries are immutable once allocated except for their values, and count is only incremented
+once an entry is complete, so readers need only parse entries they have not seen.  Values are
+written with single aligned 8-byte stores.  A segment has a single writing process.
+
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from twitter.common.lang import Compatibility
+
+from .gauge import AtomicGauge, MutatorGauge
+from .metrics import MetricProvider
+
+
+class SharedMetricsSegment(object):
+  class Error(Exception): pass
+  class Full(Error): pass
+  class InvalidSegment(Error): pass
+
+  MAGIC = b'TCSM'
+  VERSION = 1
+  HEADER = struct.Struct('<4sHHIIId')
+  HEADER_SIZE = 64
+  COUNT_OFFSET = 12
+  COUNT = struct.Struct('<I')
+  ENTRY = struct.Struct('<BB6x')
+  VALUE_OFFSET = 8
+  NAME_OFFSET = 16
+  ENTRY_SIZE = 128
+  MAXIMUM_NAME_LENGTH = ENTRY_SIZE - NAME_OFFSET
+
+  INTEGER, FLOAT = 1, 2
+  VALUES = {
+    INTEGER: struct.Struct('<q'),
+    FLOAT: struct.Struct('<d'),
+  }
+
+  DEFAULT_CAPACITY = 1024
+
+  class Slot(object):
+    def __init__(self, segment, offset, value_struct):
+      self._map = segment._map
+      self._offset = offset
+      self._struct = value_struct
+
+    def read(self):
+      return self._struct.unpack_from(self._map, self._offset)[0]
+
+    def write(self, value):
+      self._struct.pack_into(self._map, self._offset, value)
+
+  def __init__(self, filename, capacity=DEFAULT_CAPACITY):
+    """
+      Create the segment at filename with room for capacity metrics, replacing any existing one.
+    """
+    self._filename = filename
+    self._capacity = capacity
+    self._names = set()
+    self._lock = threading.Lock()
+    size = self.HEADER_SIZE + capacity * self.ENTRY_SIZE
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(prefix='.%s.' % basename, dir=dirname)
+    try:
+      os.ftruncate(fd, size)
+      self._map = mmap.mmap(fd, size, access=mmap.ACCESS_WRITE)
+      self.HEADER.pack_into(self._map, 0, self.MAGIC, self.VERSION, self.ENTRY_SIZE, capacity,
+          0, os.getpid(), time.time())
+      os.chmod(tmp, 0o644)
+      os.rename(tmp, filename)
+    except (IOError, OSError):
+      os.unlink(tmp)
+      raise
+    finally:
+      os.close(fd)
+
+  @property
+  def filename(self):
+    return self._filename
+
+  def allocate(self, name, kind, value=0):
+    """
+      Allocate an entry named name of kind INTEGER or FLOAT with initial value, and return its
+      Slot.
+
+      May raise:
+        SharedMetricsSegment.Full if the segment has no room left.
+        SharedMetricsSegment.Error if name is already allocated or too long.
+    """
+    encoded = name if isinstance(name, bytes) else name.encode('utf-8')
+    if len(encoded) > self.MAXIMUM_NAME_LENGTH:
+      raise self.Error('Name %r is longer than %d bytes.' % (name, self.MAXIMUM_NAME_LENGTH))
+    with self._lock:
+      if name in self._names:
+        raise self.Error('%s is already allocated.' % name)
+      count = self.COUNT.unpack_from(self._map, self.COUNT_OFFSET)[0]
+      if count == self._capacity:
+        raise self.Full('Segment %s is full (%d metrics.)' % (self._filename, self._capacity))
+      offset = self.HEADER_SIZE + count * self.ENTRY_SIZE
+      self.ENTRY.pack_into(self._map, offset, kind, len(encoded))
+      self._map[offset + self.NAME_OFFSET:offset + self.NAME_OFFSET + len(encoded)] = encoded
+      slot = self.Slot(self, offset + self.VALUE_OFFSET, self.VALUES[kind])
+      slot.write(value)
+      # Publish the entry only once it is complete.
+      self.COUNT.pack_into(self._map, self.COUNT_OFFSET, count + 1)
+      self._names.add(name)
+      return slot
+
+  @classmethod
+  def _scoped(cls, scope, name):
+    return '.'.join([scope, name]) if scope else name
+
+  def atomic_gauge(self, name, initial_value=0, scope=None):
+    """
+      Return a SharedAtomicGauge named name backed by this segment.  Pass the scope the gauge
+      is registered under, e.g. 'http', so that its entry has the same fully qualified name
+      as its sample, e.g. http.requests.
+    """
+    return SharedAtomicGauge(name, self, initial_value, shared_name=self._scoped(scope, name))
+
+  def mutator_gauge(self, name, value=0, scope=None):
+    """
+      Return a SharedMutatorGauge named name backed by this segment, as for atomic_gauge.
+    """
+    return SharedMutatorGauge(name, self, value, shared_name=self._scoped(scope, name))
+
+  def close(self):
+    """
+      Unmap the segment.  The file is left in place for readers; remove it with unlink().
+    """
+    self._map.close()
+
+  def unlink(self):
+    try:
+      os.unlink(self._filename)
+    except OSError:
+      pass
+
+
+class SharedAtomicGauge(AtomicGauge):
+  """
+    An AtomicGauge whose value lives in the SharedMetricsSegment entry shared_name (by default
+    the name of the gauge.)
+  """
+  def __init__(self, name, segment, initial_value=0, shared_name=None):
+    AtomicGauge.__init__(self, name, initial_value)
+    self._slot = segment.allocate(
+        shared_name or name, SharedMetricsSegment.INTEGER, initial_value)
+
+  def read(self):
+    return self._slot.read()
+
+  def write(self, value):
+    if not isinstance(value, Compatibility.integer):
+      raise TypeError('SharedAtomicGauge.write must be called with an integer.')
+    with self.lock():
+      self._slot.write(value)
+      return value
+
+  def add(self, delta):
+    if not isinstance(delta, Compatibility.integer):
+      raise TypeError('AtomicGauge.add must be called with an integer.')
+    with self.lock():
+      value = self._slot.read() + delta
+      self._slot.write(value)
+      return value
+
+
+class SharedMutatorGauge(MutatorGauge):
+  """
+    A numeric MutatorGauge whose value lives in the SharedMetricsSegment entry shared_name (by
+    default the name of the gauge.)  The entry is an integer if the initial value is one, and
+    a float otherwise.
+  """
+  def __init__(self, name, segment, value=0, shared_name=None):
+    if isinstance(value, bool) or not isinstance(value, Compatibility.numeric):
+      raise TypeError('SharedMutatorGauge values must be numbers, got %s' % type(value))
+    MutatorGauge.__init__(self, name, value)
+    self._integral = isinstance(value, Compatibility.integer)
+    kind = SharedMetricsSegment.INTEGER if self._integral else SharedMetricsSegment.FLOAT
+    self._slot = segment.allocate(shared_name or name, kind, value)
+
+  def read(self):
+    return self._slot.read()
+
+  def write(self, value):
+    if self._integral and not isinstance(value, Compatibility.integer):
+      raise TypeError('%s holds integers, got %s' % (self.name(), type(value)))
+    with self.lock():
+      self._slot.write(value)
+      return value
+
+
+class SharedMetricsReader(MetricProvider):
+  """
+    Read the metrics of a SharedMetricsSegment, possibly written by another process.  The file
+    is remapped if the writer replaces it, e.g. on restart.
+  """
+  def __init__(self, filename):
+    self._filename = filename
+    self._map = None
+    self._stat = None
+    self._entries = []
+    self._lock = threading.Lock()
+
+  def _remap(self):
+    st = os.stat(self._filename)
+    if self._map is not None and (st.st_ino, st.st_dev) == self._stat:
+      return
+    with open(self._filename, 'rb') as fp:
+      data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    segment = SharedMetricsSegment
+    try:
+      magic, version, entry_size, capacity, _, pid, created = segment.HEADER.unpack_from(data, 0)
+    except struct.error as e:
+      data.close()
+      raise segment.InvalidSegment('%s is not a metrics segment: %s' % (self._filename, e))
+    if (magic != segment.MAGIC or version != segment.VERSION or
+        entry_size != segment.ENTRY_SIZE or
+        len(data) < segment.HEADER_SIZE + capacity * entry_size):
+      data.close()
+      raise segment.InvalidSegment('%s is not a version %d metrics segment.' % (
+          self._filename, segment.VERSION))
+    if self._map is not None:
+      self._map.close()
+    self._map, self._stat, self._entries = data, (st.st_ino, st.st_dev), []
+    self._pid, self._created = pid, created
+
+  @property
+  def pid(self):
+    """
+      The pid of the process that created the segment.
+    """
+    with self._lock:
+      self._remap()
+      return self._pid
+
+  def sample(self):
+    """
+      Return a dict of metric name to value.
+
+      May raise:
+        OSError if the segment does not exist.
+        SharedMetricsSegment.InvalidSegment if it is not a metrics segment.
+    """
+    segment = SharedMetricsSegment
+    with self._lock:
+      self._remap()
+      data = self._map
+      count = segment.COUNT.unpack_from(data, segment.COUNT_OFFSET)[0]
+      for k in range(len(self._entries), count):
+        offset = segment.HEADER_SIZE + k * segment.ENTRY_SIZE
+        kind, length = segment.ENTRY.unpack_from(data, offset)
+        name_offset = offset + segment.NAME_OFFSET
+        name = data[name_offset:name_offset + length].decode('utf-8')
+        value_struct = segment.VALUES.get(kind)
+        if value_struct is None:
+          raise segment.InvalidSegment('Unknown type %d for %s' % (kind, name))
+        self._entries.append((name, offset + segment.VALUE_OFFSET, value_struct))
+      return dict((name, value_struct.unpack_from(data, value_offset)[0])
+                  for name, value_offset, value_struct in self._entries)
+
+  def close(self):
+    with self._lock:
+      if self._map is not None:
+        self._map.close()
+        self._map = None
@@ -0,0 +1,130 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import threading
+import time
+
+from twitter.common.quantity import Amount, Time
+
+from .gauge import NamedGauge
+from .metrics import MetricProvider
+
+
+class _Ring(object):
+  """
+    A fixed ring of buckets covering one window.  Bucket k holds the events recorded during
+    tick epochs[k], where ticks are window / len(buckets) seconds long.
+  """
+  def __init__(self, window, buckets):
+    self.window = window
+    self.seconds = float(window.as_(Time.SECONDS))
+    self.tick = self.seconds / buckets
+    self.epochs = [None] * buckets
+    self.counts = [0] * buckets
+    self.sums = [0] * buckets
+    self.maxes = [None] * buckets
+
+  def record(self, now, value, count):
+    epoch = int(now / self.tick)
+    slot = epoch % len(self.epochs)
+    if self.epochs[slot] != epoch:
+      self.epochs[slot] = epoch
+      self.counts[slot], self.sums[slot], self.maxes[slot] = 0, 0, None
+    self.counts[slot] += count
+    self.sums[slot] += value * count
+    if self.maxes[slot] is None or value > self.maxes[slot]:
+      self.maxes[slot] = value
+
+  def read(self, now):
+    oldest = int(now / self.tick) - len(self.epochs)
+    count, total, maximum = 0, 0, None
+    for slot, epoch in enumerate(self.epochs):
+      if epoch is None or epoch <= oldest:
+        continue
+      count += self.counts[slot]
+      total += self.sums[slot]
+      if maximum is None or self.maxes[slot] > maximum:
+        maximum = self.maxes[slot]
+    return count, total, maximum
+
+
+class WindowedStats(NamedGauge, MetricProvider):
+  """
+    The count, sum, average, maximum and rate of recorded values over one or more sliding
+    windows, e.g. request latencies over the last 1, 5 and 15 minutes.
+
+    Each window is a ring of a fixed number of buckets, so record() is constant time, sampling
+    costs the same however many values were recorded, and memory does not grow.  Values age out
+    of a window a bucket (window / buckets) at a time.
+
+    When registered with Metrics, WindowedStats samples as <name>.<window>.count, .sum, .avg,
+    .max and .rate (the number of values recorded per second), where <window> is e.g. 5mins.
+  """
+
+  DEFAULT_WINDOWS = (
+    Amount(1, Time.MINUTES),
+    Amount(5, Time.MINUTES),
+    Amount(15, Time.MINUTES),
+  )
+  DEFAULT_BUCKETS = 60
+
+  def __init__(self, name, windows=DEFAULT_WINDOWS, buckets=DEFAULT_BUCKETS, clock=time):
+    if not windows:
+      raise ValueError('WindowedStats must have at least one window.')
+    if buckets < 1:
+      raise ValueError('WindowedStats buckets must be positive, got %r' % buckets)
+    NamedGauge.__init__(self, name)
+    self._clock = clock
+    self._lock = threading.Lock()
+    self._rings = [_Ring(window, buckets) for window in windows]
+
+  def record(self, value, count=1):
+    """
+      Record count occurrences of the number value.
+    """
+    now = self._clock.time()
+    with self._lock:
+      for ring in self._rings:
+        ring.record(now, value, count)
+
+  def window(self, window):
+    """
+      Return (count, sum, max) for the window (one of the Amounts this was constructed with.)
+      max is None if nothing was recorded during the window.
+    """
+    now = self._clock.time()
+    for ring in self._rings:
+      if ring.window == window:
+        with self._lock:
+          return ring.read(now)
+    raise ValueError('No such window: %s' % window)
+
+  def sample(self):
+    now = self._clock.time()
+    with self._lock:
+      reads = [(ring, ring.read(now)) for ring in self._rings]
+    sample = {}
+    for ring, (count, total, maximum) in reads:
+      prefix = '%s%s.' % (ring.window.amount(), ring.window.unit())
+      sample[prefix + 'count'] = count
+      sample[prefix + 'sum'] = total
+      sample[prefix + 'avg'] = float(total) / count if count else 0
+      sample[prefix + 'max'] = 0 if maximum is None else maximum
+      sample[prefix + 'rate'] = count / ring.seconds
+    return sample
+
+  def read(self):
+    return self.sample()
@@ -17,11 +17,31 @@
 __author__ = 'Brian Wickman'
 
 from .recordio import *
+from .async_writer import AsyncRecordWriter
+from .block_recordio import BlockFraming, BlockRecordWriter
+from .checked_recordio import CheckedRecordIO, CheckedRecordReader, CheckedRecordWriter
+from .cursor import CheckpointedRecordReader, RecordCursor
+from .mmap_recordio import MmapRecordReader, RecordIndex
+from .parallel import ParallelRecordScanner
+from .segmented import Segment, SegmentedRecordLog
 
 __all__ = [
+  'AsyncRecordWriter',
+  'BlockFraming',
+  'BlockRecordWriter',
+  'CheckedRecordIO',
+  'CheckedRecordReader',
+  'CheckedRecordWriter',
+  'CheckpointedRecordReader',
+  'MmapRecordReader',
+  'ParallelRecordScanner',
+  'RecordCursor',
+  'RecordIndex',
   'RecordIO',
   'RecordWriter',
   'RecordReader',
+  'Segment',
+  'SegmentedRecordLog',
 ]
 
 try:
@@ -0,0 +1,199 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""Write RecordIO streams from a background thread.
+
+An AsyncRecordWriter accepts records into a bounded in-memory queue and hands them to a
+RecordIO.Writer in batches from a background thread, so that a stalled disk does not show up in
+the latency of the threads producing records.  When the queue is full, the backpressure policy
+decides whether write() blocks, drops the oldest queued record, or fails.
+
+The writer is Observable and exports its queue depth, write latency, and written, dropped and
+failed record counts through twitter.common.metrics.
+
+"""
+
+from collections import deque
+import threading
+import time
+
+from twitter.common import log
+from twitter.common.exceptions import ExceptionalThread
+from twitter.common.metrics import AtomicGauge, LambdaGauge, MutatorGauge, Observable
+
+from .recordio import RecordIO
+
+
+class AsyncRecordWriter(Observable):
+  class Error(RecordIO.Error): pass
+  class QueueFull(Error): pass
+  class Closed(Error): pass
+
+  BLOCK, DROP_OLDEST, FAIL = 'block', 'drop_oldest', 'fail'
+  POLICIES = frozenset([BLOCK, DROP_OLDEST, FAIL])
+
+  DEFAULT_MAX_QUEUE = 4096
+  DEFAULT_MAX_BATCH = 1024
+
+  def __init__(self, writer, max_queue=DEFAULT_MAX_QUEUE, policy=BLOCK,
+               max_batch=DEFAULT_MAX_BATCH, clock=time):
+    """
+      Construct an AsyncRecordWriter that writes records through the RecordIO.Writer writer,
+      which is owned by the background thread from then on.
+
+        max_queue: the maximum number of records queued but not yet written.
+        policy: what write() does when the queue is full: AsyncRecordWriter.BLOCK waits for
+          space, DROP_OLDEST discards the oldest queued record, and FAIL raises QueueFull.
+        max_batch: the maximum number of records handed to writer.write_many at once.
+    """
+    if not isinstance(writer, RecordIO.Writer):
+      raise RecordIO.InvalidArgument('writer must be a RecordIO.Writer, got %s' % type(writer))
+    if policy not in self.POLICIES:
+      raise RecordIO.InvalidArgument('Unknown policy %r, expected one of %s' % (
+          policy, ', '.join(sorted(self.POLICIES))))
+    if max_queue < 1 or max_batch < 1:
+      raise RecordIO.InvalidArgument('max_queue and max_batch must be positive.')
+    self._writer = writer
+    self._max_queue = max_queue
+    self._policy = policy
+    self._max_batch = max_batch
+    self._clock = clock
+    self._queue = deque()
+    self._in_flight = 0
+    self._closed = False
+    self._exited = False
+    self._condition = threading.Condition()
+    self._init_metrics()
+    self._thread = ExceptionalThread(target=self._run, name='AsyncRecordWriter')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _init_metrics(self):
+    self._written = self.metrics.register(AtomicGauge('written'))
+    self._dropped = self.metrics.register(AtomicGauge('dropped'))
+    self._failed = self.metrics.register(AtomicGauge('failed'))
+    self._write_latency = self.metrics.register(MutatorGauge('write_latency_ms', 0))
+    self.metrics.register(LambdaGauge('queue_depth', lambda: len(self._queue)))
+
+  @property
+  def pending(self):
+    """
+      The number of records accepted but not yet written.
+    """
+    with self._condition:
+      return len(self._queue) + self._in_flight
+
+  def write(self, record, timeout=None):
+    """
+      Queue a record to be written.  If the queue is full, behave according to the policy.
+      Under the BLOCK policy, wait at most timeout seconds (forever if None) for space.
+
+      Returns True if the record was queued.
+
+      May raise:
+        AsyncRecordWriter.QueueFull if the queue is full under the FAIL policy, or if the
+          timeout expires under the BLOCK policy.
+        AsyncRecordWriter.Closed if the writer has been closed.
+    """
+    with self._condition:
+      if self._closed or self._exited:
+        raise self.Closed('Cannot write to a closed AsyncRecordWriter.')
+      if len(self._queue) >= self._max_queue:
+        if self._policy == self.FAIL:
+          raise self.QueueFull('Queue of %d records is full.' % self._max_queue)
+        elif self._policy == self.DROP_OLDEST:
+          self._queue.popleft()
+          self._dropped.increment()
+        else:
+          deadline = None if timeout is None else self._clock.time() + timeout
+          while len(self._queue) >= self._max_queue and not self._closed:
+            if self._exited or not self._thread.is_alive():
+              raise self.Closed('AsyncRecordWriter thread exited while waiting to write.')
+            remaining = None if deadline is None else deadline - self._clock.time()
+            if remaining is not None and remaining <= 0:
+              raise self.QueueFull('Timed out waiting for space in the queue.')
+            self._condition.wait(remaining)
+          if self._closed:
+            raise self.Closed('AsyncRecordWriter closed while waiting to write.')
+      self._queue.append(record)
+      self._condition.notify_all()
+      return True
+
+  def flush(self, timeout=None):
+    """
+      Wait at most timeout seconds (forever if None) for every queued record to be written.
+
+      Returns True if the queue drained in time.
+    """
+    deadline = None if timeout is None else self._clock.time() + timeout
+    with self._condition:
+      while self._queue or self._in_flight:
+        if self._exited or not self._thread.is_alive():
+          return False
+        remaining = None if deadline is None else deadline - self._clock.time()
+        if remaining is not None and remaining <= 0:
+          return False
+        self._condition.wait(remaining)
+      return True
+
+  def close(self, timeout=None):
+    """
+      Stop accepting records, wait at most timeout seconds (forever if None) for queued records
+      to be written, and close the underlying writer.
+
+      Returns True if every queued record was written before closing.
+    """
+    with self._condition:
+      self._closed = True
+      self._condition.notify_all()
+    self._thread.join(timeout)
+    return not self._thread.is_alive() and not self._queue
+
+  def _next_batch(self):
+    with self._condition:
+      while not self._queue and not self._closed:
+        self._condition.wait()
+      batch = [self._queue.popleft() for _ in range(min(len(self._queue), self._max_batch))]
+      self._in_flight = len(batch)
+      self._condition.notify_all()
+      return batch
+
+  def _run(self):
+    try:
+      while True:
+        batch = self._next_batch()
+        if not batch:
+          break
+        start = self._clock.time()
+        try:
+          written = self._writer.write_many(batch)
+        except RecordIO.Error as e:
+          log.error('Failed to write batch of %d records: %s' % (len(batch), e))
+          written = False
+        self._write_latency.write(1000.0 * (self._clock.time() - start))
+        if written:
+          self._written.add(len(batch))
+        else:
+          self._failed.add(len(batch))
+        with self._condition:
+          self._in_flight = 0
+          self._condition.notify_all()
+    finally:
+      with self._condition:
+        # Wake up producers blocked on a full queue and flushers, should this thread die.
+        self._exited = True
+        self._condition.notify_all()
+      self._writer.close()
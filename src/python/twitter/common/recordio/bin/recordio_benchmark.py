@@ -0,0 +1,112 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""Compare the size and throughput of plain and block-compressed RecordIO framing."""
+
+from __future__ import print_function
+
+import os
+import random
+import time
+
+from twitter.common import app
+from twitter.common.contextutil import temporary_dir
+from twitter.common.recordio import (
+    BlockFraming,
+    BlockRecordWriter,
+    RecordReader,
+    RecordWriter,
+    StringCodec)
+
+
+app.add_option(
+    '--records',
+    dest='records',
+    default=100000,
+    type=int,
+    help='Number of records to write and read.')
+
+
+app.add_option(
+    '--record_size',
+    dest='record_size',
+    default=256,
+    type=int,
+    help='Size of each record in bytes.')
+
+
+app.add_option(
+    '--vocabulary',
+    dest='vocabulary',
+    default=16,
+    type=int,
+    help='Number of distinct words records are built from; lower is more compressible.')
+
+
+def generate_records(count, size, vocabulary):
+  words = ['word%d' % k for k in range(vocabulary)]
+  records = []
+  for _ in range(count):
+    record = []
+    while sum(map(len, record)) < size:
+      record.append(random.choice(words))
+    records.append(' '.join(record)[:size])
+  return records
+
+
+def write_plain(filename, records):
+  with open(filename, 'w') as fp:
+    writer = RecordWriter(fp)
+    for record in records:
+      writer.write(record)
+
+
+def write_block(compression):
+  def writer(filename, records):
+    with open(filename, 'w') as fp:
+      writer = BlockRecordWriter(fp, StringCodec(), compression=compression)
+      for record in records:
+        writer.write(record)
+      writer.close()
+  return writer
+
+
+def read_all(filename):
+  with open(filename) as fp:
+    return sum(1 for _ in RecordReader(fp))
+
+
+def benchmark(name, write, filename, records):
+  start = time.time()
+  write(filename, records)
+  write_secs = time.time() - start
+  start = time.time()
+  assert read_all(filename) == len(records)
+  read_secs = time.time() - start
+  print('%-10s %12d %14.0f %14.0f' % (
+      name, os.path.getsize(filename), len(records) / write_secs, len(records) / read_secs))
+
+
+def main(args, options):
+  records = generate_records(options.records, options.record_size, options.vocabulary)
+  print('%-10s %12s %14s %14s' % ('framing', 'bytes', 'writes/sec', 'reads/sec'))
+  with temporary_dir() as td:
+    benchmark('plain', write_plain, os.path.join(td, 'plain'), records)
+    for compression in sorted(BlockFraming.COMPRESSION):
+      benchmark(compression, write_block(compression), os.path.join(td, compression), records)
+
+
+app.main()
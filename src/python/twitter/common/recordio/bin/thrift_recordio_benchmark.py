@@ -0,0 +1,139 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""Measure ThriftRecordIO decode throughput, record-at-a-time versus batched.
+
+With no arguments, a file of --records BenchmarkRecord structs is generated and decoded.
+Otherwise decode the given ThriftRecordIO file of --thrift_class structs.
+"""
+
+from __future__ import print_function
+
+import importlib
+import os
+import time
+
+from thrift.Thrift import TType
+from thrift.protocol.TBase import TBase
+
+from twitter.common import app
+from twitter.common.contextutil import temporary_dir
+from twitter.common.recordio import RecordIO
+from twitter.common.recordio.thrift_recordio import ThriftRecordIO
+
+
+app.add_option(
+    '--thrift_class',
+    dest='thrift_class',
+    default=None,
+    help='Fully qualified name of the Thrift struct stored in the file, e.g. '
+         'my.service.ttypes.Checkpoint.')
+
+
+app.add_option(
+    '--records',
+    dest='records',
+    default=1000000,
+    type=int,
+    help='Number of records to generate when no file is supplied.')
+
+
+app.add_option(
+    '--batch_size',
+    dest='batch_size',
+    default=1024,
+    type=int,
+    help='Number of records to decode per batch.')
+
+
+class BenchmarkRecord(TBase):
+  """A Thrift struct, shaped like generated code, for the records of the generated file."""
+
+  thrift_spec = (
+    None,
+    (1, TType.I64, 'id', None, None),
+    (2, TType.STRING, 'name', None, None),
+    (3, TType.DOUBLE, 'value', None, None),
+    (4, TType.LIST, 'tags', (TType.STRING, None), None),
+  )
+
+  def __init__(self, id=None, name=None, value=None, tags=None):
+    self.id = id
+    self.name = name
+    self.value = value
+    self.tags = tags
+
+
+def generate(filename, count):
+  codec = ThriftRecordIO.ThriftCodec(BenchmarkRecord)
+  with open(filename, 'w') as fp:
+    writer = RecordIO.Writer(fp, codec)
+    for k in range(count):
+      writer.write(BenchmarkRecord(
+          id=k, name='record-%d' % k, value=k / 3.0, tags=['tag%d' % (k % 7), 'benchmark']))
+
+
+def load_class(name):
+  module, _, cls = name.rpartition('.')
+  return getattr(importlib.import_module(module), cls)
+
+
+def decode_each(filename, codec, batch_size):
+  with open(filename) as fp:
+    return sum(1 for _ in RecordIO.Reader(fp, codec))
+
+
+def decode_batched(filename, codec, batch_size):
+  count = 0
+  with open(filename) as fp:
+    reader = RecordIO.Reader(fp, codec)
+    while True:
+      records = reader.read_many(batch_size)
+      if not records:
+        return count
+      count += len(records)
+
+
+def benchmark(filename, thrift_class, batch_size):
+  print('%-12s %-8s %10s %14s' % ('protocol', 'mode', 'records', 'records/sec'))
+  for accelerated in (False, True):
+    codec = ThriftRecordIO.ThriftCodec(thrift_class, accelerated=accelerated)
+    for mode, decode in (('each', decode_each), ('batched', decode_batched)):
+      start = time.time()
+      count = decode(filename, codec, batch_size)
+      elapsed = time.time() - start
+      print('%-12s %-8s %10d %14.0f' % (
+          'accelerated' if accelerated else 'python', mode, count, count / elapsed))
+
+
+def main(args, options):
+  if len(args) > 1:
+    app.error('Supply at most one ThriftRecordIO file.')
+  if args:
+    if not options.thrift_class:
+      app.error('Must supply --thrift_class with a file.')
+    benchmark(args[0], load_class(options.thrift_class), options.batch_size)
+    return
+  with temporary_dir() as td:
+    filename = os.path.join(td, 'records')
+    start = time.time()
+    generate(filename, options.records)
+    print('Generated %d records (%d bytes) in %.1fs.' % (
+        options.records, os.path.getsize(filename), time.time() - start))
+    benchmark(filename, BenchmarkRecord, options.batch_size)
+
+
+app.main()
@@ -0,0 +1,334 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""Block-compressed RecordIO containers.
+
+A block-compressed stream starts with a file header (BlockFraming.MAGIC followed by a version
+byte) and is followed by a sequence of blocks.  Each block has a fixed header
+
+  compression (1 byte) | record count (4) | uncompressed length (4) | compressed length (4)
+
+followed by the compressed concatenation of ordinary RecordIO frames.  Interpreted as an ordinary
+RecordIO header, the magic would exceed RecordIO.MAXIMUM_RECORD_SIZE, so the two framings cannot
+be confused.
+
+FileLike.get transparently wraps block-compressed streams in a BlockFileLike, which presents the
+decompressed frames to RecordIO.Reader, so existing readers (e.g. StringRecordReader and
+ThriftRecordReader) need no changes.  Use BlockRecordWriter to produce block-compressed streams.
+
+"""
+
+import bz2
+import os
+import struct
+import zlib
+
+from .filelike import FileLike
+from .recordio import RecordIO
+
+
+class BlockFraming(object):
+  class Error(RecordIO.Error): pass
+  class CorruptBlock(Error): pass
+  class UnknownCompression(Error): pass
+
+  MAGIC = b'\x89RBK'
+  VERSION = 1
+  FILE_HEADER = struct.Struct('>4sB')
+  BLOCK_HEADER = struct.Struct('>BLLL')
+
+  # Large enough for a block holding a single maximum-size record.
+  MAXIMUM_BLOCK_SIZE = RecordIO.MAXIMUM_RECORD_SIZE + RecordIO.RECORD_HEADER_SIZE
+
+  NONE, ZLIB, BZ2 = 0, 1, 2
+  COMPRESSION = {
+    'none': NONE,
+    'zlib': ZLIB,
+    'bz2': BZ2,
+  }
+
+  @classmethod
+  def compress(cls, compression, data, level=6):
+    if compression == cls.NONE:
+      return data
+    elif compression == cls.ZLIB:
+      return zlib.compress(data, level)
+    elif compression == cls.BZ2:
+      return bz2.compress(data, max(1, level))
+    raise cls.UnknownCompression('Unknown compression type %d' % compression)
+
+  @classmethod
+  def decompress(cls, compression, data):
+    try:
+      if compression == cls.NONE:
+        return data
+      elif compression == cls.ZLIB:
+        return zlib.decompress(data)
+      elif compression == cls.BZ2:
+        return bz2.decompress(data)
+    except (IOError, zlib.error) as e:
+      raise cls.CorruptBlock('Failed to decompress block: %s' % e)
+    raise cls.UnknownCompression('Unknown compression type %d' % compression)
+
+  @classmethod
+  def file_header(cls):
+    return cls.FILE_HEADER.pack(cls.MAGIC, cls.VERSION)
+
+  @classmethod
+  def encode_block(cls, frames, compression=ZLIB, level=6):
+    """
+      Given a list of encoded RecordIO frames, return a compressed block containing them.  If
+      compression would make the block exceed MAXIMUM_BLOCK_SIZE, it is stored uncompressed.
+    """
+    raw = b''.join(frames)
+    if len(raw) > cls.MAXIMUM_BLOCK_SIZE:
+      raise RecordIO.RecordSizeExceeded('Block of %d bytes exceeds maximum allowable size' %
+          len(raw))
+    data = cls.compress(compression, raw, level)
+    if len(data) > cls.MAXIMUM_BLOCK_SIZE:
+      compression, data = cls.NONE, raw
+    return cls.BLOCK_HEADER.pack(compression, len(frames), len(raw), len(data)) + data
+
+  @classmethod
+  def encode_blocks(cls, frames, compression=ZLIB, level=6):
+    """
+      Given a list of encoded RecordIO frames, return a list of compressed blocks containing
+      them, splitting them so that no block exceeds MAXIMUM_BLOCK_SIZE uncompressed bytes.
+    """
+    blocks, batch, batch_size = [], [], 0
+    for frame in frames:
+      if batch and batch_size + len(frame) > cls.MAXIMUM_BLOCK_SIZE:
+        blocks.append(cls.encode_block(batch, compression, level))
+        batch, batch_size = [], 0
+      batch.append(frame)
+      batch_size += len(frame)
+    if batch:
+      blocks.append(cls.encode_block(batch, compression, level))
+    return blocks
+
+
+class BlockFileLike(FileLike):
+  """
+    A read-only FileLike that presents the frames of a block-compressed stream as an ordinary
+    RecordIO stream.
+
+    Positions returned by tell() are opaque tokens encoding (block offset, offset within block)
+    that are only meaningful to seek() on the same stream.  Incomplete trailing blocks are
+    treated as not-yet-available data, as with incomplete frames in tailed RecordIO files.
+  """
+
+  POSITION_BITS = 32
+  POSITION_MASK = (1 << POSITION_BITS) - 1
+
+  @classmethod
+  def detect(cls, fp):
+    """
+      Return True if the FileLike fp is positioned at the start of a block-compressed stream.
+      The position of fp is unchanged.
+    """
+    try:
+      if fp.tell() != 0:
+        return False
+      try:
+        return fp.read(len(BlockFraming.MAGIC)) == BlockFraming.MAGIC
+      finally:
+        fp.seek(0)
+    except (IOError, OSError):
+      return False
+
+  def __init__(self, fp):
+    """
+      Wrap the FileLike fp, which must be positioned at the start of a block-compressed stream.
+    """
+    self._fp = fp
+    self._block_start = self._next_block = fp.tell()
+    self._buffer = b''
+    self._pos = 0
+
+  @property
+  def raw(self):
+    """
+      The underlying (compressed) FileLike.
+    """
+    return self._fp
+
+  @property
+  def mode(self):
+    return self._fp.mode
+
+  @property
+  def name(self):
+    return self._fp.name
+
+  def dup(self):
+    return BlockFileLike(self._fp.dup())
+
+  def _read_block_header(self):
+    """
+      Read the header of the block at the current underlying position.  Returns None if no
+      complete header is available.
+    """
+    if self._fp.tell() == 0:
+      header = self._fp.read(BlockFraming.FILE_HEADER.size)
+      if len(header) != BlockFraming.FILE_HEADER.size:
+        return None
+      magic, version = BlockFraming.FILE_HEADER.unpack(header)
+      if magic != BlockFraming.MAGIC or version != BlockFraming.VERSION:
+        raise BlockFraming.CorruptBlock('%s is not a version %d block stream' % (
+            self.name, BlockFraming.VERSION))
+    header = self._fp.read(BlockFraming.BLOCK_HEADER.size)
+    if len(header) != BlockFraming.BLOCK_HEADER.size:
+      return None
+    return BlockFraming.BLOCK_HEADER.unpack(header)
+
+  def _load(self, offset):
+    """
+      Load the block at the given underlying offset.  Returns False (leaving the stream
+      positioned at offset) if the block is not yet complete.
+    """
+    self._fp.seek(offset)
+    header = self._read_block_header()
+    if header is None:
+      self._fp.seek(offset)
+      return False
+    compression, _, raw_length, compressed_length = header
+    if max(raw_length, compressed_length) > BlockFraming.MAXIMUM_BLOCK_SIZE:
+      raise BlockFraming.CorruptBlock('Block at offset %d exceeds maximum size' % offset)
+    data = self._fp.read(compressed_length)
+    if len(data) != compressed_length:
+      self._fp.seek(offset)
+      return False
+    raw = BlockFraming.decompress(compression, data)
+    if len(raw) != raw_length:
+      raise BlockFraming.CorruptBlock('Block at offset %d decompressed to %d bytes, expected %d' %
+          (offset, len(raw), raw_length))
+    self._block_start, self._next_block = offset, self._fp.tell()
+    self._buffer, self._pos = raw, 0
+    return True
+
+  def read(self, length):
+    chunks = []
+    while length > 0:
+      if self._pos == len(self._buffer) and not self._load(self._next_block):
+        break
+      chunk = self._buffer[self._pos:self._pos + length]
+      self._pos += len(chunk)
+      length -= len(chunk)
+      chunks.append(chunk)
+    return b''.join(chunks)
+
+  def readinto(self, buf):
+    view = memoryview(buf)
+    filled = 0
+    while filled < len(view):
+      if self._pos == len(self._buffer) and not self._load(self._next_block):
+        break
+      count = min(len(view) - filled, len(self._buffer) - self._pos)
+      view[filled:filled + count] = self._buffer[self._pos:self._pos + count]
+      self._pos += count
+      filled += count
+    return filled
+
+  def skip_records(self, count):
+    """
+      Skip whole blocks, without decompressing them, while they contain no more than count
+      records.  Only applies at block boundaries.  Returns the number of records skipped.
+    """
+    skipped = 0
+    if self._pos != len(self._buffer):
+      return skipped
+    while True:
+      offset = self._next_block
+      self._fp.seek(offset)
+      header = self._read_block_header()
+      if header is None or skipped + header[1] > count:
+        self._fp.seek(offset)
+        return skipped
+      _, records, _, compressed_length = header
+      end = self._fp.tell() + compressed_length
+      self._fp.seek(0, os.SEEK_END)
+      if self._fp.tell() < end:
+        self._fp.seek(offset)
+        return skipped
+      self._fp.seek(end)
+      self._block_start = self._next_block = end
+      self._buffer, self._pos = b'', 0
+      skipped += records
+
+  def write(self, data):
+    raise IOError('Block-compressed streams must be written with a BlockRecordWriter.')
+
+  def tell(self):
+    return (self._block_start << self.POSITION_BITS) | self._pos
+
+  def seek(self, dest, whence=os.SEEK_SET):
+    if whence == os.SEEK_END:
+      self._fp.seek(dest, os.SEEK_END)
+      self._block_start = self._next_block = self._fp.tell()
+      self._buffer, self._pos = b'', 0
+      return
+    elif whence != os.SEEK_SET:
+      raise IOError('Block-compressed streams only support absolute seeks.')
+    block_start, pos = dest >> self.POSITION_BITS, dest & self.POSITION_MASK
+    if block_start != self._block_start or (pos and not self._buffer):
+      self._block_start = self._next_block = block_start
+      self._buffer, self._pos = b'', 0
+      self._fp.seek(block_start)
+      if pos and not self._load(block_start):
+        raise IOError('Cannot seek into incomplete block at offset %d' % block_start)
+    self._pos = pos
+
+  def close(self):
+    return self._fp.close()
+
+  def flush(self):
+    return self._fp.flush()
+
+
+class BlockRecordWriter(RecordIO.BatchedWriter):
+  """
+    Write records into a block-compressed stream.
+
+    Each commit of the underlying BatchedWriter becomes one compressed block (or several, if
+    it exceeds BlockFraming.MAXIMUM_BLOCK_SIZE), so max_records, max_bytes and max_delay
+    control the block size.  Blocks are only ever appended, so
+    BlockRecordWriters may be used on existing block-compressed streams.
+  """
+
+  DEFAULT_MAX_BYTES = 64 * 1024
+
+  def __init__(self, fp, codec, compression='zlib', level=6, max_bytes=DEFAULT_MAX_BYTES, **kw):
+    """
+      Initialize a BlockRecordWriter from the FileLike fp, with RecordIO.Codec codec.
+
+      compression is one of the keys of BlockFraming.COMPRESSION.  Other keyword arguments are
+      as for RecordIO.BatchedWriter.
+    """
+    if compression not in BlockFraming.COMPRESSION:
+      raise RecordIO.InvalidArgument('Unknown compression %r, expected one of %s' % (
+          compression, ', '.join(sorted(BlockFraming.COMPRESSION))))
+    RecordIO.BatchedWriter.__init__(self, fp, codec, max_bytes=max_bytes, **kw)
+    if isinstance(self._fp, BlockFileLike):
+      self._fp = self._fp.raw
+    self._compression = BlockFraming.COMPRESSION[compression]
+    self._level = level
+    self._fp.seek(0, os.SEEK_END)
+    if self._fp.tell() == 0:
+      self._fp.write(BlockFraming.file_header())
+
+  def _write_frames(self, frames):
+    blocks = BlockFraming.encode_blocks(frames, self._compression, self._level)
+    return RecordIO.Writer.do_write_frames(self._fp, blocks, sync=self._sync)
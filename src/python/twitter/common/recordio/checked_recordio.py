@@ -0,0 +1,269 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""Checksummed RecordIO framing that recovers from corruption.
+
+Each checked frame carries a sync marker and checksums:
+
+  sync marker (4) | length (4) | payload crc32 (4) | header crc32 (4) | payload
+
+The header checksum covers the length and payload checksum, so a corrupt length is detected
+before any buffer is allocated for the payload.  When a CheckedRecordReader finds a corrupt
+frame, it scans forward in bounded chunks for the next sync marker and resumes from there,
+counting the frames and bytes it skipped.
+
+"""
+
+import struct
+import zlib
+
+from twitter.common import log
+
+from .recordio import RecordIO
+
+
+class CheckedRecordIO(object):
+  SYNC = b'\xc3RIO'
+  HEADER = struct.Struct('>4sLLL')
+  SCAN_CHUNK_SIZE = 64 * 1024
+
+  @staticmethod
+  def crc32(data):
+    return zlib.crc32(data) & 0xFFFFFFFF
+
+  @classmethod
+  def valid_header(cls, header):
+    sync, blob_len, _, header_crc = cls.HEADER.unpack(header)
+    return (sync == cls.SYNC and cls.crc32(header[4:12]) == header_crc and
+            blob_len <= RecordIO.MAXIMUM_RECORD_SIZE)
+
+  @classmethod
+  def find_header(cls, data):
+    """
+      Return the offset of the first complete, valid frame header in data, or -1.
+    """
+    index = data.find(cls.SYNC)
+    while 0 <= index <= len(data) - cls.HEADER.size:
+      if cls.valid_header(data[index:index + cls.HEADER.size]):
+        return index
+      index = data.find(cls.SYNC, index + 1)
+    return -1
+
+  @classmethod
+  def encode_frame(cls, record, codec):
+    """
+      Encode a record using the supplied codec and return the checked frame bytes.
+    """
+    blob = codec.encode(record)
+    lengths = struct.pack('>LL', len(blob), cls.crc32(blob))
+    return cls.SYNC + lengths + struct.pack('>L', cls.crc32(lengths)) + blob
+
+
+class CheckedRecordWriter(RecordIO.Writer):
+  """
+    A RecordIO.Writer that writes checked frames.
+  """
+
+  encode_frame = staticmethod(CheckedRecordIO.encode_frame)
+
+  def write(self, blob):
+    """
+      Append the blob to the current CheckedRecordWriter with a single write.
+
+      Returns True on success, False on any filesystem failure.
+    """
+    return RecordIO.Writer.do_write_frames(
+        self._fp, [self.encode_frame(blob, self._codec)], sync=self._sync)
+
+
+class CheckedRecordReader(RecordIO.Reader):
+  """
+    A RecordIO.Reader of checked frames that skips over corrupt data.
+  """
+
+  def __init__(self, fp, codec):
+    RecordIO.Reader.__init__(self, fp, codec)
+    self._frame_start = None
+    self._corrupt_frames = 0
+    self._skipped_bytes = 0
+
+  @property
+  def corrupt_frames(self):
+    """
+      The number of times corruption was detected and the reader resynchronized.
+    """
+    return self._corrupt_frames
+
+  @property
+  def skipped_bytes(self):
+    """
+      The total number of bytes skipped while resynchronizing.
+    """
+    return self._skipped_bytes
+
+  def _resync(self, fp, frame_start):
+    """
+      Position fp at the next sync marker after frame_start.  If there is none, position fp at
+      the end of the stream, less any trailing bytes that could begin a sync marker.
+    """
+    sync, sync_len = CheckedRecordIO.SYNC, len(CheckedRecordIO.SYNC)
+    scan_start = frame_start + 1
+    fp.seek(scan_start)
+    carry = b''
+    while True:
+      chunk = fp.read(CheckedRecordIO.SCAN_CHUNK_SIZE)
+      window = carry + chunk
+      window_start = scan_start - len(carry)
+      index = window.find(sync)
+      if index >= 0:
+        position = window_start + index
+        break
+      if not chunk:
+        position = window_start + len(window)
+        for k in range(min(len(window), sync_len - 1), 0, -1):
+          if sync.startswith(window[-k:]):
+            position -= k
+            break
+        break
+      scan_start += len(chunk)
+      carry = window[-(sync_len - 1):]
+    fp.seek(position)
+    self._corrupt_frames += 1
+    self._skipped_bytes += position - frame_start
+    log.debug('Skipped %d corrupt bytes at offset %d of %s' % (
+        position - frame_start, frame_start, fp.name))
+
+  def _do_read(self, fp):
+    blob = self._do_read_frame(fp)
+    return None if blob is None else self._codec.decode(blob)
+
+  def _do_read_frame(self, fp):
+    while True:
+      frame_start = self._frame_start = fp.tell()
+      header = fp.read(CheckedRecordIO.HEADER.size)
+      if len(header) == 0:
+        # Reset EOF (appears to be only necessary on OS X)
+        fp.seek(fp.tell())
+        return None
+      elif len(header) != CheckedRecordIO.HEADER.size:
+        if not header.startswith(CheckedRecordIO.SYNC[:len(header)]):
+          self._resync(fp, frame_start)
+          continue
+        raise RecordIO.PrematureEndOfStream(
+            'Expected %d bytes in header, got %d' % (CheckedRecordIO.HEADER.size, len(header)))
+      if not CheckedRecordIO.valid_header(header):
+        self._resync(fp, frame_start)
+        continue
+      _, blob_len, blob_crc, _ = CheckedRecordIO.HEADER.unpack(header)
+      blob = fp.read(blob_len)
+      if len(blob) != blob_len:
+        # A torn frame followed by intact frames is corruption rather than a frame that is
+        # still being written.
+        if CheckedRecordIO.find_header(blob) >= 0:
+          self._resync(fp, frame_start)
+          continue
+        raise RecordIO.PrematureEndOfStream(
+            'Expected %d bytes in frame, got %d' % (blob_len, len(blob)))
+      if CheckedRecordIO.crc32(blob) != blob_crc:
+        self._resync(fp, frame_start)
+        continue
+      return blob
+
+  def __iter__(self):
+    try:
+      dup_fp = self._fp.dup()
+    except self._fp.Error:
+      log.error('Failed to dup %r' % self._fp)
+      return
+
+    try:
+      while True:
+        blob = self._do_read(dup_fp)
+        if blob is None:
+          break
+        yield blob
+    finally:
+      dup_fp.close()
+
+  def read(self):
+    """
+      Read a single record from this stream, skipping any corrupt frames.
+
+      Returns the decoded record or None if no data available.
+
+      May raise:
+        RecordIO.PrematureEndOfStream if the stream ends in the middle of an intact frame.
+    """
+    return self._do_read(self._fp)
+
+  def read_frame(self):
+    """
+      Read a single undecoded, verified frame from this stream, skipping any corrupt frames.
+
+      Returns a memoryview of the frame or None if no data available.
+
+      May raise:
+        RecordIO.PrematureEndOfStream if the stream ends in the middle of an intact frame.
+    """
+    blob = self._do_read_frame(self._fp)
+    return None if blob is None else memoryview(blob)
+
+  def read_many(self, count):
+    """
+      Read up to count records from this stream, skipping any corrupt frames, and decode them
+      as a batch with the codec's decode_many.
+
+      Returns a list of records.
+
+      May raise:
+        RecordIO.PrematureEndOfStream if the stream ends in the middle of an intact frame.
+    """
+    frames = []
+    while len(frames) < count:
+      frame = self._do_read_frame(self._fp)
+      if frame is None:
+        break
+      frames.append(frame)
+    return self._codec.decode_many(frames) if frames else []
+
+  def skip(self, count):
+    """
+      Skip up to count intact records from this stream without decoding them.  Each skipped
+      record is still verified, so corrupt frames are not counted.
+
+      Returns the number of records skipped.
+
+      May raise:
+        RecordIO.PrematureEndOfStream if the stream ends in the middle of an intact frame.
+    """
+    skipped = 0
+    while skipped < count and self._do_read_frame(self._fp) is not None:
+      skipped += 1
+    return skipped
+
+  def try_read(self):
+    """
+      Attempt to read a single record from the stream, skipping any corrupt frames.  If the
+      stream ends in the middle of a frame, the position is left at the start of that frame.
+
+      Returns the decoded record or None if no data available.
+    """
+    try:
+      return self.read()
+    except RecordIO.PrematureEndOfStream as e:
+      log.debug('Got premature end of stream [%s], skipping - %s' % (self._fp.name, e))
+      self._fp.seek(self._frame_start)
+      return None
@@ -0,0 +1,232 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""Persistent read cursors for tailing RecordIO streams.
+
+A RecordCursor is an append-only sidecar file of (offset, record_number) checkpoints taken by a
+CheckpointedRecordReader as it follows a growing RecordIO file.  After a restart, the reader
+resumes from the last durable checkpoint in O(1) rather than rescanning from offset 0.
+
+"""
+
+import os
+import struct
+import zlib
+
+from twitter.common import log
+
+from .recordio import RecordIO
+
+
+class RecordCursor(object):
+  """
+    An append-only file of (offset, record_number) checkpoints.
+
+    Each entry is fixed size and carries a CRC32 so that a torn trailing entry is ignored, and
+    the last durable checkpoint can be found by reading only the tail of the file.
+  """
+
+  ENTRY = struct.Struct('<QQL')
+  SUFFIX = '.cursor'
+
+  @classmethod
+  def sidecar(cls, filename):
+    return filename + cls.SUFFIX
+
+  @classmethod
+  def _pack(cls, offset, record_number):
+    body = struct.pack('<QQ', offset, record_number)
+    return body + struct.pack('<L', zlib.crc32(body) & 0xFFFFFFFF)
+
+  @classmethod
+  def _unpack(cls, entry):
+    offset, record_number, crc = cls.ENTRY.unpack(entry)
+    if zlib.crc32(entry[:-4]) & 0xFFFFFFFF != crc:
+      return None
+    return offset, record_number
+
+  def __init__(self, filename, sync=False):
+    """
+      Open (creating if necessary) the cursor at filename.  If sync=True, every checkpoint is
+      fsynced before checkpoint() returns.
+    """
+    self._filename = filename
+    self._sync = bool(sync)
+    self._fp = open(filename, 'ab+')
+
+  @property
+  def name(self):
+    return self._filename
+
+  def __len__(self):
+    return os.fstat(self._fp.fileno()).st_size // self.ENTRY.size
+
+  def _entry(self, k):
+    self._fp.seek(k * self.ENTRY.size)
+    entry = self._fp.read(self.ENTRY.size)
+    if len(entry) != self.ENTRY.size:
+      return None
+    return self._unpack(entry)
+
+  def last(self):
+    """
+      Return the last durable (offset, record_number) checkpoint, or None if there is none.
+    """
+    for k in range(len(self) - 1, -1, -1):
+      checkpoint = self._entry(k)
+      if checkpoint is not None:
+        return checkpoint
+      log.debug('Skipping corrupt checkpoint %d in %s' % (k, self._filename))
+    return None
+
+  def find(self, record_number):
+    """
+      Return the latest (offset, record_number) checkpoint at or before record_number, or None.
+
+      Checkpoints are appended in record order, so this is a binary search over the cursor.
+    """
+    lo, hi, found = 0, len(self) - 1, None
+    while lo <= hi:
+      mid = (lo + hi) // 2
+      checkpoint = self._entry(mid)
+      if checkpoint is None:
+        hi = mid - 1
+      elif checkpoint[1] <= record_number:
+        found, lo = checkpoint, mid + 1
+      else:
+        hi = mid - 1
+    return found
+
+  def checkpoint(self, offset, record_number):
+    """
+      Append a checkpoint that record_number records end at byte offset.
+    """
+    self._fp.seek(0, os.SEEK_END)
+    # Drop any torn trailing entry so that entries stay aligned.
+    tail = self._fp.tell() % self.ENTRY.size
+    if tail:
+      self._fp.truncate(self._fp.tell() - tail)
+    self._fp.write(self._pack(offset, record_number))
+    self._fp.flush()
+    if self._sync:
+      os.fsync(self._fp.fileno())
+
+  def reset(self):
+    """
+      Discard all checkpoints, e.g. if the underlying RecordIO file has been replaced.
+    """
+    self._fp.truncate(0)
+    self._fp.flush()
+
+  def close(self):
+    self._fp.close()
+
+
+class CheckpointedRecordReader(RecordIO.Reader):
+  """
+    A RecordIO.Reader that periodically records its position in a RecordCursor.
+  """
+
+  DEFAULT_CHECKPOINT_INTERVAL = 1024
+
+  def __init__(self, fp, codec, cursor, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+    """
+      Initialize a reader from file-like fp with RecordIO.Codec codec, checkpointing its position
+      into RecordCursor cursor every checkpoint_interval records.
+
+      The reader starts at the current position of fp, which is assumed to be record 0; call
+      resume() to continue from the last checkpoint instead.
+    """
+    RecordIO.Reader.__init__(self, fp, codec)
+    if not isinstance(cursor, RecordCursor):
+      raise RecordIO.InvalidArgument('cursor must be a RecordCursor, got %s' % type(cursor))
+    if checkpoint_interval < 1:
+      raise RecordIO.InvalidArgument(
+          'checkpoint_interval must be positive, got %s' % checkpoint_interval)
+    self._cursor = cursor
+    self._checkpoint_interval = checkpoint_interval
+    self._record_number = 0
+    self._last_checkpoint = 0
+
+  @property
+  def record_number(self):
+    """
+      The number of records consumed from the stream, i.e. the number of the next record.
+    """
+    return self._record_number
+
+  def resume(self):
+    """
+      Seek to the last durable checkpoint.  If the checkpoint lies beyond the end of the stream
+      (e.g. the file was truncated or replaced) the cursor is reset and reading restarts at 0.
+
+      Returns the record number reading will resume from.
+    """
+    checkpoint = self._cursor.last()
+    offset, record_number = checkpoint or (0, 0)
+    self._fp.seek(0, os.SEEK_END)
+    if offset > self._fp.tell():
+      log.warning('Checkpoint %d beyond end of %s, restarting from 0.' % (offset, self._fp.name))
+      self._cursor.reset()
+      offset, record_number = 0, 0
+    self._fp.seek(offset)
+    self._record_number = self._last_checkpoint = record_number
+    return record_number
+
+  def checkpoint(self):
+    """
+      Record the current position in the cursor.
+    """
+    self._cursor.checkpoint(self._fp.tell(), self._record_number)
+    self._last_checkpoint = self._record_number
+
+  def _advance(self, count):
+    self._record_number += count
+    if self._record_number - self._last_checkpoint >= self._checkpoint_interval:
+      self.checkpoint()
+
+  def read(self):
+    record = RecordIO.Reader.read(self)
+    if record is not None:
+      self._advance(1)
+    return record
+
+  def read_frame(self):
+    frame = RecordIO.Reader.read_frame(self)
+    if frame is not None:
+      self._advance(1)
+    return frame
+
+  def read_many(self, count):
+    records = RecordIO.Reader.read_many(self, count)
+    self._advance(len(records))
+    return records
+
+  def skip(self, count):
+    skipped = RecordIO.Reader.skip(self, count)
+    self._advance(skipped)
+    return skipped
+
+  def close(self):
+    """
+      Checkpoint the current position and close the underlying filehandle and cursor.
+    """
+    try:
+      if self._record_number != self._last_checkpoint:
+        self.checkpoint()
+    finally:
+      self._cursor.close()
+      RecordIO.Reader.close(self)
@@ -17,19 +17,25 @@
 """Encapsulate a file-like object to provide a common interface for RecordIO streams"""
 
 import errno
+import io
+import mmap
 import os
+import socket
+import stat
 
 from twitter.common import log
+from twitter.common.lang import Compatibility
 
 
-# TODO(wickman) This needs to be py 3.x friendly.
 _VALID_STRINGIO_CLASSES = []
 
-from StringIO import StringIO
-
-# The hoops jumped through here are because StringI and StringO are not
-# exposed directly in the stdlib.
-_VALID_STRINGIO_CLASSES.append(StringIO)
+try:
+  from StringIO import StringIO
+  # The hoops jumped through here are because StringI and StringO are not
+  # exposed directly in the stdlib.
+  _VALID_STRINGIO_CLASSES.append(StringIO)
+except ImportError:
+  pass
 
 try:
   from cStringIO import StringIO
@@ -39,6 +45,7 @@ except ImportError:
   pass
 
 _VALID_STRINGIO_CLASSES = tuple(_VALID_STRINGIO_CLASSES)
+_FILE_CLASSES = () if Compatibility.PY3 else (file,)
 
 
 class FileLike(object):
@@ -46,14 +53,33 @@ class FileLike(object):
 
   @staticmethod
   def get(fp):
-    if isinstance(fp, _VALID_STRINGIO_CLASSES):
-      return StringIOFileLike(fp)
-    elif isinstance(fp, file):
-      return FileLike(fp)
-    elif isinstance(fp, FileLike):
+    """
+      Wrap fp in the appropriate FileLike.  fp may be a file, a StringIO, any buffered or raw
+      binary stream from the io module (e.g. io.BytesIO or io.BufferedReader), an mmap or a
+      connected socket.  Readable streams positioned at the start of a
+      block-compressed RecordIO container are wrapped so that they read as ordinary RecordIO.
+    """
+    if isinstance(fp, FileLike):
       return fp
+    elif isinstance(fp, _VALID_STRINGIO_CLASSES):
+      filelike = StringIOFileLike(fp)
+    elif isinstance(fp, _FILE_CLASSES):
+      filelike = FileLike(fp)
+    elif isinstance(fp, io.BytesIO):
+      filelike = BytesIOFileLike(fp)
+    elif isinstance(fp, (io.BufferedIOBase, io.RawIOBase)):
+      filelike = StreamFileLike(fp)
+    elif isinstance(fp, mmap.mmap):
+      filelike = MmapFileLike(fp)
+    elif isinstance(fp, socket.socket):
+      filelike = StreamFileLike(fp.makefile('rwb' if Compatibility.PY3 else 'r+b'))
     else:
       raise ValueError('Unknown file-like object %s' % fp)
+    if ('r' in filelike.mode or '+' in filelike.mode) and filelike.seekable():
+      from .block_recordio import BlockFileLike
+      if BlockFileLike.detect(filelike):
+        return BlockFileLike(filelike)
+    return filelike
 
   def __init__(self, fp):
     self._fp = fp
@@ -80,14 +106,55 @@ class FileLike(object):
   def read(self, length):
     return self._fp.read(length)
 
+  def readinto(self, buf):
+    """
+      Read up to len(buf) bytes into the writable buffer buf (e.g. a bytearray or a memoryview
+      of one) and return the number of bytes read.  Fewer than len(buf) bytes are read only at
+      the end of the stream.
+    """
+    view = memoryview(buf)
+    readinto = getattr(self._fp, 'readinto', None)
+    filled = 0
+    while filled < len(view):
+      if readinto is not None:
+        count = readinto(view[filled:])
+      else:
+        data = self._fp.read(len(view) - filled)
+        count = len(data)
+        view[filled:filled + count] = data
+      if not count:
+        break
+      filled += count
+    return filled
+
+  def scratch(self, size):
+    """
+      Return a memoryview of size bytes over a buffer owned by this FileLike.  The buffer is
+      reused by subsequent calls, so the view must not be retained.
+    """
+    buf = getattr(self, '_scratch', None)
+    if buf is None or len(buf) < size:
+      buf = self._scratch = bytearray(size)
+    return memoryview(buf)[:size]
+
   def write(self, data):
     return self._fp.write(data)
 
   def tell(self):
     return self._fp.tell()
 
-  def seek(self, dest):
-    return self._fp.seek(dest)
+  def seek(self, dest, whence=os.SEEK_SET):
+    return self._fp.seek(dest, whence)
+
+  def seekable(self):
+    return True
+
+  def skip_records(self, count):
+    """
+      Skip up to count whole records without reading them, if the framing of the underlying
+      stream allows it.  Returns the number of records skipped.
+    """
+    return 0
 
   def close(self):
     return self._fp.close()
@@ -121,3 +188,155 @@ class StringIOFileLike(FileLike):
 
   def dup(self):
     return StringIOFileLike(StringIO(self._fp.read()))
+
+
+class BytesIOFileLike(StringIOFileLike):
+  def dup(self):
+    return BytesIOFileLike(io.BytesIO(self._fp.getvalue()))
+
+
+class StreamFileLike(FileLike):
+  """
+    A FileLike over a binary stream from the io module.  Streams that are not seekable (e.g.
+    sockets) support reading and writing, but not try_read or iteration.
+  """
+
+  @property
+  def mode(self):
+    mode = getattr(self._fp, 'mode', None)
+    if isinstance(mode, str):
+      return mode
+    readable, writable = self._fp.readable(), self._fp.writable()
+    return 'r+b' if readable and writable else 'rb' if readable else 'wb'
+
+  @property
+  def name(self):
+    return getattr(self._fp, 'name', repr(self._fp))
+
+  def _fileno(self):
+    try:
+      return self._fp.fileno()
+    except (AttributeError, IOError, OSError, ValueError):
+      return None
+
+  def seekable(self):
+    return getattr(self._fp, 'seekable', lambda: False)()
+
+  def write(self, data):
+    result = self._fp.write(data)
+    # Nothing else flushes buffered writes to pipes and sockets, so their peers would block.
+    if not self.seekable():
+      self._fp.flush()
+    return result
+
+  def dup(self):
+    fileno = self._fileno()
+    if fileno is None or not self.seekable():
+      raise self.Error('Cannot dup %s' % self.name)
+    fd = os.dup(fileno)
+    try:
+      cur_fp = io.open(fd, 'rb')
+      cur_fp.seek(0)
+    except (IOError, OSError) as e:
+      log.error('Failed to duplicate fd on %s, error = %s' % (self.name, e))
+      try:
+        os.close(fd)
+      except OSError as e:
+        if e.errno != errno.EBADF:
+          log.error('Failed to close duped fd on %s, error = %s' % (self.name, e))
+      raise self.Error('Failed to dup %s' % self._fp)
+    return StreamFileLike(cur_fp)
+
+  def flush(self):
+    try:
+      self._fp.flush()
+      fileno = self._fileno()
+      # Pipes and sockets cannot be fsynced.
+      if fileno is not None and stat.S_ISREG(os.fstat(fileno).st_mode):
+        os.fsync(fileno)
+    except (IOError, OSError) as e:
+      log.error("Failed to fsync on %s! Error: %s" % (self.name, e))
+
+
+if Compatibility.PY3:
+  def _copy_from_mmap(view, fp, start, end):
+    with memoryview(fp) as source:
+      view[:end - start] = source[start:end]
+else:
+  def _copy_from_mmap(view, fp, start, end):
+    view[:end - start] = buffer(fp, start, end - start)
+
+
+class MmapFileLike(FileLike):
+  """
+    A FileLike over an mmap.  readinto copies directly out of the map without intermediate
+    strings, and dup() shares the map rather than copying it.  The map is only closed by the
+    FileLike it was originally wrapped in.
+  """
+
+  def __init__(self, fp, owner=True):
+    self._fp = fp
+    self._pos = 0
+    self._owner = owner
+    try:
+      # An empty slice assignment is the only portable way to detect an ACCESS_READ map.
+      fp[0:0] = b''
+      self._writable = True
+    except TypeError:
+      self._writable = False
+
+  @property
+  def mode(self):
+    return 'r+' if self._writable else 'r'
+
+  @property
+  def name(self):
+    return 'mmap'
+
+  def dup(self):
+    return MmapFileLike(self._fp, owner=False)
+
+  def read(self, length):
+    data = self._fp[self._pos:self._pos + length]
+    self._pos += len(data)
+    return data
+
+  def readinto(self, buf):
+    view = memoryview(buf)
+    end = min(self._pos + len(view), len(self._fp))
+    count = max(0, end - self._pos)
+    if count:
+      _copy_from_mmap(view, self._fp, self._pos, end)
+    self._pos += count
+    return count
+
+  def write(self, data):
+    if not self._writable:
+      raise IOError('Cannot write to a read-only mmap.')
+    if self._pos + len(data) > len(self._fp):
+      raise IOError('Write of %d bytes at offset %d exceeds mmap size %d' % (
+          len(data), self._pos, len(self._fp)))
+    self._fp[self._pos:self._pos + len(data)] = data
+    self._pos += len(data)
+
+  def tell(self):
+    return self._pos
+
+  def seek(self, dest, whence=os.SEEK_SET):
+    if whence == os.SEEK_CUR:
+      dest += self._pos
+    elif whence == os.SEEK_END:
+      dest += len(self._fp)
+    if dest < 0:
+      raise IOError('Invalid seek to offset %d' % dest)
+    self._pos = dest
+
+  def close(self):
+    if self._owner:
+      self._fp.close()
+
+  def flush(self):
+    try:
+      self._fp.flush()
+    except (EnvironmentError, ValueError) as e:
+      log.error('Failed to flush mmap! Error: %s' % e)
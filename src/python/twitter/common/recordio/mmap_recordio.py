@@ -0,0 +1,312 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""Random-access, zero-copy reading of RecordIO files via mmap.
+
+An MmapRecordReader maps a RecordIO file into memory and maintains a RecordIndex of the offset
+of every frame, so that reader[i] is O(1) and replay may begin at any record.  The index may be
+persisted to a sidecar file (by default <filename>.idx) so that it is only built once; if the
+RecordIO file has grown since the sidecar was written, only the new tail is scanned.
+
+"""
+
+from array import array
+import mmap
+import os
+import struct
+import sys
+
+from twitter.common import log
+from twitter.common.lang import Compatibility
+
+from .recordio import RecordIO
+
+
+def _offset_typecode():
+  for typecode in ('L', 'Q'):
+    try:
+      if array(typecode).itemsize == 8:
+        return typecode
+    except ValueError:
+      continue
+  raise ImportError('No 64-bit unsigned array type available.')
+
+
+if Compatibility.PY3:
+  def frame_view(buf, offset, length):
+    return memoryview(buf)[offset:offset + length]
+else:
+  def frame_view(buf, offset, length):
+    return buffer(buf, offset, length)
+
+
+class RecordIndex(object):
+  """
+    An index of the frame offsets of a RecordIO stream.
+
+    The sidecar format is a fixed header (magic, version, number of indexed bytes, number of
+    records) followed by one little-endian uint64 offset per record.
+  """
+
+  class Error(RecordIO.Error): pass
+  class InvalidIndex(Error): pass
+
+  MAGIC = b'RIDX'
+  VERSION = 1
+  HEADER = struct.Struct('<4sLQQ')
+  TYPECODE = _offset_typecode()
+  SUFFIX = '.idx'
+
+  @classmethod
+  def sidecar(cls, filename):
+    return filename + cls.SUFFIX
+
+  def __init__(self, offsets=None, size=0):
+    """
+      Construct an index from a sequence of frame offsets, covering the first size bytes of the
+      underlying stream.
+    """
+    self._offsets = array(self.TYPECODE, offsets or [])
+    self._size = size
+
+  @property
+  def size(self):
+    """
+      The number of bytes of the underlying stream covered by this index.  This is always the
+      end of the last complete frame.
+    """
+    return self._size
+
+  def __len__(self):
+    return len(self._offsets)
+
+  def __getitem__(self, record_number):
+    return self._offsets[record_number]
+
+  def update(self, buf, end=None):
+    """
+      Extend the index by scanning frame headers in buf (any object supporting the buffer
+      protocol, e.g. an mmap) from the end of the last indexed frame up to end.  A truncated
+      trailing frame is not indexed.
+
+      Returns the number of records added.
+
+      May raise:
+        RecordIO.RecordSizeExceeded if a header exceeds RecordIO.MAXIMUM_RECORD_SIZE
+    """
+    end = len(buf) if end is None else end
+    offset, added = self._size, 0
+    unpack_from, header_size = struct.unpack_from, RecordIO.RECORD_HEADER_SIZE
+    while offset + header_size <= end:
+      blob_len = unpack_from('>L', buf, offset)[0]
+      if blob_len > RecordIO.MAXIMUM_RECORD_SIZE:
+        raise RecordIO.RecordSizeExceeded(
+            'Record at offset %d exceeds maximum allowable size' % offset)
+      if offset + header_size + blob_len > end:
+        break
+      self._offsets.append(offset)
+      offset += header_size + blob_len
+      added += 1
+    self._size = offset
+    return added
+
+  def write(self, filename):
+    """
+      Atomically write this index to filename.
+    """
+    offsets = self._offsets
+    if sys.byteorder != 'little':
+      offsets = array(self.TYPECODE, offsets)
+      offsets.byteswap()
+    tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+    with open(tmp_filename, 'wb') as fp:
+      fp.write(self.HEADER.pack(self.MAGIC, self.VERSION, self._size, len(offsets)))
+      offsets.tofile(fp)
+    os.rename(tmp_filename, filename)
+
+  @classmethod
+  def read(cls, filename):
+    """
+      Read an index previously written with RecordIndex.write.
+
+      May raise:
+        IOError/OSError if filename cannot be read.
+        RecordIndex.InvalidIndex if filename is not a valid index.
+    """
+    with open(filename, 'rb') as fp:
+      header = fp.read(cls.HEADER.size)
+      if len(header) != cls.HEADER.size:
+        raise cls.InvalidIndex('Truncated index header in %s' % filename)
+      magic, version, size, count = cls.HEADER.unpack(header)
+      if magic != cls.MAGIC or version != cls.VERSION:
+        raise cls.InvalidIndex('%s is not a version %d RecordIO index' % (filename, cls.VERSION))
+      offsets = array(cls.TYPECODE)
+      try:
+        offsets.fromfile(fp, count)
+      except EOFError:
+        raise cls.InvalidIndex('Truncated index body in %s' % filename)
+    if sys.byteorder != 'little':
+      offsets.byteswap()
+    index = cls(size=size)
+    index._offsets = offsets
+    return index
+
+
+class MmapRecordReader(object):
+  """
+    Random-access reader of a RecordIO file backed by mmap.
+
+    Frames are returned as zero-copy views (memoryview on Python 3, buffer on Python 2) of the
+    mapped file.  Each view keeps the mapping it was taken from alive, so views remain valid
+    after the reader is refreshed or closed (as long as the file is not truncated underneath
+    them.)  If a codec is supplied, indexing and iteration decode each frame with it; otherwise
+    they return the raw frame views.
+  """
+
+  def __init__(self, filename, codec=None, sidecar=True):
+    """
+      Map filename and build (or load) its record index.
+
+      If sidecar is True, the index is loaded from and saved to RecordIndex.sidecar(filename).
+      A stale sidecar (one covering more bytes than the file contains) is discarded and rebuilt.
+
+      May raise:
+        IOError/OSError if filename cannot be opened.
+        RecordIO.InvalidCodec if codec is not a RecordIO.Codec.
+        RecordIO.RecordSizeExceeded if the file contains an invalid header.
+    """
+    if codec is not None and not isinstance(codec, RecordIO.Codec):
+      raise RecordIO.InvalidCodec('Codec must be subclass of RecordIO.Codec')
+    self._filename = filename
+    self._codec = codec
+    self._sidecar = RecordIndex.sidecar(filename) if sidecar else None
+    self._fp = open(filename, 'rb')
+    self._mmap = None
+    self._index = self._load_index()
+    self.refresh()
+
+  def _load_index(self):
+    if self._sidecar and os.path.exists(self._sidecar):
+      try:
+        index = RecordIndex.read(self._sidecar)
+        if index.size <= os.fstat(self._fp.fileno()).st_size:
+          return index
+        log.debug('Discarding stale index %s' % self._sidecar)
+      except (IOError, OSError, RecordIndex.InvalidIndex) as e:
+        log.debug('Failed to load index %s: %s' % (self._sidecar, e))
+    return RecordIndex()
+
+  def _unmap(self):
+    # Frame views hold a reference to the map, so rather than closing it (which raises
+    # BufferError on Python 3 and invalidates the views on Python 2), drop our reference and
+    # let it be unmapped once the last view is released.
+    self._mmap = None
+
+  def _map(self):
+    self._unmap()
+    size = os.fstat(self._fp.fileno()).st_size
+    # mmap refuses to map empty files.
+    if size > 0:
+      self._mmap = mmap.mmap(self._fp.fileno(), size, access=mmap.ACCESS_READ)
+
+  def _index_consistent(self):
+    # Cheap sanity check that the index fits within the file (which may have been truncated
+    # since it was built) and that the last indexed frame ends where the index says it does.
+    if self._index.size > len(self._mmap):
+      return False
+    if len(self._index) == 0:
+      return True
+    offset = self._index[len(self._index) - 1]
+    if offset + RecordIO.RECORD_HEADER_SIZE > len(self._mmap):
+      return False
+    blob_len = struct.unpack_from('>L', self._mmap, offset)[0]
+    return offset + RecordIO.RECORD_HEADER_SIZE + blob_len == self._index.size
+
+  def refresh(self):
+    """
+      Remap the underlying file and index any records appended since the last refresh, saving
+      the sidecar index if it changed.
+
+      Views returned prior to a refresh remain valid, but do not reflect the new mapping.
+
+      Returns the number of records added.
+    """
+    self._map()
+    if self._mmap is None:
+      # The file is empty, so any index of it is stale.
+      self._index = RecordIndex()
+      return 0
+    if not self._index_consistent():
+      log.debug('Discarding inconsistent index for %s' % self._filename)
+      self._index = RecordIndex()
+    added = self._index.update(self._mmap)
+    if added and self._sidecar:
+      try:
+        self._index.write(self._sidecar)
+      except (IOError, OSError) as e:
+        log.debug('Failed to write index %s: %s' % (self._sidecar, e))
+    return added
+
+  @property
+  def index(self):
+    return self._index
+
+  def offset(self, record_number):
+    """
+      The byte offset of the header of record_number, e.g. for handing off to a RecordIO.Reader.
+    """
+    return self._index[record_number]
+
+  def frame(self, record_number):
+    """
+      A zero-copy view of the encoded frame of record_number.
+    """
+    offset = self._index[record_number]
+    blob_len = struct.unpack_from('>L', self._mmap, offset)[0]
+    return frame_view(self._mmap, offset + RecordIO.RECORD_HEADER_SIZE, blob_len)
+
+  def _decode(self, view):
+    return view if self._codec is None else self._codec.decode(bytes(view))
+
+  def __len__(self):
+    return len(self._index)
+
+  def __getitem__(self, record_number):
+    if record_number < 0:
+      record_number += len(self._index)
+    if not 0 <= record_number < len(self._index):
+      raise IndexError('Record %d out of range' % record_number)
+    return self._decode(self.frame(record_number))
+
+  def iter_from(self, record_number):
+    """
+      Iterate over records starting at record_number.
+    """
+    for k in range(record_number, len(self._index)):
+      yield self._decode(self.frame(k))
+
+  def __iter__(self):
+    return self.iter_from(0)
+
+  def close(self):
+    self._unmap()
+    self._fp.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
@@ -0,0 +1,119 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""Scan RecordIO files in parallel across worker processes.
+
+A ParallelRecordScanner makes a header-only pass over a RecordIO file to find its record
+boundaries, splits it into chunks of whole records, and decodes the chunks in a multiprocessing
+pool.  A user-supplied function is applied to each record inside the workers, so only its
+(non-None) results are sent back to the caller.
+
+The codec and function must be picklable, e.g. module-level functions and classes.
+
+"""
+
+from collections import namedtuple
+import multiprocessing
+
+from .block_recordio import BlockFileLike
+from .filelike import FileLike
+from .mmap_recordio import MmapRecordReader
+from .recordio import RecordIO
+
+
+# A run of records (of total framed length bytes) starting at byte offset.
+Chunk = namedtuple('Chunk', ['offset', 'records', 'length'])
+
+
+def _scan_chunk(args):
+  filename, chunk, codec, fn = args
+  with open(filename, 'rb') as fp:
+    fp.seek(chunk.offset)
+    records = RecordIO.Reader(fp, codec).read_many(chunk.records)
+  if len(records) != chunk.records:
+    raise RecordIO.PrematureEndOfStream('Expected %d records at offset %d, got %d' % (
+        chunk.records, chunk.offset, len(records)))
+  if fn is None:
+    return records
+  return [result for result in map(fn, records) if result is not None]
+
+
+class ParallelRecordScanner(object):
+  DEFAULT_CHUNK_BYTES = 4 * 1024 * 1024
+
+  def __init__(self, filename, codec, processes=None, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+      Construct a scanner over the plain-framed RecordIO file filename, decoding records with
+      RecordIO.Codec codec in up to processes worker processes (default: one per CPU.)
+
+      Records are grouped into chunks of roughly chunk_bytes bytes.
+    """
+    if not isinstance(codec, RecordIO.Codec):
+      raise RecordIO.InvalidCodec('Codec must be subclass of RecordIO.Codec')
+    if chunk_bytes < 1:
+      raise RecordIO.InvalidArgument('chunk_bytes must be positive, got %s' % chunk_bytes)
+    self._filename = filename
+    self._codec = codec
+    self._processes = processes
+    self._chunk_bytes = chunk_bytes
+
+  def chunks(self):
+    """
+      Return the list of Chunks covering every complete record in the file, found by scanning
+      frame headers only.
+
+      May raise:
+        RecordIO.InvalidArgument if the file is block-compressed.
+        RecordIO.RecordSizeExceeded if the file contains an invalid header.
+    """
+    with open(self._filename, 'rb') as fp:
+      if BlockFileLike.detect(FileLike(fp)):
+        raise RecordIO.InvalidArgument(
+            '%s is block-compressed; parallel scans require plain framing.' % self._filename)
+    with MmapRecordReader(self._filename, sidecar=False) as reader:
+      index = reader.index
+    chunks, start, count = [], 0, 0
+    for k in range(len(index)):
+      if count and index[k] - index[start] >= self._chunk_bytes:
+        chunks.append(Chunk(index[start], count, index[k] - index[start]))
+        start, count = k, 0
+      count += 1
+    if count:
+      chunks.append(Chunk(index[start], count, index.size - index[start]))
+    return chunks
+
+  def scan(self, fn=None, ordered=True):
+    """
+      Decode every record in the file in parallel and yield fn(record) for each record where
+      that result is not None.  If fn is None, the decoded records themselves are yielded.
+
+      If ordered is True, results are yielded in file order; otherwise they are yielded chunk
+      by chunk as workers complete them, which keeps all workers busy.
+    """
+    chunks = self.chunks()
+    if not chunks:
+      return
+    pool = multiprocessing.Pool(processes=self._processes)
+    try:
+      work = [(self._filename, chunk, self._codec, fn) for chunk in chunks]
+      results = pool.imap(_scan_chunk, work) if ordered else pool.imap_unordered(_scan_chunk, work)
+      for chunk_results in results:
+        for result in chunk_results:
+          yield result
+      pool.close()
+    finally:
+      pool.terminate()
+      pool.join()
@@ -29,9 +29,11 @@ import errno
 from abc import abstractmethod
 import os
 import struct
+import time
 
 from twitter.common import log
 from twitter.common.lang import Compatibility, Interface
+from twitter.common.quantity import Amount, Time
 
 from .filelike import FileLike
 
@@ -68,6 +70,15 @@ class RecordIO(object):
         Raises: InvalidTypeException if a bad blob type is supplied
       """
 
+    def decode_many(self, blobs):
+      """
+        Given: a sequence of deserialized byte data
+        Return: a list of blobs in custom format
+
+        Codecs with per-record setup costs may override this to amortize them over a batch.
+      """
+      return [self.decode(blob) for blob in blobs]
+
   class _Stream(object):
     """
       Shared initialization functionality for Reader/Writer
@@ -93,6 +104,7 @@ class RecordIO(object):
         Initialize a Reader from file-like fp, with RecordIO.Codec codec
       """
       RecordIO._Stream.__init__(self, fp, codec)
+      self._frame_buffer = bytearray()
       if ('w' in self._fp.mode or 'a' in self._fp.mode) and '+' not in self._fp.mode:
         raise RecordIO.InvalidFileHandle(
           'Filehandle supplied to RecordReader does not appear to be readable!')
@@ -121,36 +133,99 @@ class RecordIO(object):
         dup_fp.close()
 
     @staticmethod
-    def do_read(fp, decoder):
+    def do_read_header(fp):
       """
-        Read a single record from the given filehandle and decode using the supplied decoder.
+        Read a single frame header from the given filehandle into its reusable scratch buffer.
+
+        Returns the length of the frame that follows, or None if no data is available.
 
         May raise:
-          RecordIO.PrematureEndOfStream if the stream is truncated in the middle of
-            an expected message
+          RecordIO.PrematureEndOfStream if the stream is truncated in the middle of the header
           RecordIO.RecordSizeExceeded if the message exceeds RecordIO.MAXIMUM_RECORD_SIZE
-
       """
-      # read header
-      header = fp.read(RecordIO.RECORD_HEADER_SIZE)
-      if len(header) == 0:
-        log.debug("%s has no data (current offset = %d)" % (fp.name, fp.tell()))
-        # Reset EOF (appears to be only necessary on OS X)
-        fp.seek(fp.tell())
+      header = fp.scratch(RecordIO.RECORD_HEADER_SIZE)
+      header_len = fp.readinto(header)
+      if header_len == 0:
+        log.debug("%s has no data" % fp.name)
+        if fp.seekable():
+          # Reset EOF (appears to be only necessary on OS X)
+          fp.seek(fp.tell())
         return None
-      elif len(header) != RecordIO.RECORD_HEADER_SIZE:
+      elif header_len != RecordIO.RECORD_HEADER_SIZE:
         raise RecordIO.PrematureEndOfStream(
-            "Expected %d bytes in header, got %d" % (RecordIO.RECORD_HEADER_SIZE, len(header)))
-      blob_len = struct.unpack('>L', header)[0]
+            "Expected %d bytes in header, got %d" % (RecordIO.RECORD_HEADER_SIZE, header_len))
+      blob_len = struct.unpack_from('>L', header)[0]
       if blob_len > RecordIO.MAXIMUM_RECORD_SIZE:
         raise RecordIO.RecordSizeExceeded("Record exceeds maximum allowable size")
+      return blob_len
+
+    @staticmethod
+    def do_read_frame(fp):
+      """
+        Read a single undecoded frame from the given filehandle.
+
+        Returns the frame bytes, or None if no data is available.
+
+        May raise:
+          RecordIO.PrematureEndOfStream if the stream is truncated in the middle of
+            an expected message
+          RecordIO.RecordSizeExceeded if the message exceeds RecordIO.MAXIMUM_RECORD_SIZE
+      """
+      blob_len = RecordIO.Reader.do_read_header(fp)
+      if blob_len is None:
+        return None
 
       # read frame
       read_blob = fp.read(blob_len)
       if len(read_blob) != blob_len:
         raise RecordIO.PrematureEndOfStream(
           'Expected %d bytes in frame, got %d' % (blob_len, len(read_blob)))
-      return decoder.decode(read_blob)
+      return read_blob
+
+    @staticmethod
+    def do_read(fp, decoder):
+      """
+        Read a single record from the given filehandle and decode using the supplied decoder.
+
+        May raise:
+          RecordIO.PrematureEndOfStream if the stream is truncated in the middle of
+            an expected message
+          RecordIO.RecordSizeExceeded if the message exceeds RecordIO.MAXIMUM_RECORD_SIZE
+
+      """
+      read_blob = RecordIO.Reader.do_read_frame(fp)
+      return None if read_blob is None else decoder.decode(read_blob)
+
+    @staticmethod
+    def do_skip(fp):
+      """
+        Skip a single record in the given filehandle without decoding it.
+
+        Returns True if a record was skipped, False if no data is available.
+
+        May raise:
+          RecordIO.PrematureEndOfStream if the stream is truncated in the middle of
+            an expected message
+          RecordIO.RecordSizeExceeded if the message exceeds RecordIO.MAXIMUM_RECORD_SIZE
+      """
+      return RecordIO.Reader.do_read_frame(fp) is not None
+
+    def skip(self, count):
+      """
+        Skip up to count records from this stream without decoding them.  Block-compressed
+        streams skip whole blocks without decompressing them where possible.
+
+        Returns the number of records skipped, which is less than count only if the end of
+        the stream was reached.
+
+        May raise:
+          RecordIO.PrematureEndOfStream
+          RecordIO.RecordSizeExceeded
+      """
+      skipped = self._fp.skip_records(count)
+      while skipped < count and RecordIO.Reader.do_skip(self._fp):
+        skipped += 1
+      return skipped
 
     def read(self):
       """
@@ -167,6 +242,52 @@ class RecordIO(object):
       """
       return RecordIO.Reader.do_read(self._fp, self._codec)
 
+    def read_frame(self):
+      """
+        Read a single undecoded frame from this stream into a buffer owned by this reader,
+        without allocating a new string for each record.  File position semantics are as
+        for read().
+
+        Returns a memoryview of the frame, valid only until the next call to read_frame, or
+        None if no data available.
+
+        May raise:
+          RecordIO.PrematureEndOfStream if the stream is truncated in the middle of
+            an expected message
+          RecordIO.RecordSizeExceeded if the message exceeds RecordIO.MAXIMUM_RECORD_SIZE
+      """
+      blob_len = RecordIO.Reader.do_read_header(self._fp)
+      if blob_len is None:
+        return None
+      if len(self._frame_buffer) < blob_len:
+        self._frame_buffer = bytearray(max(blob_len, 2 * len(self._frame_buffer)))
+      frame = memoryview(self._frame_buffer)[:blob_len]
+      read_len = self._fp.readinto(frame)
+      if read_len != blob_len:
+        raise RecordIO.PrematureEndOfStream(
+          'Expected %d bytes in frame, got %d' % (blob_len, read_len))
+      return frame
+
+    def read_many(self, count):
+      """
+        Read up to count records from this stream, decoding them as a batch with the codec's
+        decode_many.  Stops early (without error) if no more data is available.
+
+        Returns a list of records.
+
+        May raise:
+          RecordIO.PrematureEndOfStream if the stream is truncated in the middle of
+            an expected message
+          RecordIO.RecordSizeExceeded if the message exceeds RecordIO.MAXIMUM_RECORD_SIZE
+      """
+      frames = []
+      while len(frames) < count:
+        frame = RecordIO.Reader.do_read_frame(self._fp)
+        if frame is None:
+          break
+        frames.append(frame)
+      return self._codec.decode_many(frames) if frames else []
+
     def try_read(self):
       """
         Attempt to read a single record from the stream.  Only updates the file position
@@ -253,6 +374,149 @@ class RecordIO(object):
       """
       return RecordIO.Writer.do_write(self._fp, blob, self._codec, sync=self._sync)
 
+    @staticmethod
+    def encode_frame(record, codec):
+      """
+        Encode a record using the supplied codec and return the framed (header + blob) bytes.
+      """
+      blob = codec.encode(record)
+      return struct.pack('>L', len(blob)) + blob
+
+    @staticmethod
+    def do_write_frames(fp, frames, sync=False):
+      """
+        Write a sequence of already-encoded frames to fp using a single write call.  If
+        sync=True, flush and fsync once after all frames have been written.
+
+        Returns True on success, False on any filesystem failure.
+      """
+      try:
+        fp.write(b''.join(frames))
+      except (IOError, OSError) as e:
+        log.debug("Got exception in write(%s): %s" % (fp.name, e))
+        return False
+      if sync:
+        fp.flush()
+      return True
+
+    def write_many(self, records):
+      """
+        Append a sequence of records to the current RecordWriter with a single coalesced write
+        (and, if sync=True, a single fsync.)
+
+        Returns True on success, False on any filesystem failure.
+      """
+      frames = [self.encode_frame(record, self._codec) for record in records]
+      if not frames:
+        return True
+      return RecordIO.Writer.do_write_frames(self._fp, frames, sync=self._sync)
+
+  class BatchedWriter(Writer):
+    DEFAULT_MAX_RECORDS = 1024
+    DEFAULT_MAX_BYTES = 1024 * 1024
+    DEFAULT_MAX_DELAY = Amount(10, Time.MILLISECONDS)
+
+    def __init__(self, fp, codec, sync=False, max_records=DEFAULT_MAX_RECORDS,
+                 max_bytes=DEFAULT_MAX_BYTES, max_delay=DEFAULT_MAX_DELAY, on_commit=None,
+                 clock=time):
+      """
+        Initialize a BatchedWriter from the FileLike fp, with RecordIO.Codec codec.
+
+        Records are encoded immediately but buffered in memory and committed to fp with a single
+        write (group commit) once max_records records or max_bytes bytes are pending, or once
+        the oldest pending record has been buffered for longer than max_delay.  The delay is
+        checked whenever a record is written, so callers with bursty traffic should call
+        commit() periodically or when idle.
+
+        If sync=True is supplied, each commit is fsynced: once commit() returns, every record it
+        covered is as durable as if it had been written by a synced RecordIO.Writer.
+
+        If on_commit is supplied, it is called with the number of records covered by each
+        successful commit.
+      """
+      RecordIO.Writer.__init__(self, fp, codec, sync=sync)
+      if max_records < 1:
+        raise RecordIO.InvalidArgument('max_records must be positive, got %s' % max_records)
+      if on_commit is not None and not callable(on_commit):
+        raise RecordIO.InvalidArgument('on_commit must be callable, got %s' % type(on_commit))
+      self._max_records = max_records
+      self._max_bytes = max_bytes
+      self._max_delay = max_delay.as_(Time.SECONDS)
+      self._on_commit = on_commit
+      self._clock = clock
+      self._frames = []
+      self._pending_bytes = 0
+      self._first_pending = None
+
+    @property
+    def pending(self):
+      """
+        The number of records buffered but not yet committed.
+      """
+      return len(self._frames)
+
+    def _should_commit(self):
+      return (len(self._frames) >= self._max_records or
+              self._pending_bytes >= self._max_bytes or
+              self._clock.time() - self._first_pending >= self._max_delay)
+
+    def _buffer(self, frame):
+      if not self._frames:
+        self._first_pending = self._clock.time()
+      self._frames.append(frame)
+      self._pending_bytes += len(frame)
+
+    def write(self, blob):
+      """
+        Buffer the blob, committing pending records if a batch threshold has been reached.
+
+        Returns True on success, False if a triggered commit hit a filesystem failure.
+      """
+      self._buffer(self.encode_frame(blob, self._codec))
+      return self.commit() if self._should_commit() else True
+
+    def write_many(self, records):
+      """
+        Buffer a sequence of records, committing pending records if a batch threshold has been
+        reached.
+
+        Returns True on success, False if a triggered commit hit a filesystem failure.
+      """
+      for record in records:
+        self._buffer(self.encode_frame(record, self._codec))
+      return self.commit() if self._frames and self._should_commit() else True
+
+    def _write_frames(self, frames):
+      return RecordIO.Writer.do_write_frames(self._fp, frames, sync=self._sync)
+
+    def commit(self):
+      """
+        Write all pending records with a single write call, fsyncing once if sync=True.
+
+        Pending records are discarded whether or not the write succeeds, matching the
+        semantics of a failed RecordIO.Writer.write.
+
+        Returns True on success (or if nothing is pending), False on any filesystem failure.
+      """
+      if not self._frames:
+        return True
+      frames, count = self._frames, len(self._frames)
+      self._frames, self._pending_bytes, self._first_pending = [], 0, None
+      if not self._write_frames(frames):
+        return False
+      if self._on_commit:
+        self._on_commit(count)
+      return True
+
+    def close(self):
+      """
+        Commit any pending records and close the underlying filehandle.
+      """
+      try:
+        self.commit()
+      finally:
+        RecordIO.Writer.close(self)
+
 
 class StringCodec(RecordIO.Codec):
   """
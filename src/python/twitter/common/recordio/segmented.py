@@ -0,0 +1,255 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""A rolling RecordIO log split into size- and age-bounded segments.
+
+A SegmentedRecordLog is a directory of ordinary RecordIO files, each named after the number of
+its first record, e.g.
+
+  00000000000000000000.recordio
+  00000000000000052817.recordio
+
+Records are appended to the newest segment through a single open file handle.  When the segment
+reaches max_segment_bytes or max_segment_age, it is sealed and a new one started, and the
+retention callback decides which sealed segments to delete.  Reading iterates across segments
+as a single stream of records.
+
+"""
+
+from collections import namedtuple
+import os
+import re
+import time
+
+from twitter.common import log
+from twitter.common.quantity import Amount, Data, Time
+
+from .filelike import FileLike
+from .recordio import RecordIO
+
+
+# A segment starting at record number first_record, of size bytes.
+Segment = namedtuple('Segment', ['filename', 'first_record', 'size'])
+
+
+class SegmentedRecordLog(object):
+  SUFFIX = '.recordio'
+  SEGMENT_RE = re.compile(r'^(\d{20})%s$' % re.escape(SUFFIX))
+
+  DEFAULT_MAX_SEGMENT_SIZE = Amount(64, Data.MB)
+  DEFAULT_MAX_SEGMENT_AGE = Amount(1, Time.HOURS)
+
+  @classmethod
+  def retain_segments(cls, count):
+    """
+      A retention callback that keeps the newest count sealed segments.
+    """
+    def retention(segments):
+      return segments[:-count] if count else segments
+    return retention
+
+  @classmethod
+  def retain_size(cls, size):
+    """
+      A retention callback that keeps the newest sealed segments totalling at most size (an
+      Amount of Data.)
+    """
+    limit = size.as_(Data.BYTES)
+    def retention(segments):
+      total = 0
+      for k in range(len(segments) - 1, -1, -1):
+        total += segments[k].size
+        if total > limit:
+          return segments[:k + 1]
+      return []
+    return retention
+
+  def __init__(self, directory, codec, max_segment_size=DEFAULT_MAX_SEGMENT_SIZE,
+               max_segment_age=DEFAULT_MAX_SEGMENT_AGE, retention=None, sync=False, clock=time):
+    """
+      Open (creating if necessary) the segmented log in directory, with RecordIO.Codec codec.
+
+        max_segment_size: roll to a new segment once the current one reaches this Amount of Data.
+        max_segment_age: roll to a new segment once the current one has been open this long.
+        retention: an optional callable that is passed the list of sealed Segments, oldest first,
+          whenever a segment is sealed, and returns the Segments to delete.  It may also compact
+          segments in place, as long as it preserves their record counts.
+        sync: if True, fsync after every write.
+
+      May raise:
+        RecordIO.InvalidCodec if codec is not a RecordIO.Codec.
+        RecordIO.PrematureEndOfStream/RecordSizeExceeded if a sealed segment is corrupt.
+    """
+    if not isinstance(codec, RecordIO.Codec):
+      raise RecordIO.InvalidCodec('Codec must be subclass of RecordIO.Codec')
+    if retention is not None and not callable(retention):
+      raise RecordIO.InvalidArgument('retention must be callable, got %s' % type(retention))
+    self._directory = directory
+    self._codec = codec
+    self._max_segment_bytes = max_segment_size.as_(Data.BYTES)
+    self._max_segment_age = max_segment_age.as_(Time.SECONDS)
+    self._retention = retention
+    self._sync = sync
+    self._clock = clock
+    self._writer = None
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    self._open_tail()
+
+  def _segment_filename(self, first_record):
+    return os.path.join(self._directory, '%020d%s' % (first_record, self.SUFFIX))
+
+  def segments(self):
+    """
+      The Segments of this log, oldest first.  The last is the segment being written.
+    """
+    if self._writer is not None:
+      self._fp.flush()
+    segments = []
+    for filename in os.listdir(self._directory):
+      match = self.SEGMENT_RE.match(filename)
+      if match:
+        path = os.path.join(self._directory, filename)
+        segments.append(Segment(path, int(match.group(1)), os.path.getsize(path)))
+    return sorted(segments, key=lambda segment: segment.first_record)
+
+  def _open_tail(self):
+    segments = self.segments()
+    if not segments:
+      self._open_segment(0)
+      return
+    tail = segments[-1]
+    # Count the records in the tail and drop any torn write left by a crash.
+    count, end = 0, 0
+    with open(tail.filename, 'rb') as fp:
+      filelike = FileLike.get(fp)
+      while True:
+        try:
+          if not RecordIO.Reader.do_skip(filelike):
+            break
+        except RecordIO.PrematureEndOfStream:
+          break
+        count += 1
+        end = fp.tell()
+    if end != tail.size:
+      log.warning('Truncating torn write at offset %d of %s' % (end, tail.filename))
+      with open(tail.filename, 'rb+') as fp:
+        fp.truncate(end)
+    self._open_segment(tail.first_record, count)
+
+  def _open_segment(self, first_record, count=0):
+    self._first_record = first_record
+    self._next_record = first_record + count
+    self._segment_opened = self._clock.time()
+    self._fp = open(self._segment_filename(first_record), 'ab')
+    # tell() is only meaningful in append mode once positioned at the end.
+    self._fp.seek(0, os.SEEK_END)
+    self._writer = RecordIO.Writer(self._fp, self._codec, sync=self._sync)
+
+  @property
+  def next_record(self):
+    """
+      The record number that the next record written will have.
+    """
+    return self._next_record
+
+  def _should_roll(self):
+    return self._next_record > self._first_record and (
+        self._fp.tell() >= self._max_segment_bytes or
+        self._clock.time() - self._segment_opened >= self._max_segment_age)
+
+  def roll(self):
+    """
+      Seal the current segment (if it contains any records), start a new one and apply the
+      retention callback.
+    """
+    if self._next_record == self._first_record:
+      return
+    self._writer.close()
+    self._open_segment(self._next_record)
+    if self._retention is not None:
+      self._apply_retention()
+
+  def _apply_retention(self):
+    sealed = self.segments()[:-1]
+    for segment in self._retention(sealed) or []:
+      if segment.first_record >= self._first_record:
+        log.warning('Retention may not delete the current segment %s' % segment.filename)
+        continue
+      try:
+        os.unlink(segment.filename)
+      except OSError as e:
+        log.error('Failed to delete segment %s: %s' % (segment.filename, e))
+
+  def write(self, record):
+    """
+      Append a record, rolling to a new segment first if necessary.
+
+      Returns True on success, False on any filesystem failure.
+    """
+    return self.write_many([record])
+
+  def write_many(self, records):
+    """
+      Append records with a single write, rolling to a new segment first if necessary.  Records
+      written together are never split across segments.
+
+      Returns True on success, False on any filesystem failure.
+    """
+    if self._writer is None:
+      raise RecordIO.InvalidFileHandle('SegmentedRecordLog is closed.')
+    if self._should_roll():
+      self.roll()
+    if not self._writer.write_many(records):
+      return False
+    self._next_record += len(records)
+    return True
+
+  def iter_from(self, record_number=0):
+    """
+      Iterate over records starting at record_number (or the oldest retained record, if that
+      has been deleted), across segment boundaries.
+    """
+    segments = self.segments()
+    for k, segment in enumerate(segments):
+      if k + 1 < len(segments) and segments[k + 1].first_record <= record_number:
+        continue
+      try:
+        fp = open(segment.filename, 'rb')
+      except IOError as e:
+        # Deleted by retention since we listed the directory.
+        log.debug('Skipping segment %s: %s' % (segment.filename, e))
+        continue
+      with fp:
+        reader = RecordIO.Reader(fp, self._codec)
+        if record_number > segment.first_record:
+          reader.skip(record_number - segment.first_record)
+        for record in iter(reader.try_read, None):
+          yield record
+
+  def __iter__(self):
+    return self.iter_from(0)
+
+  def close(self):
+    if self._writer is not None:
+      self._writer.close()
+      self._writer = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
@@ -15,16 +15,28 @@
 # ==================================================================================================
 
 import unittest
+import wsgiref.util
+import zlib
 
-from twitter.common.app.modules.varz import VarsEndpoint, VarsSubsystem
+from twitter.common.app.modules.http import RootServer
+from twitter.common.app.modules.varz import (
+    EndpointTracePlugin,
+    PrometheusEndpoint,
+    VarsEndpoint,
+    VarsSubsystem)
+from twitter.common.http import HttpServer
 from twitter.common.http.server import request
 from twitter.common.quantity import Amount, Time
-from twitter.common.metrics import NamedGauge, RootMetrics
+from twitter.common.metrics import Histogram, MutatorGauge, NamedGauge, RootMetrics
 
 import json
 import pytest
 
 
+def vars_json(endpoint):
+  return json.loads(b''.join(endpoint.handle_vars_json()).decode('utf-8'))
+
+
 class TestVarz(unittest.TestCase):
   def test_breaking_out_regex(self):
     vars_subsystem = VarsSubsystem()
@@ -46,7 +58,7 @@ class TestVarz(unittest.TestCase):
     regex = vars_subsystem.compile_stats_filters(["alpha", "beta.*"])
     endpoint = VarsEndpoint(period=Amount(60000, Time.MILLISECONDS), stats_filter=regex)
     request.GET.append('filtered', '1')
-    metrics_returned = endpoint.handle_vars_json()
+    metrics_returned = vars_json(endpoint)
     assert "zone" in metrics_returned
     assert "alpha" not in metrics_returned
     request.GET.replace('filtered', None)
@@ -62,7 +74,7 @@ class TestVarz(unittest.TestCase):
     vars_subsystem = VarsSubsystem()
     regex = vars_subsystem.compile_stats_filters(["alpha", "beta.*"])
     endpoint = VarsEndpoint(period=Amount(60000, Time.MILLISECONDS), stats_filter=regex)
-    metrics_returned = endpoint.handle_vars_json()
+    metrics_returned = vars_json(endpoint)
     assert "zone" in metrics_returned
     assert "alpha" in metrics_returned
     request.GET.replace('filtered', None)
@@ -79,7 +91,205 @@ class TestVarz(unittest.TestCase):
     regex = None
     endpoint = VarsEndpoint(period=Amount(60000, Time.MILLISECONDS), stats_filter=regex)
     request.GET.append('filtered', '1')
-    metrics_returned = endpoint.handle_vars_json()
+    metrics_returned = vars_json(endpoint)
     assert "zone" in metrics_returned
     assert "alpha" in metrics_returned
-    request.GET.replace('filtered', None)
\ No newline at end of file
+    request.GET.replace('filtered', None)
+  def test_vars_json_since(self):
+    rm = RootMetrics()
+    rm.clear()
+    counter = rm.register(MutatorGauge('counter', 0))
+    rm.register(NamedGauge('constant', 'value'))
+    endpoint = VarsEndpoint(period=Amount(60000, Time.MILLISECONDS))
+    try:
+      request.GET.append('since', '')
+      full = endpoint.handle_vars_json()
+      assert not full['delta']
+      assert full['vars'] == {'counter': 0, 'constant': 'value'}
+
+      counter.write(1)
+      endpoint._monitor.iterate()
+      request.GET.replace('since', full['token'])
+      delta = endpoint.handle_vars_json()
+      assert delta['delta']
+      assert delta['vars'] == {'counter': 1}
+      assert delta['removed'] == []
+      assert delta['token'] != full['token']
+
+      request.GET.replace('since', 'expired-token')
+      assert not endpoint.handle_vars_json()['delta']
+    finally:
+      request.GET.replace('since', None)
+      del request.GET['since']
+      rm.clear()
+
+  def test_prometheus_endpoint(self):
+    rm = RootMetrics()
+    rm.clear()
+    rm.register(MutatorGauge('counter', 7))
+    rm.scope('http').register(Histogram('latency_ms')).record(5)
+    endpoint = VarsEndpoint(period=Amount(60000, Time.MILLISECONDS))
+    try:
+      endpoint.sampler.iterate()
+      server = HttpServer()
+      server.mount_routes(PrometheusEndpoint(endpoint.sampler))
+      environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/metrics'}
+      wsgiref.util.setup_testing_defaults(environ)
+      body = ''.join(server.app(environ, lambda status, headers: None))
+      assert '# TYPE counter gauge\ncounter 7\n' in body
+      assert 'http_latency_ms_count 1\n' in body
+      assert 'http_latency_ms_p50' not in body
+    finally:
+      rm.clear()
+
+  def test_vars_prefix_and_gzip(self):
+    rm = RootMetrics()
+    rm.clear()
+    for name, value in (('zk.b', 2), ('zk.a', 1), ('zka', 3), ('zoo', 4), ('http.x', 5)):
+      rm.register(MutatorGauge(name, value))
+    endpoint = VarsEndpoint(period=Amount(60000, Time.MILLISECONDS))
+    try:
+      endpoint.sampler.iterate()
+      server = HttpServer()
+      server.mount_routes(endpoint)
+
+      def get(path, query='', **environ):
+        environ.update(REQUEST_METHOD='GET', PATH_INFO=path, QUERY_STRING=query)
+        wsgiref.util.setup_testing_defaults(environ)
+        headers = {}
+        body = b''.join(server.app(environ, lambda status, hs: headers.update(hs)))
+        return headers, body
+
+      assert get('/vars')[1] == b'http.x 5\nzk.a 1\nzk.b 2\nzka 3\nzoo 4'
+      assert get('/vars', 'prefix=zk.')[1] == b'zk.a 1\nzk.b 2'
+      assert get('/vars', 'prefix=zz')[1] == b''
+      assert json.loads(get('/vars.json', 'prefix=z')[1].decode('utf-8')) == {
+          'zk.a': 1, 'zk.b': 2, 'zka': 3, 'zoo': 4}
+      headers, body = get('/vars.json', 'prefix=zk.', HTTP_ACCEPT_ENCODING='gzip')
+      assert headers['Content-Encoding'] == 'gzip'
+      assert json.loads(zlib.decompress(body, 16 + zlib.MAX_WBITS).decode('utf-8')) == {
+          'zk.a': 1, 'zk.b': 2}
+    finally:
+      rm.clear()
+
+  def test_vars_cache_metrics_exported(self):
+    rm = RootMetrics()
+    rm.clear()
+    endpoint = VarsEndpoint(period=Amount(60000, Time.MILLISECONDS))
+    try:
+      RootServer().mount_routes(endpoint)
+      sample = rm.sample()
+      for name in ('handle_vars', 'handle_vars_json'):
+        assert sample['http_cache.%s.hits' % name] == 0
+        assert sample['http_cache.%s.misses' % name] == 0
+    finally:
+      rm.clear()
+
+  def test_vars_streams_before_rendering_everything(self):
+    rm = RootMetrics()
+    rm.clear()
+    for k in range(5000):
+      rm.register(MutatorGauge('some.fairly.long.metric.name.number.%05d' % k, k))
+    endpoint = VarsEndpoint(period=Amount(60000, Time.MILLISECONDS))
+    try:
+      endpoint.sampler.iterate()
+      rendered = []
+      render_text = endpoint._render_text
+      def tracked_render_text(names, sample):
+        for line in render_text(names, sample):
+          rendered.append(line)
+          yield line
+      endpoint._render_text = tracked_render_text
+      server = HttpServer()
+      server.mount_routes(endpoint)
+
+      environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/vars'}
+      wsgiref.util.setup_testing_defaults(environ)
+      chunks = iter(server.app(environ, lambda status, headers: None))
+      first = next(chunks)
+      assert first.startswith(b'some.fairly.long.metric.name.number.00000 0\n')
+      assert 0 < len(rendered) < 5000
+      body = first + b''.join(chunks)
+      assert len(rendered) == 5000
+      assert body.count(b'\n') == 4999
+    finally:
+      rm.clear()
+
+
+class FakeClock(object):
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+def test_endpoint_trace_plugin_routes():
+  clock = FakeClock()
+
+  class Endpoints(object):
+    @HttpServer.route('/hello/:name')
+    def hello(self, name):
+      clock.now += 0.010
+      return 'hello %s' % name
+
+    @HttpServer.route('/stream')
+    def stream(self):
+      def chunks():
+        clock.now += 0.002
+        yield 'a'
+        clock.now += 0.100
+        yield 'b'
+      return chunks()
+
+    @HttpServer.route('/missing')
+    def missing(self):
+      clock.now += 0.001
+      HttpServer.abort(404, 'nope')
+
+  server = HttpServer()
+  plugin = EndpointTracePlugin(clock=clock)
+  server.install(plugin)
+  server.mount_routes(Endpoints())
+
+  def get(path):
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+    wsgiref.util.setup_testing_defaults(environ)
+    body = server.app(environ, lambda status, headers: None)
+    try:
+      return ''.join(body)
+    finally:
+      if hasattr(body, 'close'):
+        body.close()
+
+  assert get('/hello/alice') == 'hello alice'
+  assert get('/hello/bob') == 'hello bob'
+  assert get('/stream') == 'ab'
+  get('/missing')
+
+  sample = plugin.metrics.sample()
+  # Routes are traced by template, not by path.
+  assert sample['routes.hello_name.GET.latency_ms.count'] == 2
+  assert abs(sample['routes.hello_name.GET.latency_ms.max'] - 10) < 1e-6
+  assert abs(sample['routes.stream.GET.ttfb_ms.max'] - 2) < 1e-6
+  assert abs(sample['routes.stream.GET.latency_ms.max'] - 102) < 1e-6
+  assert sample['routes.missing.GET.latency_ms.count'] == 1
+  assert sample['2xx.count'] == 3
+  assert sample['4xx.count'] == 1
+  assert sample['2xx.total_ns'] == int(0.010 * 1e9) * 2 + int(0.102 * 1e9)
+
+
+def test_endpoint_trace_plugin_bounded_routes():
+  class Route(object):
+    def __init__(self, rule):
+      self.rule, self.method = rule, 'GET'
+
+  plugin = EndpointTracePlugin(max_routes=2)
+  plugin.setup(None)
+  first = plugin._route_stats(Route('/a'))
+  plugin._route_stats(Route('/b.json'))
+  assert plugin._route_stats(Route('/a')) is first
+  other = plugin._route_stats(Route('/c'))
+  assert plugin._route_stats(Route('/d')) is other
+  assert EndpointTracePlugin.route_name('/b.json') == 'b_json'
+  assert EndpointTracePlugin.route_name('/') == 'root'
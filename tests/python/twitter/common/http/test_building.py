@@ -112,3 +112,39 @@ def test_bind_method():
   bs._bind_method(BaseServerIsSubclass(), 'method_two')
   assert bs.method_one() == 'method_one'
   assert bs.method_two() == 'method_two'
+
+
+@skipifpy3k
+def test_stream_gzip():
+  import zlib
+
+  class StreamingServer(object):
+    @HttpServer.route('/lines')
+    def lines(self):
+      return HttpServer.stream(('line %d\n' % k for k in range(1000)), buffer_size=1024)
+
+  server = HttpServer()
+  server.mount_routes(StreamingServer())
+  expected = ''.join('line %d\n' % k for k in range(1000))
+
+  headers = {}
+  def start_response(status, response_headers):
+    assert int(status.split()[0]) == 200
+    headers.clear()
+    headers.update(response_headers)
+
+  chunks = list(server.app(make_request('/lines'), start_response))
+  assert len(chunks) > 1
+  assert ''.join(chunks) == expected
+  assert 'Content-Encoding' not in headers
+  assert headers['Vary'] == 'Accept-Encoding'
+
+  request = make_request('/lines')
+  request['HTTP_ACCEPT_ENCODING'] = 'deflate, gzip'
+  body = ''.join(server.app(request, start_response))
+  assert headers['Content-Encoding'] == 'gzip'
+  assert zlib.decompress(body, 16 + zlib.MAX_WBITS) == expected
+
+  request = make_request('/lines')
+  request['HTTP_ACCEPT_ENCODING'] = 'gzip;q=0'
+  assert ''.join(server.app(request, start_response)) == expected
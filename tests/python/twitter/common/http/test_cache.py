@@ -0,0 +1,201 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import gc
+import wsgiref.util
+
+from twitter.common.http import HttpServer
+from twitter.common.http.cache import ResponseCache
+
+
+class CountingServer(HttpServer):
+  def __init__(self):
+    self.calls = 0
+    self.content_type = 'text/plain'
+    HttpServer.__init__(self)
+
+  @HttpServer.route('/text')
+  @HttpServer.route('/text/:name')
+  @HttpServer.cached(ttl=10, vary=('X-Flavor',))
+  def text(self, name='world'):
+    self.calls += 1
+    HttpServer.set_content_type(self.content_type)
+    return ('hello %s %d' % (name, self.calls) for _ in range(2))
+
+  @HttpServer.route('/json')
+  @HttpServer.cached(ttl=10)
+  def json(self):
+    self.calls += 1
+    return {'calls': self.calls}
+
+  @HttpServer.route('/stream')
+  @HttpServer.cached(ttl=10)
+  def stream(self):
+    self.calls += 1
+    def chunks():
+      for k in range(4):
+        self.produced = k + 1
+        yield 'chunk %d;' % k
+    return HttpServer.stream(chunks(), buffer_size=1)
+
+  @HttpServer.route('/missing')
+  @HttpServer.cached(ttl=10)
+  def missing(self):
+    self.calls += 1
+    HttpServer.abort(404, 'missing')
+
+
+def start(server, path, query='', **headers):
+  environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query}
+  environ.update(('HTTP_' + name.upper(), value) for name, value in headers.items())
+  wsgiref.util.setup_testing_defaults(environ)
+  result = {}
+  def start_response(status, headers):
+    result.update(status=status, headers=dict(headers))
+  return result, server.app(environ, start_response)
+
+
+def get(server, path, query='', **headers):
+  result, body = start(server, path, query, **headers)
+  body = b''.join(body)
+  return result['status'], result['headers'], body
+
+
+def test_cached_per_path_query_and_vary():
+  server = CountingServer()
+  status, headers, body = get(server, '/text')
+  assert status.startswith('200')
+  assert body == b'hello world 1hello world 1'
+  assert get(server, '/text')[2] == body
+  server.content_type = 'text/html'
+  status, headers, body = get(server, '/text')
+  assert headers['Content-Type'] == 'text/plain'
+  assert body == b'hello world 1hello world 1'
+  assert get(server, '/text', query='a=b')[2] == b'hello world 2hello world 2'
+  assert get(server, '/text/zaphod')[2] == b'hello zaphod 3hello zaphod 3'
+  assert get(server, '/text', x_flavor='sour')[2] == b'hello world 4hello world 4'
+  assert get(server, '/text', x_flavor='sour')[2] == b'hello world 4hello world 4'
+  assert server.calls == 4
+
+
+def test_caches_by_method():
+  server = CountingServer()
+  assert sorted(server.caches) == ['json', 'missing', 'stream', 'text']
+  get(server, '/json')
+  get(server, '/json')
+  sample = server.caches['json'].metrics.sample()
+  assert sample['misses'] == 1
+  assert sample['hits'] == 1
+
+
+def test_cached_json():
+  server = CountingServer()
+  for _ in range(3):
+    status, headers, body = get(server, '/json')
+    assert headers['Content-Type'] == 'application/json'
+    assert body == b'{"calls": 1}'
+
+
+def test_errors_not_cached():
+  server = CountingServer()
+  assert get(server, '/missing')[0].startswith('404')
+  assert get(server, '/missing')[0].startswith('404')
+  assert server.calls == 2
+
+
+def test_streamed_miss_passes_chunks_through():
+  server = CountingServer()
+  result, body = start(server, '/stream')
+  chunks = iter(body)
+  assert next(chunks) == b'chunk 0;'
+  assert server.produced == 1
+  assert result['status'].startswith('200')
+  # The ETag of a streamed body is only known once it has been sent, i.e. from the next hit.
+  assert 'Etag' not in result['headers']
+  assert b''.join(chunks) == b'chunk 1;chunk 2;chunk 3;'
+  status, headers, body = get(server, '/stream')
+  assert body == b'chunk 0;chunk 1;chunk 2;chunk 3;'
+  assert 'Etag' in headers
+  assert server.calls == 1
+
+
+def test_streamed_body_not_cached_unless_sent_in_full():
+  server = CountingServer()
+  result, body = start(server, '/stream')
+  chunks = iter(body)
+  next(chunks)
+  # An abandoned response, e.g. on a client disconnect, is closed when it is collected.
+  del body, chunks
+  gc.collect()
+  get(server, '/stream')
+  assert server.calls == 2
+
+
+def test_etag_not_modified():
+  server = CountingServer()
+  get(server, '/text')
+  status, headers, body = get(server, '/text')
+  etag = headers['Etag']
+  status, headers, body = get(server, '/text', if_none_match='"other", %s' % etag)
+  assert status.startswith('304')
+  assert body == b''
+  assert headers['Etag'] == etag
+  assert get(server, '/text', if_none_match='"other"')[0].startswith('200')
+  assert get(server, '/text', if_none_match='W/' + etag)[0].startswith('304')
+  assert server.calls == 1
+
+
+class FakeClock(object):
+  def __init__(self):
+    self.now = 0
+
+  def __call__(self):
+    return self.now
+
+
+def test_ttl_and_eviction():
+  clock = FakeClock()
+  cache = ResponseCache(ttl=5, max_entries=2, max_bytes=10, clock=clock)
+  calls = []
+  callback = cache.apply(lambda: calls.append(1) or 'abcd', None)
+
+  def request(path):
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+    wsgiref.util.setup_testing_defaults(environ)
+    HttpServer.request.bind(environ)
+    HttpServer.response.bind()
+    return callback()
+
+  assert request('/a') == b'abcd'
+  assert request('/a') == b'abcd'
+  assert len(calls) == 1
+  clock.now = 5
+  request('/a')
+  assert len(calls) == 2
+
+  # /c pushes out the least recently used /b, within both max_entries and max_bytes
+  request('/b')
+  request('/a')
+  request('/c')
+  assert len(calls) == 4
+  sample = cache.metrics.sample()
+  assert sample['entries'] == 2
+  assert sample['bytes'] == 8
+  assert sample['evictions'] == 1
+  request('/a')
+  assert len(calls) == 4
+  request('/b')
+  assert len(calls) == 5
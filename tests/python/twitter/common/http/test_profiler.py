@@ -0,0 +1,72 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import threading
+import wsgiref.util
+
+from twitter.common.http import HttpServer
+from twitter.common.http.diagnostics import DiagnosticsEndpoints
+from twitter.common.http.profiler import SamplingProfiler
+
+import pytest
+
+
+def spin_until(event):
+  while not event.is_set():
+    pass
+
+
+def test_sampling_profiler():
+  stop = threading.Event()
+  spinner = threading.Thread(target=spin_until, args=(stop,), name='spinner')
+  spinner.start()
+  try:
+    profiler = SamplingProfiler(hz=200).profile(0.2)
+  finally:
+    stop.set()
+    spinner.join()
+  assert profiler.samples > 0
+  lines = list(profiler.collapsed())
+  spinning = [line.rsplit(' ', 1) for line in lines if line.startswith('spinner;')]
+  assert spinning
+  assert all(';spin_until (' in stack for stack, _ in spinning)
+  assert 0 < sum(int(count) for _, count in spinning) <= profiler.samples
+  # Neither the profiling nor the sampling thread is reported.
+  assert not any('SamplingProfiler' in line for line in lines)
+  assert not any('test_sampling_profiler (' in line for line in lines)
+
+  with pytest.raises(RuntimeError):
+    profiler.start()
+  with pytest.raises(ValueError):
+    SamplingProfiler(hz=0)
+
+
+def test_profile_sample_endpoint():
+  server = HttpServer()
+  server.mount_routes(DiagnosticsEndpoints())
+
+  def get(query):
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/profile/sample', 'QUERY_STRING': query}
+    wsgiref.util.setup_testing_defaults(environ)
+    result = []
+    body = b''.join(server.app(environ, lambda status, headers: result.append(status)))
+    return result[0], body
+
+  status, body = get('seconds=0.1&hz=100')
+  assert status.startswith('200')
+  assert b'MainThread;' not in body
+  for query in ('seconds=0', 'seconds=abc', 'hz=100000', 'seconds=100000'):
+    assert get(query)[0].startswith('400')
@@ -0,0 +1,133 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import socket
+import threading
+from contextlib import contextmanager
+
+try:
+  from httplib import HTTPConnection
+except ImportError:
+  from http.client import HTTPConnection
+
+from twitter.common.http import HttpServer
+from twitter.common.http.threaded import ThreadPoolServer
+
+import pytest
+
+
+class Endpoints(object):
+  def __init__(self):
+    self.release = threading.Event()
+
+  @HttpServer.route('/hello')
+  def hello(self):
+    return 'hello'
+
+  @HttpServer.route('/stream')
+  def stream(self):
+    return iter(['a', 'b'])
+
+  @HttpServer.route('/block')
+  def block(self):
+    self.release.wait(10)
+    return 'released'
+
+
+@contextmanager
+def serving(**kw):
+  endpoints = Endpoints()
+  server = HttpServer()
+  server.mount_routes(endpoints)
+  adapter = ThreadPoolServer(host='127.0.0.1', port=0, quiet=True, **kw)
+  wsgi_server = adapter.make_server(server.app)
+  thread = threading.Thread(target=wsgi_server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  try:
+    yield wsgi_server.server_address[1], endpoints, adapter
+  finally:
+    endpoints.release.set()
+    wsgi_server.shutdown()
+    wsgi_server.server_close()
+
+
+def get(connection, path):
+  connection.request('GET', path)
+  response = connection.getresponse()
+  return response.status, response.read(), response.getheader('Connection')
+
+
+@pytest.mark.skipif('sys.version_info >= (3,0)')
+def test_threadpool_keepalive():
+  with serving() as (port, _, adapter):
+    connection = HTTPConnection('127.0.0.1', port, timeout=5)
+    assert get(connection, '/hello') == (200, b'hello', None)
+    sock = connection.sock
+    assert get(connection, '/hello') == (200, b'hello', None)
+    assert connection.sock is sock
+
+    # Responses of unknown length close the connection.
+    assert get(connection, '/stream') == (200, b'ab', 'close')
+    connection.close()
+
+    sample = adapter.metrics.sample()
+    assert sample['requests'] == 3
+    assert sample['latency_ms.count'] == 3
+    assert sample['rejected'] == 0
+
+
+@pytest.mark.skipif('sys.version_info >= (3,0)')
+def test_threadpool_concurrency_and_rejection():
+  with serving(workers=1, max_queue=1) as (port, endpoints, adapter):
+    blocked = HTTPConnection('127.0.0.1', port, timeout=10)
+    blocked.request('GET', '/block')
+    # Wait for the only worker to pick up the blocking request.
+    for _ in range(500):
+      if adapter.metrics.sample()['active'] == 1:
+        break
+      threading.Event().wait(0.01)
+    assert adapter.metrics.sample()['active'] == 1
+
+    queued = HTTPConnection('127.0.0.1', port, timeout=10)
+    queued.request('GET', '/hello')
+    for _ in range(500):
+      if adapter.metrics.sample()['queue_depth'] == 1:
+        break
+      threading.Event().wait(0.01)
+
+    rejected = HTTPConnection('127.0.0.1', port, timeout=10)
+    assert get(rejected, '/hello')[0] == 503
+    assert adapter.metrics.sample()['rejected'] == 1
+
+    endpoints.release.set()
+    assert blocked.getresponse().read() == b'released'
+    assert queued.getresponse().read() == b'hello'
+
+
+@pytest.mark.skipif('sys.version_info >= (3,0)')
+def test_threadpool_serves_concurrently():
+  with serving(workers=2) as (port, endpoints, _):
+    blocked = HTTPConnection('127.0.0.1', port, timeout=10)
+    blocked.request('GET', '/block')
+    assert get(HTTPConnection('127.0.0.1', port, timeout=5), '/hello')[:2] == (200, b'hello')
+    endpoints.release.set()
+    assert blocked.getresponse().read() == b'released'
+
+
+def test_threadpool_arguments():
+  with pytest.raises(ValueError):
+    ThreadPoolServer(workers=0)
@@ -0,0 +1,40 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import time
+
+from twitter.common import lang
+from twitter.common.lang import Compatibility
+
+
+def test_monotonic():
+  start = Compatibility.monotonic()
+  time.sleep(0.01)
+  elapsed = Compatibility.monotonic() - start
+  assert 0.005 < elapsed < 5
+
+
+def test_monotonic_resolved_lazily():
+  if Compatibility.PY3:
+    return
+  assert Compatibility.monotonic is lang._monotonic
+  del lang._MONOTONIC[:]
+  lang._MONOTONIC.append(lambda: 42.0)
+  try:
+    assert Compatibility.monotonic() == 42.0
+  finally:
+    del lang._MONOTONIC[:]
+  assert Compatibility.monotonic() > 0
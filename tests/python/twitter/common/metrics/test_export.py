@@ -0,0 +1,186 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import os
+import socket
+
+from twitter.common.contextutil import temporary_dir
+from twitter.common.metrics import Label, MutatorGauge
+from twitter.common.metrics.export import (
+    GraphiteProtocol,
+    MetricExporter,
+    Spool,
+    StatsdProtocol,
+    TCPTransport,
+    Transport,
+    UDPTransport)
+from twitter.common.metrics.metrics import Metrics
+from twitter.common.quantity import Amount, Data
+
+import pytest
+
+
+class FakeClock(object):
+  def __init__(self):
+    self._time = 1000
+
+  def time(self):
+    return self._time
+
+  def sleep(self, seconds):
+    pass
+
+
+class RecordingTransport(Transport):
+  def __init__(self):
+    self.payloads = []
+    self.up = True
+
+  def send(self, payload):
+    if not self.up:
+      raise self.Error('down')
+    self.payloads.append(payload)
+
+
+def make_metrics():
+  metrics = Metrics()
+  metrics.register(Label('version', 'abc'))
+  alpha = metrics.register(MutatorGauge('alpha', 1))
+  beta = metrics.scope('scope').register(MutatorGauge('beta', 2.5))
+  return metrics, alpha, beta
+
+
+def test_exporter_sends_changed_values():
+  metrics, alpha, beta = make_metrics()
+  transport = RecordingTransport()
+  exporter = MetricExporter(metrics, GraphiteProtocol(), transport, prefix='host',
+      clock=FakeClock())
+  exporter.iterate()
+  assert transport.payloads == ['host.alpha 1 1000\nhost.scope.beta 2.5 1000\n']
+
+  exporter.iterate()
+  assert len(transport.payloads) == 1
+
+  alpha.write(5)
+  exporter.iterate()
+  assert transport.payloads[1:] == ['host.alpha 5 1000\n']
+  assert exporter.metrics.sample()['sent'] == 2
+
+
+def test_exporter_batches():
+  metrics = Metrics()
+  for k in range(100):
+    metrics.register(MutatorGauge('metric%03d' % k, k))
+  transport = RecordingTransport()
+  exporter = MetricExporter(metrics, StatsdProtocol(), transport,
+      max_payload=Amount(100, Data.BYTES), clock=FakeClock())
+  exporter.iterate()
+  assert len(transport.payloads) > 10
+  assert all(len(payload) <= 100 for payload in transport.payloads)
+  lines = ''.join(transport.payloads).splitlines()
+  assert lines == ['metric%03d:%d|g' % (k, k) for k in range(100)]
+
+
+def test_exporter_spools_and_drains():
+  metrics, alpha, _ = make_metrics()
+  transport = RecordingTransport()
+  with temporary_dir() as td:
+    spool = Spool(os.path.join(td, 'spool'))
+    exporter = MetricExporter(metrics, StatsdProtocol(), transport, spool=spool,
+        clock=FakeClock())
+    transport.up = False
+    exporter.iterate()
+    alpha.write(2)
+    exporter.iterate()
+    assert spool.pending == 2
+    assert exporter.metrics.sample()['spool_depth'] == 2
+    assert exporter.metrics.sample()['failed'] == 2
+
+    # The spool survives a restart.
+    assert Spool(os.path.join(td, 'spool')).pending == 2
+
+    transport.up = True
+    alpha.write(3)
+    exporter.iterate()
+    assert transport.payloads == ['alpha:1|g\nscope.beta:2.5|g\n', 'alpha:2|g\n', 'alpha:3|g\n']
+    assert spool.pending == 0
+    assert os.path.getsize(os.path.join(td, 'spool')) == 0
+
+    # The spool is reused after it has been drained.
+    transport.up = False
+    alpha.write(4)
+    exporter.iterate()
+    transport.up = True
+    exporter.iterate()
+    assert transport.payloads[-1] == 'alpha:4|g\n'
+    exporter.close()
+
+
+def test_spool_bounded():
+  with temporary_dir() as td:
+    spool = Spool(os.path.join(td, 'spool'), max_size=Amount(20, Data.BYTES))
+    assert spool.append('0123456789')
+    assert not spool.append('0123456789')
+    assert spool.pending == 1
+
+
+def test_udp_transport():
+  server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  server.bind(('127.0.0.1', 0))
+  server.settimeout(5)
+  try:
+    transport = UDPTransport('127.0.0.1', server.getsockname()[1])
+    metrics, _, _ = make_metrics()
+    MetricExporter(metrics, StatsdProtocol(), transport, clock=FakeClock()).iterate()
+    assert server.recv(65536) == 'alpha:1|g\nscope.beta:2.5|g\n'
+    transport.close()
+  finally:
+    server.close()
+
+
+def test_tcp_transport_reconnects():
+  server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  server.bind(('127.0.0.1', 0))
+  port = server.getsockname()[1]
+  server.listen(1)
+  server.settimeout(5)
+  transport = TCPTransport('127.0.0.1', port)
+  try:
+    transport.send('one\n')
+    connection, _ = server.accept()
+    assert connection.recv(4) == 'one\n'
+    connection.close()
+    server.close()
+
+    # The receiver is down: sends fail (perhaps only once the peer's reset arrives.)
+    with pytest.raises(Transport.Error):
+      for _ in range(100):
+        transport.send('two\n')
+    with pytest.raises(Transport.Error):
+      transport.send('three\n')
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', port))
+    server.listen(1)
+    server.settimeout(5)
+    transport.send('four\n')
+    connection, _ = server.accept()
+    assert connection.recv(5) == 'four\n'
+    connection.close()
+  finally:
+    transport.close()
+    server.close()
@@ -14,6 +14,8 @@
 # limitations under the License.
 # ==================================================================================================
 
+import threading
+
 import pytest
 
 from twitter.common.quantity import Amount, Time, Data
@@ -21,6 +23,7 @@ from twitter.common.metrics import (
   Label,
   AtomicGauge,
   MutatorGauge,
+  StripedCounter,
 
   gaugelike,
   namable,
@@ -103,3 +106,31 @@ def test_duck_typing():
 
   A.read = '5'
   assert not gaugelike(A)
+
+
+def test_striped_counter():
+  counter = StripedCounter('requests')
+  assert counter.name() == 'requests'
+  assert counter.read() == 0
+  counter.increment()
+  counter.add(5)
+  counter.decrement()
+  assert counter.read() == 5
+  with pytest.raises(TypeError):
+    StripedCounter('requests', 1.5)
+
+
+def test_striped_counter_threads():
+  counter = StripedCounter('requests', 10)
+  def worker():
+    for _ in range(1000):
+      counter.increment()
+  threads = [threading.Thread(target=worker) for _ in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert counter.read() == 8010
+  # Slots of exited threads are folded into the base value.
+  assert len(counter._slots) <= 1
+  assert counter.read() == 8010
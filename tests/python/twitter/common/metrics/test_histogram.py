@@ -0,0 +1,120 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import random
+import threading
+
+import pytest
+
+from twitter.common.metrics import Histogram
+from twitter.common.metrics.metrics import Metrics
+
+
+def assert_close(estimate, actual, precision=Histogram.DEFAULT_PRECISION):
+  assert abs(estimate - actual) <= actual * 2.0 ** -precision
+
+
+def test_histogram_empty():
+  h = Histogram('latency')
+  assert h.sample() == {'count': 0, 'max': 0, 'p50': 0, 'p90': 0, 'p99': 0, 'p999': 0}
+
+
+def test_histogram_percentiles():
+  h = Histogram('latency')
+  for value in range(1, 10001):
+    h.record(value)
+  sample = h.sample()
+  assert sample['count'] == 10000
+  assert sample['max'] == 10000
+  assert_close(sample['p50'], 5000)
+  assert_close(sample['p90'], 9000)
+  assert_close(sample['p99'], 9900)
+  assert_close(sample['p999'], 9990)
+
+
+def test_histogram_wide_range():
+  h = Histogram('latency', precision=7)
+  values = [random.lognormvariate(0, 5) for _ in range(5000)]
+  for value in values:
+    h.record(value)
+  values.sort()
+  p50, p99 = h.percentiles([0.5, 0.99])
+  assert_close(p50, values[2499], precision=7)
+  assert_close(p99, values[4949], precision=7)
+
+
+def test_histogram_zeros_and_counts():
+  h = Histogram('latency')
+  h.record(0, count=90)
+  h.record(100, count=10)
+  assert h.percentiles([0.5, 0.9, 0.95]) == [0, 0, h.percentiles([0.95])[0]]
+  assert_close(h.percentiles([0.95])[0], 100)
+  with pytest.raises(ValueError):
+    h.record(-1)
+  h.reset()
+  assert h.sample()['count'] == 0
+
+
+def test_histogram_merge_across_threads():
+  histograms = [Histogram('latency') for _ in range(4)]
+  def record(h, offset):
+    for value in range(offset, 4000, 4):
+      h.record(value + 1)
+  threads = [threading.Thread(target=record, args=(h, k)) for k, h in enumerate(histograms)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  merged = Histogram('latency')
+  for h in histograms:
+    merged.merge(h)
+  assert merged.sample()['count'] == 4000
+  assert merged.sample()['max'] == 4000
+  assert_close(merged.sample()['p50'], 2000)
+  with pytest.raises(ValueError):
+    merged.merge(Histogram('other', precision=3))
+
+
+def test_histogram_in_metrics():
+  metrics = Metrics()
+  h = metrics.scope('http').register(Histogram('latency_ms'))
+  h.record(5)
+  sample = metrics.sample()
+  assert sample['http.latency_ms.count'] == 1
+  assert sample['http.latency_ms.max'] == 5
+  assert_close(sample['http.latency_ms.p99'], 5)
+  assert 'http.latency_ms' not in sample
+
+
+def test_histogram_cumulative():
+  h = Histogram('latency')
+  for value in (0, 1, 3, 3.5, 7, 100):
+    h.record(value)
+  counts, count, total = h.cumulative([1, 2, 4, 8, 64, 128])
+  assert counts == [2, 2, 4, 5, 5, 6]
+  assert count == 6
+  assert total == 114.5
+
+
+def test_histogram_cumulative_includes_bounds():
+  h = Histogram('latency')
+  for value in (1, 2, 4, 4, 8):
+    h.record(value)
+  assert h.cumulative([1, 2, 4, 8])[0] == [1, 2, 4, 5]
+  assert h.cumulative([0.5, 3.99, 7.9])[0] == [0, 2, 4]
+  p20, p100 = h.percentiles([0.2, 1.0])
+  assert_close(p20, 1)
+  assert_close(p100, 8)
@@ -120,3 +120,49 @@ def test_observable():
   metrics = Metrics()
   metrics.register_observable('derpspace', Derp())
   assert metrics.sample() == {'derpspace.value': 'derp value'}
+
+
+def test_flatten_cache():
+  metrics = Metrics()
+  a, b = metrics.scope('a'), metrics.scope('b')
+  a.register(Label('x', 1))
+  b.scope('c').register(Label('y', 2))
+  flat = metrics.flatten()
+  assert sorted(name for name, _, _ in flat) == ['a.x', 'b.c.y']
+  assert metrics.flatten() is flat
+
+  # Unchanged subtrees are reused when an unrelated tree changes.
+  b_flat = b.flatten()
+  a.register(Label('z', 3))
+  assert metrics.flatten() is not flat
+  assert b.flatten() is b_flat
+  assert metrics.sample() == {'a.x': 1, 'a.z': 3, 'b.c.y': 2}
+
+  # Changes in trees not attached to this one do not invalidate it.
+  flat = metrics.flatten()
+  Metrics().register(Label('elsewhere', 4))
+  assert metrics.flatten() is flat
+
+  a.unregister('x')
+  b.unregister_observable('c')
+  assert metrics.sample() == {'a.z': 3}
+
+
+def test_flattened_sample_reads_live_values():
+  metrics = Metrics()
+  gauge = metrics.scope('scope').register(MutatorGauge('gauge', 1))
+  assert metrics.sample() == {'scope.gauge': 1}
+  gauge.write(2)
+  assert metrics.sample() == {'scope.gauge': 2}
+
+
+def test_flattened_sample_skips_failing_gauges():
+  class Broken(object):
+    def name(self):
+      return 'broken'
+    def read(self):
+      raise ValueError('broken')
+  metrics = Metrics()
+  metrics.register(Broken())
+  metrics.register(Label('fine', 'yes'))
+  assert metrics.sample() == {'fine': 'yes'}
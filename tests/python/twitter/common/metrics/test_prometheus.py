@@ -0,0 +1,83 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+from twitter.common.metrics import Histogram, Label, MutatorGauge, PrometheusFormat
+from twitter.common.metrics.metrics import Metrics
+
+
+def render(sample, histograms=(), **kw):
+  return ''.join(PrometheusFormat(**kw).render(sample, histograms))
+
+
+def test_prometheus_names():
+  fmt = PrometheusFormat(rules=[r'http\.(?P<status>\dxx)\..*', r'(?P<pool>[^.]+)\.pool\..*'])
+  assert fmt.name('http.requests.count') == ('http_requests_count', ())
+  assert fmt.name('http.2xx.count') == ('http_count', (('status', '2xx'),))
+  assert fmt.name('web.pool.active') == ('pool_active', (('pool', 'web'),))
+  assert fmt.name('sys.uptime-secs') == ('sys_uptime_secs', ())
+  assert fmt.name('5xx') == ('_5xx', ())
+
+
+def test_prometheus_render():
+  text = render({
+    'http.2xx.count': 3,
+    'http.5xx.count': 1,
+    'sys.load': 0.5,
+    'sys.healthy': True,
+    'sys.version': '2.7 "final"',
+    'nothing': None,
+  }, rules=[r'http\.(?P<status>\dxx)\..*'])
+  assert text == '\n'.join([
+    '# TYPE http_count gauge',
+    'http_count{status="2xx"} 3',
+    'http_count{status="5xx"} 1',
+    '# TYPE sys_healthy gauge',
+    'sys_healthy 1',
+    '# TYPE sys_load gauge',
+    'sys_load 0.5',
+    '# TYPE sys_version gauge',
+    'sys_version{value="2.7 \\"final\\""} 1',
+  ]) + '\n'
+
+
+def test_prometheus_histograms():
+  metrics = Metrics()
+  metrics.register(MutatorGauge('requests', 2))
+  latency = metrics.scope('http').register(Histogram('latency_ms'))
+  latency.record(3)
+  latency.record(40)
+  histograms = PrometheusFormat.histograms(metrics)
+  assert histograms == [('http.latency_ms', latency)]
+
+  lines = render(metrics.sample(), histograms, buckets=[4, 16, 64]).splitlines()
+  assert lines == [
+    '# TYPE http_latency_ms histogram',
+    'http_latency_ms_bucket{le="4.0"} 1',
+    'http_latency_ms_bucket{le="16.0"} 1',
+    'http_latency_ms_bucket{le="64.0"} 2',
+    'http_latency_ms_bucket{le="+Inf"} 2',
+    'http_latency_ms_sum 43',
+    'http_latency_ms_count 2',
+    '# TYPE requests gauge',
+    'requests 2',
+  ]
+
+
+def test_prometheus_values():
+  assert PrometheusFormat.format_value(float('nan')) == 'NaN'
+  assert PrometheusFormat.format_value(float('-inf')) == '-Inf'
+  assert PrometheusFormat.format_value(False) == '0'
+  assert PrometheusFormat.format_value(10 ** 20) == str(10 ** 20)
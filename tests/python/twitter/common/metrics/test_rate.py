@@ -22,7 +22,8 @@ from twitter.common.metrics import (
   AtomicGauge,
   MutatorGauge,
   NamedGauge,
-  Rate
+  Rate,
+  Rates
 )
 
 class FakeGauge(NamedGauge):
@@ -91,3 +92,32 @@ class TestRate(unittest.TestCase):
     assert rate.name() == 'holyguacamole_per_1secs'
     rate = Rate.of(gauge, name = 'holyguacamole', window = Amount(3, Time.HOURS))
     assert rate.name() == 'holyguacamole_per_3hrs'
+
+  def test_bounded_samples(self):
+    clock = TestClock()
+    gauge = FakeGauge('test').supplies(range(1000))
+    rate = Rate("foo", gauge, window = Amount(10, Time.SECONDS), clock=clock, resolution=10)
+    for _ in range(999):
+      clock.advance(0.1)
+      rate.read()
+    assert len(rate._samples) <= 11
+    clock.advance(0.1)
+    assert abs(rate.read() - 10.0) < 1.5
+
+  def test_multiple_windows(self):
+    clock = TestClock()
+    gauge = MutatorGauge('requests', 0)
+    rates = Rates('requests', gauge, clock=clock)
+    assert rates.sample() == {'per_1mins': 0, 'per_5mins': 0, 'per_15mins': 0}
+    for _ in range(10):
+      clock.advance(60.0)
+      gauge.write(gauge.read() + 600)
+      sample = rates.sample()
+    assert sample['per_1mins'] == 10
+    assert sample['per_5mins'] == 10
+    assert sample['per_15mins'] == 10
+    clock.advance(60.0)
+    sample = rates.sample()
+    assert sample['per_1mins'] == 0
+    assert sample['per_5mins'] == 8
+    assert sample['per_15mins'] == 6000.0 / 660
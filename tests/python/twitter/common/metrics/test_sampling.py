@@ -15,10 +15,14 @@
 # ==================================================================================================
 
 import os
+import threading
+import time
+
 import pytest
 
-from twitter.common.contextutil import temporary_file
-from twitter.common.metrics import Label
+from twitter.common.contextutil import temporary_dir, temporary_file
+from twitter.common.metrics import Label, LambdaGauge, MutatorGauge
+from twitter.common.metrics.binary_format import BinaryMetricFormat
 from twitter.common.metrics.metrics import Metrics
 from twitter.common.metrics.sampler import (
     MetricSampler,
@@ -91,6 +95,91 @@ def test_metric_read_write():
     assert reader.sample() == {'herp': 'derp'}
 
 
+def test_metric_read_write_binary():
+  metrics = Metrics()
+  metrics.register(Label('herp', 'derp'))
+  counter = metrics.register(MutatorGauge('counter', 1))
+  metrics.scope('sys').register(MutatorGauge('load', 0.25))
+  metrics.register(MutatorGauge('healthy', True))
+
+  with temporary_dir() as td:
+    filename = os.path.join(td, 'metrics')
+    writer = DiskMetricWriter(metrics, filename, binary=True)
+    reader = DiskMetricReader(filename)
+    writer.iterate()
+    with open(filename, 'rb') as fp:
+      assert BinaryMetricFormat.is_binary(fp.read())
+    reader.iterate()
+    expected = {'herp': 'derp', 'counter': 1, 'sys.load': 0.25, 'healthy': True}
+    assert reader.sample() == expected
+
+    # Unchanged files are not re-read.
+    first = reader.sample()
+    reader.iterate()
+    assert reader.sample() is first
+
+    counter.write(2 ** 70)
+    writer.iterate()
+    reader.iterate()
+    assert reader.sample()['counter'] == 2 ** 70
+    assert os.listdir(td) == ['metrics']
+
+
+def test_metric_read_write_formats_agree():
+  metrics = Metrics()
+  metrics.register(Label('herp', 'derp'))
+  metrics.register(MutatorGauge('counter', 2 ** 70))
+  metrics.register(MutatorGauge('load', 0.25))
+  metrics.register(MutatorGauge('missing', None))
+  metrics.register(MutatorGauge('hosts', ['a', 'b']))
+  metrics.register(MutatorGauge('shards', {'0': 'up', '1': [1, 2.5]}))
+
+  with temporary_dir() as td:
+    samples = []
+    for binary in (False, True):
+      filename = os.path.join(td, 'binary' if binary else 'json')
+      DiskMetricWriter(metrics, filename, binary=binary).iterate()
+      reader = DiskMetricReader(filename)
+      reader.iterate()
+      samples.append(reader.sample())
+    assert samples[0] == samples[1] == {
+        'herp': 'derp', 'counter': 2 ** 70, 'load': 0.25, 'missing': None,
+        'hosts': ['a', 'b'], 'shards': {'0': 'up', '1': [1, 2.5]}}
+
+
+def test_metric_writer_is_atomic():
+  class ExplodingMetrics(Metrics):
+    def sample(self):
+      return {'bad': object()}
+
+  with temporary_dir() as td:
+    filename = os.path.join(td, 'metrics')
+    DiskMetricWriter(Metrics(), filename).iterate()
+    with pytest.raises(TypeError):
+      DiskMetricWriter(ExplodingMetrics(), filename).iterate()
+    assert os.listdir(td) == ['metrics']
+    reader = DiskMetricReader(filename)
+    reader.iterate()
+    assert reader.sample() == {}
+
+
+def test_binary_metric_format():
+  fmt = BinaryMetricFormat()
+  sample = {'a': 1, 'b': -2.5, 'c': u'caf\xe9', 'd': None, 'e': False, 'f': -2 ** 63,
+            'g': [1, u'two'], 'h': {u'k': None}}
+  encoded = fmt.encode(sample)
+  assert BinaryMetricFormat().decode(encoded) == sample
+  # The cached name table is reused when only values change.
+  sample['a'] = 2
+  assert fmt.decode(fmt.encode(sample)) == sample
+  with pytest.raises(BinaryMetricFormat.InvalidFormat):
+    BinaryMetricFormat().decode(encoded[:-8])
+  with pytest.raises(BinaryMetricFormat.InvalidFormat):
+    BinaryMetricFormat().decode(b'garbage')
+  with pytest.raises(TypeError):
+    fmt.encode({'bad': object()})
+
+
 def test_metric_sample():
   metrics = Metrics()
   sampler = MetricSampler(metrics)
@@ -101,3 +190,139 @@ def test_metric_sample():
   assert sampler.sample() == {}
   sampler.iterate()
   assert sampler.sample() == {'herp': 'derp'}
+
+
+def test_metric_sampler_delta():
+  metrics = Metrics()
+  metrics.register(Label('constant', 'value'))
+  counter = metrics.register(MutatorGauge('counter', 0))
+  gone = metrics.register(Label('gone', 'soon'))
+  sampler = MetricSampler(metrics, snapshots=2)
+
+  token, sample = sampler.snapshot()
+  assert sample == {'constant': 'value', 'counter': 0, 'gone': 'soon'}
+  assert sampler.delta(token) == (token, {}, [])
+
+  counter.write(1)
+  metrics.unregister('gone')
+  metrics.register(Label('new', 'metric'))
+  sampler.iterate()
+  new_token, changed, removed = sampler.delta(token)
+  assert new_token != token
+  assert changed == {'counter': 1, 'new': 'metric'}
+  assert removed == ['gone']
+  assert sampler.snapshot() == (new_token, sampler.sample())
+
+  # Only the most recent snapshots are retained.
+  sampler.iterate()
+  assert sampler.delta(token) is None
+  assert sampler.delta(new_token)[1:] == ({}, [])
+
+  # Tokens from other samplers, or garbage, are not valid.
+  assert MetricSampler(metrics).delta(new_token) is None
+  assert sampler.delta('garbage') is None
+  assert sampler.delta(None) is None
+
+
+def test_metric_sampler_slow_gauges():
+  class FakeClock(object):
+    def __init__(self):
+      self.now = 0
+      self.done = threading.Event()
+
+    def time(self):
+      return self.now
+
+    def sleep(self, seconds):
+      # Park the slow gauge thread, which the test drives by hand.
+      self.done.wait()
+
+  clock = FakeClock()
+  delays = {'slow': 1.0}
+  def read(name, value):
+    def fn():
+      clock.now += delays.get(name, 0)
+      return value
+    return fn
+
+  metrics = Metrics()
+  metrics.register(LambdaGauge('fast', read('fast', 1)))
+  slow_value = [2]
+  metrics.register(LambdaGauge('slow', lambda: read('slow', slow_value[0])()))
+  sampler = MetricSampler(metrics, clock=clock, slow_cadence=1000000)
+  try:
+    assert sampler.sample() == {'fast': 1, 'slow': 2}
+    assert sampler.slow_gauges() == ['slow']
+    assert sampler.costs() == {'fast': 0, 'slow': 1.0}
+    assert sampler.metrics.sample()['overruns'] == 1
+    assert sampler.metrics.sample()['slow_gauges'] == 1
+
+    # Slow gauges are not read inline: samples carry their last value.
+    slow_value[0] = 3
+    before = clock.now
+    sampler.iterate()
+    assert clock.now == before
+    assert sampler.sample() == {'fast': 1, 'slow': 2}
+
+    # They are refreshed off the sampling thread, and return once they fit the budget.
+    sampler.refresh_slow_gauges()
+    sampler.iterate()
+    assert sampler.sample() == {'fast': 1, 'slow': 3}
+    assert sampler.slow_gauges() == ['slow']
+    delays['slow'] = 0
+    sampler.refresh_slow_gauges()
+    assert sampler.slow_gauges() == []
+    slow_value[0] = 4
+    sampler.iterate()
+    assert sampler.sample() == {'fast': 1, 'slow': 4}
+    assert sampler.metrics.sample()['overruns'] == 2
+  finally:
+    sampler.stop()
+    clock.done.set()
+
+
+def test_metric_sampler_hung_gauges():
+  release = threading.Event()
+  hung_value = [1]
+  def hang():
+    release.wait()
+    return hung_value[0]
+
+  metrics = Metrics()
+  metrics.register(LambdaGauge('fast', lambda: 1))
+  metrics.register(LambdaGauge('hung', hang))
+  metrics.register(LambdaGauge('stuck', hang))
+  metrics.register(LambdaGauge('zeta', lambda: 2))
+  sampler = MetricSampler(metrics, gauge_timeout=Amount(50, Time.MILLISECONDS),
+                          slow_cadence=1000000)
+  try:
+    # Reads that time out are given up on, and the gauges after them are still read.
+    assert sampler.sample() == {'fast': 1, 'zeta': 2}
+    assert sampler.slow_gauges() == ['hung', 'stuck']
+    assert sampler.timeouts() == {'hung': 1, 'stuck': 1}
+    stats = sampler.metrics.sample()
+    assert stats['timeouts'] == 2
+    assert stats['gauges.hung.timeouts'] == 1
+    assert stats['gauges.hung.cost_ms'] == 50
+    assert 'gauges.fast.cost_ms' in stats
+    assert 'gauges.fast.timeouts' not in stats
+
+    # Gauges whose reads have yet to return are not read again.
+    sampler.iterate()
+    sampler.refresh_slow_gauges()
+    assert sampler.timeouts() == {'hung': 1, 'stuck': 1}
+
+    # Once they return, their values are sampled and they are refreshed off the sampling thread.
+    release.set()
+    deadline = time.time() + 10
+    while len(sampler.sample()) < 4 and time.time() < deadline:
+      time.sleep(0.01)
+      sampler.iterate()
+    assert sampler.sample() == {'fast': 1, 'hung': 1, 'stuck': 1, 'zeta': 2}
+    hung_value[0] = 3
+    sampler.refresh_slow_gauges()
+    assert sampler.slow_gauges() == []
+    sampler.iterate()
+    assert sampler.sample() == {'fast': 1, 'hung': 3, 'stuck': 3, 'zeta': 2}
+  finally:
+    sampler.stop()
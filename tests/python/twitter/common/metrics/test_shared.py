@@ -0,0 +1,111 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import os
+import subprocess
+import sys
+
+from twitter.common.contextutil import temporary_dir
+from twitter.common.metrics import (
+    SharedAtomicGauge,
+    SharedMetricsReader,
+    SharedMetricsSegment,
+    SharedMutatorGauge)
+from twitter.common.metrics.metrics import Metrics
+
+import pytest
+
+
+def test_shared_gauges():
+  with temporary_dir() as td:
+    filename = os.path.join(td, 'metrics')
+    segment = SharedMetricsSegment(filename, capacity=4)
+    requests = segment.atomic_gauge('http.requests')
+    load = segment.mutator_gauge('sys.load', 0.5)
+    queued = SharedMutatorGauge('queued', segment, 3)
+    assert isinstance(requests, SharedAtomicGauge)
+
+    reader = SharedMetricsReader(filename)
+    assert reader.pid == os.getpid()
+    assert reader.sample() == {'http.requests': 0, 'sys.load': 0.5, 'queued': 3}
+
+    assert requests.increment() == 1
+    assert requests.add(10) == 11
+    load.write(1.25)
+    queued.write(7)
+    assert reader.sample() == {'http.requests': 11, 'sys.load': 1.25, 'queued': 7}
+    assert (requests.read(), load.read(), queued.read()) == (11, 1.25, 7)
+
+    with pytest.raises(TypeError):
+      queued.write(1.5)
+    with pytest.raises(TypeError):
+      requests.add(1.5)
+    with pytest.raises(SharedMetricsSegment.Error):
+      segment.atomic_gauge('http.requests')
+    with pytest.raises(SharedMetricsSegment.Error):
+      segment.atomic_gauge('x' * 200)
+    segment.atomic_gauge('last')
+    with pytest.raises(SharedMetricsSegment.Full):
+      segment.atomic_gauge('one.too.many')
+    reader.close()
+    segment.close()
+
+
+def test_shared_gauges_in_metrics():
+  with temporary_dir() as td:
+    segment = SharedMetricsSegment(os.path.join(td, 'metrics'))
+    metrics = Metrics()
+    metrics.scope('http').register(segment.atomic_gauge('requests', 5, scope='http'))
+    metrics.register(segment.mutator_gauge('load', 0.5))
+    assert metrics.sample() == {'http.requests': 5, 'load': 0.5}
+    assert SharedMetricsReader(segment.filename).sample() == metrics.sample()
+
+
+def test_shared_reader_out_of_process():
+  with temporary_dir() as td:
+    filename = os.path.join(td, 'metrics')
+    segment = SharedMetricsSegment(filename)
+    segment.atomic_gauge('requests', 42)
+    segment.mutator_gauge('load', 0.75)
+    script = '\n'.join([
+      'import sys',
+      'from twitter.common.metrics import SharedMetricsReader',
+      'sample = SharedMetricsReader(sys.argv[1]).sample()',
+      'sys.stdout.write("%d %r" % (sample["requests"], sample["load"]))',
+    ])
+    output = subprocess.check_output([sys.executable, '-c', script, filename],
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+    assert output.decode('utf-8') == '42 0.75'
+
+
+def test_shared_reader_follows_restart():
+  with temporary_dir() as td:
+    filename = os.path.join(td, 'metrics')
+    SharedMetricsSegment(filename).atomic_gauge('before', 1)
+    reader = SharedMetricsReader(filename)
+    assert reader.sample() == {'before': 1}
+    SharedMetricsSegment(filename).atomic_gauge('after', 2)
+    assert reader.sample() == {'after': 2}
+    reader.close()
+
+
+def test_shared_reader_invalid():
+  with temporary_dir() as td:
+    filename = os.path.join(td, 'metrics')
+    with open(filename, 'wb') as fp:
+      fp.write(b'x' * 100)
+    with pytest.raises(SharedMetricsSegment.InvalidSegment):
+      SharedMetricsReader(filename).sample()
@@ -0,0 +1,104 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+from twitter.common.metrics import WindowedStats
+from twitter.common.metrics.metrics import Metrics
+from twitter.common.quantity import Amount, Time
+
+import pytest
+
+
+class FakeClock(object):
+  def __init__(self):
+    self._time = 0
+
+  def advance(self, ticks):
+    self._time += ticks
+
+  def time(self):
+    return self._time
+
+
+ONE_MINUTE = Amount(1, Time.MINUTES)
+FIVE_MINUTES = Amount(5, Time.MINUTES)
+
+
+def test_windowed_stats_empty():
+  stats = WindowedStats('latency', clock=FakeClock())
+  sample = stats.sample()
+  assert len(sample) == 15
+  assert sample['1mins.count'] == 0
+  assert sample['1mins.avg'] == 0
+  assert sample['15mins.max'] == 0
+  assert stats.window(ONE_MINUTE) == (0, 0, None)
+
+
+def test_windowed_stats_windows():
+  clock = FakeClock()
+  stats = WindowedStats('latency', windows=(ONE_MINUTE, FIVE_MINUTES), clock=clock)
+  stats.record(10)
+  stats.record(30, count=2)
+  assert stats.window(ONE_MINUTE) == (3, 70, 30)
+
+  clock.advance(120)
+  stats.record(5)
+  assert stats.window(ONE_MINUTE) == (1, 5, 5)
+  assert stats.window(FIVE_MINUTES) == (4, 75, 30)
+
+  sample = stats.sample()
+  assert sample['5mins.avg'] == 75.0 / 4
+  assert sample['5mins.rate'] == 4.0 / 300
+  assert sample['1mins.max'] == 5
+
+  clock.advance(300)
+  assert stats.window(FIVE_MINUTES) == (0, 0, None)
+  with pytest.raises(ValueError):
+    stats.window(Amount(1, Time.HOURS))
+
+
+def test_windowed_stats_bucket_expiry():
+  clock = FakeClock()
+  stats = WindowedStats('events', windows=(ONE_MINUTE,), buckets=6, clock=clock)
+  for _ in range(12):
+    stats.record(1)
+    clock.advance(10)
+  # Each 10 second bucket holds one value.  The current bucket is empty, so only the values
+  # recorded in the previous five remain.
+  assert stats.window(ONE_MINUTE)[0] == 5
+  stats.record(1)
+  assert stats.window(ONE_MINUTE)[0] == 6
+  assert len(stats._rings[0].counts) == 6
+
+
+def test_windowed_stats_registered():
+  metrics = Metrics()
+  stats = metrics.register(WindowedStats('latency', windows=(ONE_MINUTE,), clock=FakeClock()))
+  stats.record(4)
+  stats.record(8)
+  assert metrics.sample() == {
+    'latency.1mins.count': 2,
+    'latency.1mins.sum': 12,
+    'latency.1mins.avg': 6.0,
+    'latency.1mins.max': 8,
+    'latency.1mins.rate': 2.0 / 60,
+  }
+
+
+def test_windowed_stats_arguments():
+  with pytest.raises(ValueError):
+    WindowedStats('empty', windows=())
+  with pytest.raises(ValueError):
+    WindowedStats('nobuckets', buckets=0)
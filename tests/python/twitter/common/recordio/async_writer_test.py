@@ -0,0 +1,167 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import threading
+
+from twitter.common.recordio import AsyncRecordWriter, RecordIO, StringCodec
+from twitter.common.recordio.filelike import StringIOFileLike
+
+from cStringIO import StringIO
+
+import pytest
+
+
+class GatedWriter(RecordIO.Writer):
+  """A RecordIO.Writer whose write_many waits for a gate to open."""
+
+  def __init__(self, fail=False, crash=False):
+    self.buffer = StringIO()
+    self.gate = threading.Event()
+    self.entered = threading.Event()
+    self.closed = False
+    self._fail = fail
+    self._crash = crash
+    RecordIO.Writer.__init__(self, StringIOFileLike(self.buffer), StringCodec())
+
+  def write_many(self, records):
+    self.entered.set()
+    self.gate.wait()
+    if self._crash:
+      raise ValueError('writer crashed')
+    if self._fail:
+      return False
+    return RecordIO.Writer.write_many(self, records)
+
+  def close(self):
+    self.closed = True
+
+  def records(self):
+    reader = RecordIO.Reader(StringIOFileLike(StringIO(self.buffer.getvalue())), StringCodec())
+    return list(iter(reader.read, None))
+
+
+def stalled(max_queue, policy):
+  """Return an AsyncRecordWriter whose writer thread is stalled writing record '0'."""
+  writer = GatedWriter()
+  async_writer = AsyncRecordWriter(writer, max_queue=max_queue, policy=policy)
+  async_writer.write('0')
+  writer.entered.wait(10)
+  return writer, async_writer
+
+
+def test_async_writer_writes_in_order():
+  writer = GatedWriter()
+  writer.gate.set()
+  async_writer = AsyncRecordWriter(writer, max_batch=3)
+  records = [str(k) for k in range(10)]
+  for record in records:
+    assert async_writer.write(record)
+  assert async_writer.flush(timeout=10)
+  assert async_writer.pending == 0
+  assert async_writer.close(timeout=10)
+  assert writer.closed
+  assert writer.records() == records
+  sample = async_writer.metrics.sample()
+  assert sample['written'] == 10
+  assert sample['dropped'] == 0
+  assert sample['queue_depth'] == 0
+  with pytest.raises(AsyncRecordWriter.Closed):
+    async_writer.write('late')
+
+
+def test_async_writer_fail_policy():
+  writer, async_writer = stalled(2, AsyncRecordWriter.FAIL)
+  async_writer.write('1')
+  async_writer.write('2')
+  assert async_writer.metrics.sample()['queue_depth'] == 2
+  with pytest.raises(AsyncRecordWriter.QueueFull):
+    async_writer.write('3')
+  writer.gate.set()
+  assert async_writer.close(timeout=10)
+  assert writer.records() == ['0', '1', '2']
+
+
+def test_async_writer_drop_oldest_policy():
+  writer, async_writer = stalled(2, AsyncRecordWriter.DROP_OLDEST)
+  for record in ['1', '2', '3', '4']:
+    assert async_writer.write(record)
+  writer.gate.set()
+  assert async_writer.close(timeout=10)
+  assert writer.records() == ['0', '3', '4']
+  assert async_writer.metrics.sample()['dropped'] == 2
+
+
+def test_async_writer_block_policy():
+  writer, async_writer = stalled(1, AsyncRecordWriter.BLOCK)
+  async_writer.write('1')
+  with pytest.raises(AsyncRecordWriter.QueueFull):
+    async_writer.write('2', timeout=0.01)
+  blocked = threading.Thread(target=async_writer.write, args=('2',))
+  blocked.start()
+  blocked.join(0.05)
+  assert blocked.is_alive()
+  writer.gate.set()
+  blocked.join(10)
+  assert not blocked.is_alive()
+  assert async_writer.close(timeout=10)
+  assert writer.records() == ['0', '1', '2']
+
+
+def test_async_writer_block_policy_writer_thread_dies():
+  writer = GatedWriter(crash=True)
+  async_writer = AsyncRecordWriter(writer, max_queue=1, policy=AsyncRecordWriter.BLOCK)
+  async_writer.write('0')
+  writer.entered.wait(10)
+  async_writer.write('1')
+  errors = []
+  def write():
+    try:
+      async_writer.write('2')
+    except AsyncRecordWriter.Closed as e:
+      errors.append(e)
+  blocked = threading.Thread(target=write)
+  blocked.start()
+  blocked.join(0.05)
+  assert blocked.is_alive()
+  writer.gate.set()
+  blocked.join(10)
+  assert not blocked.is_alive()
+  assert len(errors) == 1
+  assert not async_writer.flush(timeout=10)
+  with pytest.raises(AsyncRecordWriter.Closed):
+    async_writer.write('3')
+  assert not async_writer.close(timeout=10)
+  assert writer.closed
+
+
+def test_async_writer_counts_failures():
+  writer = GatedWriter(fail=True)
+  writer.gate.set()
+  async_writer = AsyncRecordWriter(writer)
+  async_writer.write('a')
+  assert async_writer.close(timeout=10)
+  sample = async_writer.metrics.sample()
+  assert sample['failed'] == 1
+  assert sample['written'] == 0
+
+
+def test_async_writer_arguments():
+  with pytest.raises(RecordIO.InvalidArgument):
+    AsyncRecordWriter(None)
+  with pytest.raises(RecordIO.InvalidArgument):
+    AsyncRecordWriter(GatedWriter(), policy='sometimes')
+  with pytest.raises(RecordIO.InvalidArgument):
+    AsyncRecordWriter(GatedWriter(), max_queue=0)
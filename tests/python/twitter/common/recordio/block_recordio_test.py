@@ -0,0 +1,142 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import os
+
+from twitter.common.contextutil import temporary_dir
+from twitter.common.recordio import (
+    BlockFraming,
+    BlockRecordWriter,
+    RecordIO,
+    RecordReader,
+    RecordWriter,
+    StringCodec)
+from twitter.common.recordio.filelike import FileLike
+
+import pytest
+
+
+RECORDS = ['record %d' % (k % 7) for k in range(100)]
+
+
+def write_blocks(filename, records, mode='w', **kw):
+  with open(filename, mode) as fp:
+    writer = BlockRecordWriter(fp, StringCodec(), **kw)
+    writer.write_many(records)
+    writer.close()
+
+
+@pytest.mark.parametrize('compression', sorted(BlockFraming.COMPRESSION))
+def test_block_roundtrip(compression):
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_blocks(fn, RECORDS, compression=compression, max_records=30)
+    with open(fn) as fp:
+      assert list(RecordReader(fp)) == RECORDS
+    with open(fn) as fp:
+      reader = RecordReader(fp)
+      assert list(iter(reader.read, None)) == RECORDS
+
+
+def test_block_compresses():
+  with temporary_dir() as td:
+    plain, block = os.path.join(td, 'plain'), os.path.join(td, 'block')
+    with open(plain, 'w') as fp:
+      RecordWriter(fp).write_many(RECORDS)
+    write_blocks(block, RECORDS)
+    assert os.path.getsize(block) < os.path.getsize(plain) / 4
+
+
+def test_block_append_and_skip():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_blocks(fn, RECORDS[:50], max_records=10)
+    write_blocks(fn, RECORDS[50:], mode='a', max_records=10)
+    with open(fn) as fp:
+      reader = RecordReader(fp)
+      assert reader.skip(25) == 25
+      assert reader.read() == RECORDS[25]
+      assert reader.skip(10) == 10
+      assert reader.read() == RECORDS[36]
+      assert reader.skip(1000) == 63
+      assert reader.read() is None
+
+
+def test_block_tailing():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_blocks(fn, RECORDS[:2])
+    with open(fn, 'a') as fp:
+      fp.write(BlockFraming.encode_block([RecordIO.Writer.encode_frame('x', StringCodec())])[:-1])
+
+    with open(fn) as fp:
+      reader = RecordReader(fp)
+      assert reader.try_read() == RECORDS[0]
+      pos = reader._fp.tell()
+      assert reader.try_read() == RECORDS[1]
+      assert reader.try_read() is None
+      reader._fp.seek(pos)
+      assert reader.try_read() == RECORDS[1]
+
+
+def test_plain_writer_refuses_block_stream():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_blocks(fn, RECORDS[:1])
+    with open(fn, 'r+') as fp:
+      assert RecordWriter(fp).write('hello') is False
+
+
+def test_block_corruption():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    with open(fn, 'w') as fp:
+      fp.write(BlockFraming.file_header())
+      fp.write(BlockFraming.BLOCK_HEADER.pack(BlockFraming.ZLIB, 1, 10, 5) + 'abcde')
+    with open(fn) as fp:
+      with pytest.raises(BlockFraming.CorruptBlock):
+        RecordReader(fp).read()
+
+
+def test_block_writer_arguments():
+  with temporary_dir() as td:
+    with open(os.path.join(td, 'log'), 'w') as fp:
+      with pytest.raises(RecordIO.InvalidArgument):
+        BlockRecordWriter(fp, StringCodec(), compression='lz4')
+
+
+def test_block_write_many_splits_oversized_commits():
+  records = ['x' * 2 ** 20] * 70
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_blocks(fn, records)
+    with open(fn) as fp:
+      reader = RecordReader(fp)
+      assert reader.read_many(len(records) + 1) == records
+
+
+def test_block_incompressible_stored_uncompressed(monkeypatch):
+  monkeypatch.setattr(BlockFraming, 'MAXIMUM_BLOCK_SIZE', 1010)
+  records = [os.urandom(1000)]
+  block = BlockFraming.encode_block(
+      [RecordIO.Writer.encode_frame(record, StringCodec()) for record in records])
+  assert ord(block[0]) == BlockFraming.NONE
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    with open(fn, 'w') as fp:
+      fp.write(BlockFraming.file_header() + block)
+    with open(fn) as fp:
+      assert list(RecordReader(fp)) == records
@@ -0,0 +1,135 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import os
+import struct
+
+from twitter.common.contextutil import temporary_dir
+from twitter.common.recordio import (
+    CheckedRecordIO,
+    CheckedRecordReader,
+    CheckedRecordWriter,
+    RecordIO,
+    StringCodec)
+
+import pytest
+
+
+def frame(record):
+  return CheckedRecordIO.encode_frame(record, StringCodec())
+
+
+def reader_for(filename, contents):
+  with open(filename, 'w') as fp:
+    fp.write(contents)
+  return CheckedRecordReader(open(filename, 'r'), StringCodec())
+
+
+def test_checked_roundtrip():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    with open(fn, 'w') as fp:
+      writer = CheckedRecordWriter(fp, StringCodec())
+      assert writer.write('hello')
+      assert writer.write_many(['', 'world'])
+    with open(fn) as fp:
+      assert list(CheckedRecordReader(fp, StringCodec())) == ['hello', '', 'world']
+    with open(fn) as fp:
+      reader = CheckedRecordReader(fp, StringCodec())
+      assert reader.read() == 'hello'
+      assert reader.read() == ''
+      assert reader.read() == 'world'
+      assert reader.read() is None
+      assert reader.corrupt_frames == 0
+
+
+def test_checked_batched_writer():
+  class CheckedBatchedWriter(RecordIO.BatchedWriter):
+    encode_frame = staticmethod(CheckedRecordIO.encode_frame)
+
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    with open(fn, 'w') as fp:
+      writer = CheckedBatchedWriter(fp, StringCodec())
+      writer.write_many(['a', 'b'])
+      writer.close()
+    with open(fn) as fp:
+      assert list(CheckedRecordReader(fp, StringCodec())) == ['a', 'b']
+
+
+def test_checked_skips_corrupt_payload():
+  with temporary_dir() as td:
+    bad = frame('hello')
+    bad = bad[:-1] + 'X'
+    reader = reader_for(os.path.join(td, 'log'), frame('a') + bad + frame('b'))
+    assert reader.read() == 'a'
+    assert reader.read() == 'b'
+    assert reader.read() is None
+    assert reader.corrupt_frames == 1
+    assert reader.skipped_bytes == len(bad)
+
+
+def test_checked_skips_bogus_length_without_allocating():
+  with temporary_dir() as td:
+    bad = frame('hello')
+    bad = bad[:4] + struct.pack('>L', RecordIO.MAXIMUM_RECORD_SIZE - 1) + bad[8:]
+    reader = reader_for(os.path.join(td, 'log'), bad + frame('b'))
+    assert reader.read() == 'b'
+    assert reader.corrupt_frames == 1
+
+
+def test_checked_skips_garbage_and_torn_writes():
+  with temporary_dir() as td:
+    torn = frame('x' * 100)[:50]
+    contents = 'garbage' + frame('a') + torn + frame('b') + 'trailing garbage'
+    reader = reader_for(os.path.join(td, 'log'), contents)
+    assert list(iter(reader.try_read, None)) == ['a', 'b']
+    assert reader.corrupt_frames == 3
+    assert reader.skipped_bytes == len('garbage') + len(torn) + len('trailing garbage')
+
+
+def test_checked_try_read_partial_tail():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    partial = frame('world')
+    reader = reader_for(fn, frame('hello') + partial[:3])
+    assert reader.try_read() == 'hello'
+    assert reader.try_read() is None
+    assert reader.try_read() is None
+    with open(fn, 'a') as fp:
+      fp.write(partial[3:10])
+    assert reader.try_read() is None
+    with open(fn, 'a') as fp:
+      fp.write(partial[10:])
+    assert reader.try_read() == 'world'
+    assert reader.corrupt_frames == 0
+
+
+def test_checked_skip_read_many_and_read_frame():
+  with temporary_dir() as td:
+    bad = frame('hello')
+    bad = bad[:-1] + 'X'
+    records = [str(k) for k in range(6)]
+    contents = frame(records[0]) + bad + ''.join(frame(record) for record in records[1:])
+    reader = reader_for(os.path.join(td, 'log'), contents)
+    assert reader.skip(2) == 2
+    assert reader.corrupt_frames == 1
+    assert reader.read_many(2) == records[2:4]
+    assert reader.read_frame().tobytes() == records[4]
+    assert reader.read() == records[5]
+    assert reader.skip(1) == 0
+    assert reader.read_many(1) == []
+    assert reader.read_frame() is None
@@ -0,0 +1,184 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import os
+import struct
+
+from twitter.common.contextutil import temporary_dir
+from twitter.common.recordio import (
+    CheckpointedRecordReader,
+    RecordCursor,
+    RecordIO,
+    RecordWriter,
+    StringCodec)
+
+import pytest
+
+
+def write_records(filename, records, mode='a'):
+  with open(filename, mode) as fp:
+    RecordWriter(fp).write_many(records)
+
+
+def open_reader(filename, interval=2):
+  return CheckpointedRecordReader(open(filename, 'r'), StringCodec(),
+      RecordCursor(RecordCursor.sidecar(filename)), checkpoint_interval=interval)
+
+
+def test_cursor_checkpoints():
+  with temporary_dir() as td:
+    cursor = RecordCursor(os.path.join(td, 'cursor'))
+    assert cursor.last() is None
+    assert cursor.find(10) is None
+    for k in range(5):
+      cursor.checkpoint(k * 100, k * 10)
+    assert len(cursor) == 5
+    assert cursor.last() == (400, 40)
+    assert cursor.find(0) == (0, 0)
+    assert cursor.find(25) == (200, 20)
+    assert cursor.find(1000) == (400, 40)
+    cursor.close()
+
+
+def test_cursor_ignores_torn_entries():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'cursor')
+    cursor = RecordCursor(fn)
+    cursor.checkpoint(10, 1)
+    cursor.checkpoint(20, 2)
+    cursor.close()
+
+    # corrupt the last entry, then tear a partial one onto the end
+    with open(fn, 'r+b') as fp:
+      fp.seek(RecordCursor.ENTRY.size)
+      fp.write(struct.pack('<Q', 999))
+      fp.seek(0, os.SEEK_END)
+      fp.write('torn')
+
+    cursor = RecordCursor(fn)
+    assert cursor.last() == (10, 1)
+    cursor.checkpoint(30, 3)
+    assert len(cursor) == 3
+    assert cursor.last() == (30, 3)
+
+
+def test_checkpointed_reader_resumes():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, ['a', 'b', 'c'], mode='w')
+
+    reader = open_reader(fn)
+    assert reader.resume() == 0
+    assert [reader.try_read() for _ in range(4)] == ['a', 'b', 'c', None]
+    assert reader.record_number == 3
+    assert RecordCursor(RecordCursor.sidecar(fn)).last()[1] == 2
+    reader.close()
+
+    write_records(fn, ['d', 'e'])
+    reader = open_reader(fn)
+    assert reader.resume() == 3
+    assert reader.try_read() == 'd'
+    assert reader.try_read() == 'e'
+    assert reader.record_number == 5
+    reader.close()
+
+
+
+def test_checkpointed_reader_counts_skip():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, [str(k) for k in range(10)])
+    reader = open_reader(fn, interval=100)
+    assert reader.skip(3) == 3
+    assert reader.read() == '3'
+    assert reader.record_number == 4
+    reader.close()
+
+    reader = open_reader(fn)
+    assert reader.resume() == 4
+    assert reader.read() == '4'
+    reader.close()
+
+
+def test_checkpointed_reader_counts_read_many():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, [str(k) for k in range(10)])
+    reader = open_reader(fn, interval=100)
+    assert reader.read_many(3) == ['0', '1', '2']
+    assert reader.record_number == 3
+    reader.close()
+
+    reader = open_reader(fn)
+    assert reader.resume() == 3
+    assert reader.read() == '3'
+    reader.close()
+
+
+def test_checkpointed_reader_counts_read_frame():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, [str(k) for k in range(10)])
+    reader = open_reader(fn, interval=100)
+    assert reader.read_frame().tobytes() == '0'
+    assert reader.read() == '1'
+    assert reader.record_number == 2
+    reader.close()
+
+    reader = open_reader(fn)
+    assert reader.resume() == 2
+    assert reader.read() == '2'
+    reader.close()
+
+def test_checkpointed_reader_partial_record():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, ['a'], mode='w')
+    with open(fn, 'a') as fp:
+      fp.write(struct.pack('>L', 5) + 'bc')
+
+    reader = open_reader(fn, interval=1)
+    reader.resume()
+    assert reader.try_read() == 'a'
+    assert reader.try_read() is None
+    assert reader.record_number == 1
+    assert RecordCursor(RecordCursor.sidecar(fn)).last() == (5, 1)
+
+
+def test_checkpointed_reader_truncated_file():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, ['hello', 'world'], mode='w')
+    reader = open_reader(fn, interval=1)
+    reader.resume()
+    assert list(iter(reader.try_read, None)) == ['hello', 'world']
+    reader.close()
+
+    write_records(fn, ['x'], mode='w')
+    reader = open_reader(fn)
+    assert reader.resume() == 0
+    assert reader.try_read() == 'x'
+
+
+def test_checkpointed_reader_arguments():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, [], mode='w')
+    with pytest.raises(RecordIO.InvalidArgument):
+      CheckpointedRecordReader(open(fn), StringCodec(), None)
+    with pytest.raises(RecordIO.InvalidArgument):
+      CheckpointedRecordReader(open(fn), StringCodec(), RecordCursor(fn + '.cursor'),
+          checkpoint_interval=0)
@@ -0,0 +1,182 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import io
+import mmap
+import os
+import socket
+import struct
+
+from twitter.common.contextutil import temporary_dir
+from twitter.common.recordio import BlockRecordWriter, RecordIO, StringCodec
+from twitter.common.recordio.filelike import (
+    BytesIOFileLike,
+    FileLike,
+    MmapFileLike,
+    StreamFileLike)
+
+import pytest
+
+
+RECORDS = ['hello', 'a', 'world' * 100]
+
+
+def frames(records=RECORDS):
+  return b''.join(RecordIO.Writer.encode_frame(record, StringCodec()) for record in records)
+
+
+def test_bytesio():
+  fp = FileLike.get(io.BytesIO(frames()))
+  assert isinstance(fp, BytesIOFileLike)
+  reader = RecordIO.Reader(fp, StringCodec())
+  assert list(reader) == RECORDS
+  assert [reader.read() for _ in RECORDS] == RECORDS
+  assert reader.read() is None
+
+
+def test_bytesio_writer():
+  buf = io.BytesIO()
+  writer = RecordIO.Writer(buf, StringCodec())
+  for record in RECORDS:
+    assert writer.write(record)
+  assert buf.getvalue() == frames()
+
+
+def test_buffered_reader():
+  with temporary_dir() as td:
+    filename = os.path.join(td, 'records')
+    with open(filename, 'wb') as fp:
+      fp.write(frames())
+    with io.open(filename, 'rb') as fp:
+      filelike = FileLike.get(fp)
+      assert isinstance(filelike, StreamFileLike)
+      assert filelike.name == filename
+      reader = RecordIO.Reader(filelike, StringCodec())
+      assert list(reader) == RECORDS
+      assert reader.read_many(len(RECORDS) + 1) == RECORDS
+
+
+def test_mmap():
+  data = frames()
+  fp = mmap.mmap(-1, len(data))
+  fp.write(data)
+  filelike = FileLike.get(fp)
+  assert isinstance(filelike, MmapFileLike)
+  reader = RecordIO.Reader(filelike, StringCodec())
+  assert list(reader) == RECORDS
+  assert reader.skip(1) == 1
+  assert reader.read() == RECORDS[1]
+  assert reader.read() == RECORDS[2]
+  assert reader.read() is None
+  # Closing a dup must not unmap the shared mmap.
+  filelike.dup().close()
+  assert fp[:len(data)] == data
+  filelike.close()
+
+
+def test_mmap_read_only():
+  with temporary_dir() as td:
+    filename = os.path.join(td, 'records')
+    with open(filename, 'wb') as fp:
+      fp.write(frames())
+    with open(filename, 'rb') as fp:
+      filelike = FileLike.get(mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ))
+      assert filelike.mode == 'r'
+      with pytest.raises(IOError):
+        filelike.write(b'x')
+      assert not RecordIO.Writer.do_write(filelike, 'x', StringCodec())
+      assert list(RecordIO.Reader(filelike, StringCodec())) == RECORDS
+      filelike.close()
+
+
+def test_mmap_torn_frame():
+  data = frames()
+  fp = mmap.mmap(-1, len(data) - 1)
+  fp.write(data[:-1])
+  reader = RecordIO.Reader(fp, StringCodec())
+  assert reader.read() == RECORDS[0]
+  assert reader.read() == RECORDS[1]
+  assert reader.try_read() is None
+  with pytest.raises(RecordIO.PrematureEndOfStream):
+    reader.read()
+
+
+def test_socket():
+  server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  server.bind(('127.0.0.1', 0))
+  server.listen(1)
+  left = socket.create_connection(server.getsockname())
+  right, _ = server.accept()
+  server.close()
+  try:
+    writer = RecordIO.Writer(left, StringCodec())
+    for record in RECORDS:
+      assert writer.write(record)
+    reader = RecordIO.Reader(right, StringCodec())
+    assert [reader.read() for _ in RECORDS] == RECORDS
+    left.shutdown(socket.SHUT_WR)
+    assert reader.read() is None
+    with pytest.raises(FileLike.Error):
+      reader._fp.dup()
+  finally:
+    left.close()
+    right.close()
+
+
+def test_readinto_short_reads():
+  class Trickle(io.RawIOBase):
+    def __init__(self, data):
+      self._data = data
+    def readable(self):
+      return True
+    def readinto(self, buf):
+      count = min(1, len(buf), len(self._data))
+      buf[:count] = self._data[:count]
+      self._data = self._data[count:]
+      return count
+
+  filelike = FileLike.get(Trickle(frames()))
+  buf = bytearray(RecordIO.RECORD_HEADER_SIZE)
+  assert filelike.readinto(buf) == RecordIO.RECORD_HEADER_SIZE
+  assert struct.unpack('>L', bytes(buf))[0] == len(RECORDS[0])
+
+
+def test_read_frame_reuses_buffer():
+  reader = RecordIO.Reader(io.BytesIO(frames()), StringCodec())
+  first = reader.read_frame()
+  assert first.tobytes() == RECORDS[0]
+  buffer_id = id(reader._frame_buffer)
+  assert reader.read_frame().tobytes() == RECORDS[1]
+  assert id(reader._frame_buffer) == buffer_id
+  assert reader.read_frame().tobytes() == RECORDS[2]
+  assert reader.read_frame() is None
+
+
+def test_block_readinto():
+  buf = io.BytesIO()
+  writer = BlockRecordWriter(buf, StringCodec(), max_records=2)
+  for record in RECORDS:
+    writer.write(record)
+  writer.commit()
+  buf.seek(0)
+  reader = RecordIO.Reader(buf, StringCodec())
+  assert [reader.read_frame().tobytes() for _ in RECORDS] == RECORDS
+  assert reader.read_frame() is None
+
+
+def test_unknown():
+  with pytest.raises(ValueError):
+    FileLike.get(object())
@@ -0,0 +1,162 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import os
+import struct
+
+from twitter.common.contextutil import temporary_dir
+from twitter.common.recordio import (
+    MmapRecordReader,
+    RecordIndex,
+    RecordIO,
+    RecordReader,
+    RecordWriter,
+    StringCodec)
+
+import pytest
+
+
+def write_records(filename, records, mode='w'):
+  with open(filename, mode) as fp:
+    RecordWriter(fp).write_many(records)
+
+
+def test_mmap_reader_basic():
+  records = ['hello', '', 'world', 'x' * 1000]
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, records)
+    with MmapRecordReader(fn) as reader:
+      assert len(reader) == 4
+      assert [bytes(view) for view in reader] == records
+      assert bytes(reader[2]) == 'world'
+      assert bytes(reader[-1]) == 'x' * 1000
+      assert [bytes(view) for view in reader.iter_from(2)] == records[2:]
+      with pytest.raises(IndexError):
+        reader[4]
+
+      # offsets can be handed off to a RecordIO.Reader
+      with open(fn) as fp:
+        fp.seek(reader.offset(2))
+        assert RecordReader(fp).read() == 'world'
+
+
+def test_mmap_reader_codec():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, ['hello', 'world'])
+    with MmapRecordReader(fn, codec=StringCodec()) as reader:
+      assert list(reader) == ['hello', 'world']
+      assert reader[1] == 'world'
+    with pytest.raises(RecordIO.InvalidCodec):
+      MmapRecordReader(fn, codec='not a codec')
+
+
+def test_mmap_reader_empty_and_truncated():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    with open(fn, 'w'):
+      pass
+    with MmapRecordReader(fn) as reader:
+      assert len(reader) == 0
+      assert list(reader) == []
+
+    write_records(fn, ['hello'])
+    with open(fn, 'a') as fp:
+      fp.write(struct.pack('>L', 10) + 'abc')
+    with MmapRecordReader(fn, sidecar=False) as reader:
+      assert len(reader) == 1
+      assert reader.index.size == RecordIO.RECORD_HEADER_SIZE + len('hello')
+
+
+def test_mmap_reader_sidecar():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, ['a', 'b'])
+    with MmapRecordReader(fn) as reader:
+      assert len(reader) == 2
+    assert os.path.exists(RecordIndex.sidecar(fn))
+
+    index = RecordIndex.read(RecordIndex.sidecar(fn))
+    assert len(index) == 2
+    assert [index[0], index[1]] == [0, 5]
+
+    # The sidecar is extended as the file grows.
+    write_records(fn, ['c'], mode='a')
+    with MmapRecordReader(fn) as reader:
+      assert [bytes(view) for view in reader] == ['a', 'b', 'c']
+      write_records(fn, ['d'], mode='a')
+      assert reader.refresh() == 1
+      assert bytes(reader[3]) == 'd'
+    assert len(RecordIndex.read(RecordIndex.sidecar(fn))) == 4
+
+    # A stale sidecar is discarded.
+    write_records(fn, ['z'])
+    with MmapRecordReader(fn) as reader:
+      assert [bytes(view) for view in reader] == ['z']
+
+
+def test_mmap_reader_refresh_after_truncation():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, ['hello', 'world', 'again'])
+    with MmapRecordReader(fn) as reader:
+      assert len(reader) == 3
+      # Cut the last record short: its header still claims the original length.
+      size = reader.index.size
+      with open(fn, 'r+') as fp:
+        fp.truncate(size - 2)
+      reader.refresh()
+      assert len(reader) == 2
+      assert reader.index.size == size - len('again') - RecordIO.RECORD_HEADER_SIZE
+      assert [bytes(frame) for frame in reader] == ['hello', 'world']
+
+      with open(fn, 'w'):
+        pass
+      reader.refresh()
+      assert len(reader) == 0
+
+
+def test_record_index_invalid():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log.idx')
+    with open(fn, 'w') as fp:
+      fp.write('garbage')
+    with pytest.raises(RecordIndex.InvalidIndex):
+      RecordIndex.read(fn)
+
+    index = RecordIndex()
+    with pytest.raises(RecordIO.RecordSizeExceeded):
+      index.update(struct.pack('>L', RecordIO.MAXIMUM_RECORD_SIZE + 1))
+
+
+def test_mmap_reader_views_outlive_refresh_and_close():
+  def frames(*records):
+    return b''.join(struct.pack('>L', len(record)) + record for record in records)
+
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    with open(fn, 'wb') as fp:
+      fp.write(frames(b'hello'))
+    with MmapRecordReader(fn, sidecar=False) as reader:
+      view = reader[0]
+      with open(fn, 'ab') as fp:
+        fp.write(frames(b'world'))
+      assert reader.refresh() == 1
+      assert bytes(view) == b'hello'
+      tail = reader[1]
+    assert bytes(view) == b'hello'
+    assert bytes(tail) == b'world'
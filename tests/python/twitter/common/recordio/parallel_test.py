@@ -0,0 +1,87 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import os
+
+from twitter.common.contextutil import temporary_dir
+from twitter.common.recordio import (
+    BlockRecordWriter,
+    ParallelRecordScanner,
+    RecordIO,
+    RecordWriter,
+    StringCodec)
+
+import pytest
+
+
+RECORDS = ['record %04d' % k for k in range(1000)]
+
+
+def even_suffix(record):
+  number = int(record.split()[1])
+  return number * 2 if number % 2 == 0 else None
+
+
+def write_records(filename, records):
+  with open(filename, 'w') as fp:
+    RecordWriter(fp).write_many(records)
+
+
+def test_chunks():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, RECORDS)
+    frame_size = RecordIO.RECORD_HEADER_SIZE + len(RECORDS[0])
+    chunks = ParallelRecordScanner(fn, StringCodec(), chunk_bytes=100 * frame_size).chunks()
+    assert len(chunks) == 10
+    assert all(chunk.records == 100 for chunk in chunks)
+    assert [chunk.offset for chunk in chunks] == [k * 100 * frame_size for k in range(10)]
+    assert sum(chunk.length for chunk in chunks) == os.path.getsize(fn)
+
+
+def test_scan_ordered():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, RECORDS)
+    scanner = ParallelRecordScanner(fn, StringCodec(), processes=2, chunk_bytes=1024)
+    assert list(scanner.scan()) == RECORDS
+    assert list(scanner.scan(even_suffix)) == list(range(0, 2000, 4))
+
+
+def test_scan_unordered():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, RECORDS)
+    scanner = ParallelRecordScanner(fn, StringCodec(), processes=2, chunk_bytes=1024)
+    assert sorted(scanner.scan(ordered=False)) == RECORDS
+
+
+def test_scan_empty():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    write_records(fn, [])
+    assert list(ParallelRecordScanner(fn, StringCodec()).scan()) == []
+
+
+def test_scan_rejects_block_compressed():
+  with temporary_dir() as td:
+    fn = os.path.join(td, 'log')
+    with open(fn, 'w') as fp:
+      writer = BlockRecordWriter(fp, StringCodec())
+      writer.write_many(RECORDS)
+      writer.close()
+    with pytest.raises(RecordIO.InvalidArgument):
+      ParallelRecordScanner(fn, StringCodec()).chunks()
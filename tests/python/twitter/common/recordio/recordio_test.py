@@ -27,6 +27,7 @@ import tempfile
 
 from twitter.common.recordio import RecordIO, RecordWriter, RecordReader, StringCodec
 from twitter.common.recordio.filelike import FileLike, StringIOFileLike
+from twitter.common.quantity import Amount, Time
 
 import pytest
 
@@ -227,6 +228,77 @@ class RecordioTestBase(mox.MoxTestBase):
       rr = RecordReader(fp)
       assert rr.read() == test_string
 
+  def test_recordwriter_write_many(self):
+    test_strings = ["hello", "world", "etc"]
+    with self.EphemeralFile('r+') as fp:
+      rw = RecordWriter(fp)
+      assert rw.write_many(test_strings)
+      assert rw.write_many([])
+      fp.seek(0)
+      rr = RecordReader(fp)
+      assert list(rr) == test_strings
+
+  def test_batched_writer_commits_by_count(self):
+    commits = []
+    with self.EphemeralFile('r+') as fp:
+      bw = RecordIO.BatchedWriter(fp, StringCodec(), max_records=2, on_commit=commits.append)
+      assert bw.write('a')
+      assert bw.pending == 1
+      assert commits == []
+      assert bw.write('b')
+      assert bw.pending == 0
+      assert commits == [2]
+      assert bw.write_many(['c', 'd', 'e'])
+      assert commits == [2, 3]
+      assert bw.write('f')
+      assert bw.commit()
+      assert bw.commit()
+      assert commits == [2, 3, 1]
+      fp.seek(0)
+      assert list(RecordReader(fp)) == ['a', 'b', 'c', 'd', 'e', 'f']
+
+  def test_batched_writer_commits_by_delay(self):
+    class FakeClock(object):
+      def __init__(self):
+        self.now = 0
+      def time(self):
+        return self.now
+
+    clock = FakeClock()
+    commits = []
+    with self.EphemeralFile('r+') as fp:
+      bw = RecordIO.BatchedWriter(fp, StringCodec(), max_delay=Amount(10, Time.MILLISECONDS),
+          on_commit=commits.append, clock=clock)
+      bw.write('a')
+      clock.now += 0.005
+      bw.write('b')
+      assert commits == []
+      clock.now += 0.005
+      bw.write('c')
+      assert commits == [3]
+
+  def test_batched_writer_commits_on_close(self):
+    with self.DurableFile('w') as fp:
+      fn = fp.name
+      bw = RecordIO.BatchedWriter(fp, StringCodec())
+      bw.write_many(['hello', 'world'])
+      bw.close()
+    with open(fn) as fpr:
+      assert list(RecordReader(fpr)) == ['hello', 'world']
+    os.remove(fn)
+
+  def test_batched_writer_commit_fail(self):
+    fp = self.mox.CreateMock(file)
+    fp.mode = 'w'
+    fp.write(mox.IsA(str)).AndRaise(IOError)
+
+    self.mox.ReplayAll()
+
+    bw = RecordIO.BatchedWriter(FileLike(fp), StringCodec(), max_records=2)
+    assert bw.write('hello')
+    assert bw.write('world') == False
+    assert bw.pending == 0
+
 
 class TestRecordioBuiltin(RecordioTestBase):
   def test_recordwriter_framing(self):
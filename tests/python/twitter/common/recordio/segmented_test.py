@@ -0,0 +1,120 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import os
+
+from twitter.common.contextutil import temporary_dir
+from twitter.common.quantity import Amount, Data, Time
+from twitter.common.recordio import RecordIO, SegmentedRecordLog, StringCodec
+
+import pytest
+
+
+class FakeClock(object):
+  def __init__(self):
+    self.now = 0
+  def time(self):
+    return self.now
+
+
+RECORDS = ['record %02d' % k for k in range(20)]
+
+
+def open_log(directory, **kw):
+  kw.setdefault('max_segment_size', Amount(50, Data.BYTES))
+  return SegmentedRecordLog(directory, StringCodec(), **kw)
+
+
+def test_segmented_rolls_by_size():
+  with temporary_dir() as td:
+    with open_log(td) as rlog:
+      for record in RECORDS:
+        assert rlog.write(record)
+      segments = rlog.segments()
+      assert len(segments) == 5
+      assert [segment.first_record for segment in segments] == [0, 4, 8, 12, 16]
+      assert all(segment.size <= 60 for segment in segments)
+      assert list(rlog) == RECORDS
+      assert list(rlog.iter_from(7)) == RECORDS[7:]
+      assert list(rlog.iter_from(20)) == []
+
+
+def test_segmented_rolls_by_age():
+  clock = FakeClock()
+  with temporary_dir() as td:
+    with open_log(td, max_segment_size=Amount(1, Data.MB),
+                  max_segment_age=Amount(10, Time.SECONDS), clock=clock) as rlog:
+      rlog.write_many(RECORDS[:3])
+      clock.now = 9
+      rlog.write(RECORDS[3])
+      clock.now = 10
+      rlog.write(RECORDS[4])
+      assert [segment.first_record for segment in rlog.segments()] == [0, 4]
+      assert list(rlog) == RECORDS[:5]
+
+
+def test_segmented_reopen_truncates_torn_write():
+  with temporary_dir() as td:
+    with open_log(td) as rlog:
+      rlog.write_many(RECORDS[:6])
+      tail = rlog.segments()[-1]
+    with open(tail.filename, 'ab') as fp:
+      fp.write('\x00\x00\x00\x10torn')
+    with open_log(td) as rlog:
+      assert rlog.next_record == 6
+      assert rlog.segments()[-1].size == tail.size
+      rlog.write_many(RECORDS[6:])
+      assert list(rlog) == RECORDS
+
+
+def test_segmented_retention():
+  deleted = []
+  def retention(segments):
+    doomed = SegmentedRecordLog.retain_segments(2)(segments)
+    deleted.extend(segment.first_record for segment in doomed)
+    return doomed
+
+  with temporary_dir() as td:
+    with open_log(td, retention=retention) as rlog:
+      for record in RECORDS:
+        rlog.write(record)
+      assert deleted == [0, 4]
+      assert [segment.first_record for segment in rlog.segments()] == [8, 12, 16]
+      assert list(rlog) == RECORDS[8:]
+      assert list(rlog.iter_from(2)) == RECORDS[8:]
+      assert list(rlog.iter_from(13)) == RECORDS[13:]
+
+
+def test_segmented_retain_size():
+  with temporary_dir() as td:
+    with open_log(td, retention=SegmentedRecordLog.retain_size(Amount(100, Data.BYTES))) as rlog:
+      for record in RECORDS:
+        rlog.write(record)
+      sealed = rlog.segments()[:-1]
+      assert sum(segment.size for segment in sealed) <= 100
+      assert len(sealed) == 1
+
+
+def test_segmented_arguments():
+  with temporary_dir() as td:
+    with pytest.raises(RecordIO.InvalidCodec):
+      SegmentedRecordLog(td, 'not a codec')
+    with pytest.raises(RecordIO.InvalidArgument):
+      open_log(td, retention='forever')
+    rlog = open_log(td)
+    rlog.close()
+    with pytest.raises(RecordIO.InvalidFileHandle):
+      rlog.write('closed')
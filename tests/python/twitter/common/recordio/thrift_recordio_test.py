@@ -178,3 +178,37 @@ def test_thrift_invalid_codec_with_object_instead_of_class():
   with EphemeralFile('w') as fp:
     with pytest.raises(ThriftRecordIO.InvalidThriftException):
       ThriftRecordReader(fp, StringType())
+
+
+def test_thriftrecordreader_read_many():
+  test_strings = [StringType("record %d" % k) for k in range(5)]
+  with EphemeralFile('w') as fp:
+    fn = fp.name
+
+    rw = ThriftRecordWriter(fp)
+    rw.write_many(test_strings)
+    rw.close()
+
+    with open(fn) as fpr:
+      rr = ThriftRecordReader(fpr, StringType)
+      assert rr.read_many(2) == test_strings[:2]
+      assert rr.read_many(10) == test_strings[2:]
+      assert rr.read_many(10) == []
+
+
+@pytest.mark.parametrize('accelerated', (True, False))
+def test_thrift_decode_many_matches_decode(accelerated):
+  codec = ThriftRecordIO.ThriftCodec(StringType, accelerated=accelerated)
+  frames = [codec.encode(StringType("hello")), codec.encode(StringType("")) + 'trailing',
+            codec.encode(StringType("world"))]
+  assert codec.decode_many(frames) == [codec.decode(frame) for frame in frames]
+  assert codec.decode_many([]) == []
+
+  truncated = codec.encode(StringType("hello"))[:-2]
+  with pytest.raises(RecordIO.PrematureEndOfStream):
+    codec.decode_many([truncated, codec.encode(StringType("world"))])
+
+
+def test_thrift_decode_many_requires_base():
+  with pytest.raises(ThriftRecordIO.ThriftUnsuppliedException):
+    ThriftRecordIO.ThriftCodec().decode_many(['abc'])